@@ -0,0 +1,251 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+from .metrics import record_request, route_name
+
+# Per-request SQL instrumentation, independent of DEBUG (connection.queries is only populated with DEBUG = True).
+# - Every database connection gets cursors that time each query and count the rows fetched (installed on connection creation).
+# - SQLInstrumentationMiddleware collects the measures of the current request (including queries run on other threads, such as
+#   the dashboard chart workers, see films/executor.py) and returns them in a Server-Timing header, along with named timings
+#   such as the build time of each dashboard chart (see timing()).
+# - Queries slower than settings.SLOW_QUERY_THRESHOLD_MS are written as JSON lines to the 'assignment_project.slow_queries' logger.
+# - The duration, SQL time and response size of each request are also recorded in the metrics registry (see metrics.py).
+#
+# Streaming responses (e.g. the user lists) send their headers before the body is produced:
+# their Server-Timing only covers the work done before streaming started, while their metrics are recorded once the body is sent.
+
+slow_query_logger = logging.getLogger('assignment_project.slow_queries')
+
+# Measures of the request being served, None outside of a request
+_current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Database and timing measures of one request. Updated from any thread working for the request.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.queries = 0
+        self.query_time = 0.0
+        self.slowest_query_time = 0.0
+        self.rows = 0
+        # Named timings (seconds), in the order they were recorded
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def record_query(self, duration):
+        with self._lock:
+            self.queries += 1
+            self.query_time += duration
+            self.slowest_query_time = max(self.slowest_query_time, duration)
+
+    def record_rows(self, count):
+        with self._lock:
+            self.rows += count
+
+    def record_timing(self, name, duration):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def server_timing(self, total):
+        """
+        Returns the Server-Timing header value of the measures, 'total' being the request duration in seconds.
+        """
+        with self._lock:
+            entries = [
+                f'db;desc="{self.queries} queries / {self.rows} rows";dur={self.query_time * 1000:.1f}',
+                f'db-slowest;dur={self.slowest_query_time * 1000:.1f}',
+            ]
+            entries += [f'{name};dur={duration * 1000:.1f}' for name, duration in self.timings.items()]
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def current_metrics():
+    """
+    Returns the measures of the request being served, or None.
+    """
+    return _current_metrics.get()
+
+
+@contextmanager
+def timing(name):
+    """
+    Records the duration of the block as a named timing of the current request (a Server-Timing metric name: letters, digits, '-' and '_').
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.record_timing(name, time.perf_counter() - start)
+
+
+def _log_if_slow(sql, duration, alias):
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold is None or duration * 1000 < threshold:
+        return
+    metrics = current_metrics()
+    slow_query_logger.warning(json.dumps({
+        'event': 'slow_query',
+        'duration_ms': round(duration * 1000, 1),
+        'threshold_ms': threshold,
+        'database': alias,
+        'path': metrics.path if metrics is not None else None,
+        'sql': sql,
+    }))
+
+
+class InstrumentedCursorWrapper(CursorWrapper):
+    """
+    Cursor timing its queries and counting the rows fetched, for the current request's measures and the slow query log.
+    """
+
+    def _timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            duration = time.perf_counter() - start
+            metrics = current_metrics()
+            if metrics is not None:
+                metrics.record_query(duration)
+            _log_if_slow(sql, duration, self.db.alias)
+
+    def execute(self, sql, params=None):
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(super().executemany, sql, param_list)
+
+    def _fetched(self, rows):
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.record_rows(rows)
+
+    def fetchone(self):
+        row = super().__getattr__('fetchone')()
+        self._fetched(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().__getattr__('fetchmany')(*args, **kwargs)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().__getattr__('fetchall')()
+        self._fetched(len(rows))
+        return rows
+
+
+class InstrumentedCursorDebugWrapper(InstrumentedCursorWrapper, CursorDebugWrapper):
+    """
+    Instrumented cursor also logging the queries to connection.queries (DEBUG = True).
+    """
+
+
+def instrument_connection(connection):
+    """
+    Makes a database connection use the instrumented cursors. Idempotent.
+    """
+    if getattr(connection, '_sql_instrumented', False):
+        return
+    connection.make_cursor = lambda cursor: InstrumentedCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: InstrumentedCursorDebugWrapper(cursor, connection)
+    connection._sql_instrumented = True
+
+
+def _instrument_new_connection(sender, connection, **kwargs):
+    instrument_connection(connection)
+
+
+connection_created.connect(_instrument_new_connection)
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Middleware measuring the SQL work and named timings of each request, returned in a Server-Timing header,
+    and recording the request in the metrics registry. Should come first in settings.MIDDLEWARE, so that the total covers the whole request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Connections opened before this module was loaded did not go through connection_created
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(connection)
+
+        metrics = RequestMetrics(request.path)
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        response['Server-Timing'] = metrics.server_timing(time.perf_counter() - start)
+
+        def finish(size):
+            record_request(route_name(request), response.status_code, time.perf_counter() - start, metrics.query_time, size)
+
+        if not response.streaming:
+            finish(len(response.content))
+        elif response.is_async:
+            response.streaming_content = _measured_async_stream(response.streaming_content, metrics, finish)
+        else:
+            response.streaming_content = _measured_stream(response.streaming_content, metrics, finish)
+        return response
+
+
+def _measured_stream(content, metrics, finish):
+    """
+    Yields the chunks of a streaming response body, measuring the queries made to produce each one as part of the request,
+    then calls finish() with the number of bytes sent once the body is over (or the client went away).
+    """
+    size = 0
+    chunks = iter(content)
+    try:
+        while True:
+            token = _current_metrics.set(metrics)
+            try:
+                chunk = next(chunks, None)
+            finally:
+                _current_metrics.reset(token)
+            if chunk is None:
+                break
+            size += len(chunk)
+            yield chunk
+    finally:
+        finish(size)
+
+
+async def _measured_async_stream(content, metrics, finish):
+    """
+    Asynchronous version of _measured_stream(), for the streaming responses of asynchronous views.
+    """
+    size = 0
+    chunks = aiter(content)
+    try:
+        while True:
+            token = _current_metrics.set(metrics)
+            try:
+                chunk = await anext(chunks, None)
+            finally:
+                _current_metrics.reset(token)
+            if chunk is None:
+                break
+            size += len(chunk)
+            yield chunk
+    finally:
+        finish(size)
@@ -0,0 +1,353 @@
+import threading
+import weakref
+from bisect import bisect_left
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+from .pooled_mysql.pool import pool_stats
+
+# In-process metrics registry, exposed in the Prometheus text format by the /metrics endpoint (see metrics_view()).
+# - Counters and histograms are sharded per thread: each thread only ever updates its own series, so recording a measure
+#   takes no lock (and never waits for another thread); the shards are only merged when the endpoint is scraped.
+#   The shards of threads that have ended are folded into the metric's totals on the next scrape, so thread churn does not grow memory.
+# - Gauges (connection counts, cache hit ratio, pool statistics) are computed from their sources when the endpoint is scraped.
+# - Every request is measured by SQLInstrumentationMiddleware (see instrumentation.py), labelled with its route's URL name.
+#
+# The registry belongs to the process: with several worker processes, each one exposes its own measures
+# (the scraper sees whichever worker serves the scrape).
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds of the histogram buckets (an implicit +Inf bucket follows the last one)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Route label of requests not matching any URL pattern
+UNMATCHED_ROUTE = 'unmatched'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _ShardedMetric:
+    """
+    Base of the metrics recorded per thread. Each series (one per combination of label values) is a fixed-size list of numbers,
+    merged element-wise across the shards on collection.
+
+    Args:
+        name (str): Metric name.
+        help (str): Description of the metric.
+        labelnames (tuple): Names of the labels; values are given positionally, in the same order, when recording.
+    """
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        # (thread, shard) pairs of the threads that recorded a measure, and the totals of the threads that have ended
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _series_size(self):
+        raise NotImplementedError
+
+    def _series(self, labels):
+        """
+        Returns the current thread's series for the given label values, creating it if needed.
+        """
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        series = shard.get(labels)
+        if series is None:
+            if len(labels) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects the labels {self.labelnames}, got {labels}')
+            series = shard[labels] = [0] * self._series_size()
+        return series
+
+    def collect(self):
+        """
+        Returns the series of every thread merged, by label values.
+        """
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append(shard)
+                else:
+                    # The thread has ended, so its shard is final: fold it into the totals once
+                    self._merge(self._retired, shard)
+            self._shards = [(thread, shard) for thread, shard in self._shards if thread.is_alive()]
+            merged = {labels: list(series) for labels, series in self._retired.items()}
+        for shard in live:
+            # Copying the dict is atomic; the owning thread may still be updating the series being read,
+            # in which case a scrape can see a measure in a histogram's count before its sum
+            self._merge(merged, dict(shard))
+        return merged
+
+    @staticmethod
+    def _merge(target, shard):
+        for labels, series in shard.items():
+            total = target.get(labels)
+            if total is None:
+                target[labels] = list(series)
+            else:
+                for index, value in enumerate(series):
+                    total[index] += value
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(_ShardedMetric):
+    """
+    Monotonic counter.
+    """
+    type = 'counter'
+
+    def _series_size(self):
+        return 1
+
+    def inc(self, *labels, amount=1):
+        self._series(labels)[0] += amount
+
+    def value(self, *labels):
+        return self.collect().get(labels, [0])[0]
+
+    def samples(self):
+        for labels, (value,) in sorted(self.collect().items()):
+            yield self.name, list(zip(self.labelnames, labels)), value
+
+
+class Histogram(_ShardedMetric):
+    """
+    Histogram of observed values with fixed bucket upper bounds.
+
+    Args:
+        buckets (tuple): Increasing upper bounds of the buckets.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _series_size(self):
+        # One count per bucket, the +Inf bucket, then the sum of the observed values
+        return len(self.buckets) + 2
+
+    def observe(self, value, *labels):
+        series = self._series(labels)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        bounds = self.buckets + (float('inf'),)
+        for labels, series in sorted(self.collect().items()):
+            labels = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                yield f'{self.name}_bucket', labels + [('le', _format_value(float(bound)))], cumulative
+            yield f'{self.name}_sum', labels, series[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+class CallbackMetric:
+    """
+    Metric whose samples are computed on collection.
+
+    Args:
+        type (str): Prometheus metric type ('gauge' or 'counter').
+        collect (callable): Returns (label values tuple, value) pairs.
+    """
+
+    def __init__(self, name, help, type, labelnames=(), collect=None):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self._collect = collect
+
+    def samples(self):
+        for labels, value in self._collect():
+            yield self.name, list(zip(self.labelnames, labels)), value
+
+
+class Registry:
+    """
+    Set of named metrics rendered together in the text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Adds a metric to the registry and returns it.
+
+        Raises:
+            ValueError: If a metric with the same name is already registered.
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric already registered: {metric.name}')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def exposition(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {_escape(metric.help)}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Duration of the requests, until the last byte of the response body.', ('route',),
+))
+REQUEST_DB_DURATION = REGISTRY.register(Histogram(
+    'http_request_db_duration_seconds', 'Time spent running SQL queries per request.', ('route',),
+))
+RESPONSE_SIZE = REGISTRY.register(Histogram(
+    'http_response_size_bytes', 'Size of the response bodies.', ('route',), buckets=SIZE_BUCKETS,
+))
+RESPONSES = REGISTRY.register(Counter(
+    'http_responses_total', 'Responses by route and status code.', ('route', 'status'),
+))
+DASHBOARD_CACHE_REQUESTS = REGISTRY.register(Counter(
+    'dashboard_cache_requests_total', 'Chart data lookups in the dashboard cache (see films/cache.py), by result.', ('result',),
+))
+CONNECTIONS_CREATED = REGISTRY.register(Counter(
+    'db_connections_created_total', 'Database connections opened by Django (or checked out of the pool).', ('alias',),
+))
+
+# Connection wrappers that have opened a connection, to count the open ones on collection
+_connections = weakref.WeakSet()
+_connections_lock = threading.Lock()
+
+
+def _track_connection(sender, connection, **kwargs):
+    with _connections_lock:
+        _connections.add(connection)
+    CONNECTIONS_CREATED.inc(connection.alias)
+
+
+connection_created.connect(_track_connection)
+
+
+def _open_connections():
+    with _connections_lock:
+        wrappers = list(_connections)
+    counts = {}
+    for wrapper in wrappers:
+        counts.setdefault(wrapper.alias, 0)
+        if wrapper.connection is not None:
+            counts[wrapper.alias] += 1
+    return [((alias,), count) for alias, count in sorted(counts.items())]
+
+
+def _cache_hit_ratio():
+    hits = DASHBOARD_CACHE_REQUESTS.value('hit')
+    total = hits + DASHBOARD_CACHE_REQUESTS.value('miss')
+    return [((), hits / total if total else 0.0)]
+
+
+def _pool_samples(*keys):
+    def collect():
+        return [((alias, key), stats[key]) for alias, stats in sorted(pool_stats().items()) for key in keys]
+    return collect
+
+
+REGISTRY.register(CallbackMetric(
+    'db_connections_open', 'Database connections currently open by the threads of the process.', 'gauge', ('alias',), _open_connections,
+))
+REGISTRY.register(CallbackMetric(
+    'dashboard_cache_hit_ratio', 'Share of chart data lookups served from the dashboard cache.', 'gauge', (), _cache_hit_ratio,
+))
+REGISTRY.register(CallbackMetric(
+    'db_pool_connections', 'Connections of the pool (see pooled_mysql), by state.', 'gauge', ('alias', 'state'), _pool_samples('idle', 'in_use'),
+))
+REGISTRY.register(CallbackMetric(
+    'db_pool_events_total', 'Pool events: connections created, reused, discarded, checkouts that waited or timed out.', 'counter',
+    ('alias', 'event'), _pool_samples('created', 'reused', 'discarded', 'waits', 'timeouts'),
+))
+
+
+def route_name(request):
+    """
+    Returns the route label of a request: the name of its URL pattern (or the pattern itself if unnamed).
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_ROUTE
+    return match.url_name or match.route or UNMATCHED_ROUTE
+
+
+def record_request(route, status, duration, db_duration, size):
+    """
+    Records the measures of a served request.
+
+    Args:
+        route (str): Route label (see route_name()).
+        status (int): Status code of the response.
+        duration (float): Duration of the request in seconds.
+        db_duration (float): Time spent running queries in seconds.
+        size (int): Size of the response body in bytes.
+    """
+    REQUEST_DURATION.observe(duration, route)
+    REQUEST_DB_DURATION.observe(db_duration, route)
+    RESPONSE_SIZE.observe(size, route)
+    RESPONSES.inc(route, str(status))
+
+
+def record_cache_lookups(hits, misses):
+    """
+    Records chart data lookups in the dashboard cache.
+    """
+    if hits:
+        DASHBOARD_CACHE_REQUESTS.inc('hit', amount=hits)
+    if misses:
+        DASHBOARD_CACHE_REQUESTS.inc('miss', amount=misses)
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Returns the metrics of the process in the Prometheus text format.
+    When settings.METRICS_ALLOWED_IPS is not empty, only clients from these addresses may read them (others get a 404).
+    """
+    allowed = settings.METRICS_ALLOWED_IPS
+    if allowed and request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
+    return HttpResponse(REGISTRY.exposition(), content_type=CONTENT_TYPE)
@@ -0,0 +1,15 @@
+from .settings import *  # noqa: F401,F403
+
+# Settings of the MySQL parity runs of the fixture tests:
+# python manage.py test films.tests.SakilaSampleTestCase --settings=assignment_project.mysql_test_settings
+# Like test_settings.py, the test database is created empty from the models (not by the migrations, which expect the Sakila tables
+# loaded from sql_files/), so that the Sakila slice of films/fixtures/sakila_sample.json loads without colliding with the full dump.
+# The test database is MYSQL_TEST_DATABASE (default 'test_sakila_sample'), separate from the test_sakila database of the keepdb runs.
+
+DATABASES['default']['TEST'] = {'NAME': os.getenv("MYSQL_TEST_DATABASE", "test_sakila_sample")}  # noqa: F405
+ANALYTICS_DATABASE = None
+
+MIGRATION_MODULES = {'films': None, 'users': None}
+
+# Keep the chart data cache in the test process, whatever DASHBOARD_CACHE_BACKEND says
+CACHES['dashboard'].update(BACKEND='django.core.cache.backends.locmem.LocMemCache', LOCATION='films-dashboard-mysql-tests')  # noqa: F405
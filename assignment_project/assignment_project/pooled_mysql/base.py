@@ -0,0 +1,64 @@
+from mysql.connector import Error
+from mysql.connector.django.base import DatabaseWrapper as MySQLDatabaseWrapper
+from .pool import get_pool
+
+# MySQL backend (MySQL Connector/Python) checking its connections out of a process-wide bounded pool (see pool.py).
+# Closing a connection, e.g. at the end of a request when CONN_MAX_AGE is 0, returns it to the pool instead of disconnecting,
+# so requests reuse established connections without paying for a new handshake and authentication, and the number of connections
+# of a worker process stays bounded whatever its number of threads.
+#
+# Configured with OPTIONS['pool'] = {'max_size': ..., 'timeout': ..., 'max_idle': ...}; without it, the backend does not pool.
+
+
+def _reset(connection):
+    """
+    Health check of an idle connection on checkout: resets its session (rolling back any transaction left open and clearing
+    session variables such as the chart query timeout, see films/executor.py), which fails on a dead connection.
+    Django then initializes the session state again, as for a new connection.
+    """
+    try:
+        connection.reset_session()
+    except Error:
+        return False
+    return True
+
+
+def _disconnect(connection):
+    try:
+        connection.close()
+    except Error:
+        pass
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+
+    def pool(self):
+        """
+        Returns the pool of this database alias, or None if pooling is not configured.
+        """
+        options = self.settings_dict['OPTIONS'].get('pool')
+        if not options:
+            return None
+        return get_pool(self.alias, options, _reset, _disconnect)
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # The pool options are not connection parameters
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        return pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+
+    def _close(self):
+        pool = self.pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.errors_occurred and not self.is_usable():
+                pool.close(self.connection)
+            else:
+                pool.release(self.connection)
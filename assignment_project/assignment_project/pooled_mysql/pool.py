@@ -0,0 +1,195 @@
+import threading
+import time
+from django.db.utils import OperationalError
+
+# Process-wide pool of database connections, shared by the threads of a worker process (see pooled_mysql/base.py).
+# - Bounded: at most 'max_size' connections are open at once; a thread needing one more waits up to 'timeout' seconds.
+# - Health-checked on checkout: an idle connection is only handed out if the 'check' callback succeeds (for MySQL,
+#   a session reset, which also clears the state left by the previous user); otherwise it is discarded and another one is used.
+# - Idle connections unused for more than 'max_idle' seconds are discarded, before the server times them out.
+# The pool does not depend on the database driver: connections are created, checked and closed through callbacks.
+# The lock only guards the pool's bookkeeping: connecting, checking and closing connections (network round trips) happen outside of it.
+
+DEFAULT_MAX_SIZE = 10
+DEFAULT_TIMEOUT = 5
+DEFAULT_MAX_IDLE = 300
+
+
+class PoolTimeout(OperationalError):
+    """
+    Raised when no connection becomes available within the pool's timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    Bounded pool of reusable connections.
+
+    Args:
+        check (callable): Called with an idle connection on checkout; returns False if the connection is not usable.
+        discard (callable): Called to close a connection leaving the pool.
+        max_size (int): Maximum number of open connections (idle or in use).
+        timeout (float): Seconds to wait for a connection when the pool is exhausted.
+        max_idle (float): Seconds after which an idle connection is closed instead of reused.
+    """
+
+    def __init__(self, check, discard, max_size=DEFAULT_MAX_SIZE, timeout=DEFAULT_TIMEOUT, max_idle=DEFAULT_MAX_IDLE):
+        self.check = check
+        self.discard = discard
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._condition = threading.Condition()
+        # Idle connections with the time they were released, the most recently used last
+        self._idle = []
+        self._size = 0
+        self._stats = {'created': 0, 'reused': 0, 'discarded': 0, 'waits': 0, 'timeouts': 0}
+
+    def acquire(self, connect):
+        """
+        Checks out a connection, reusing a healthy idle one or opening a new one with 'connect' while under max_size.
+
+        Raises:
+            PoolTimeout: If the pool stays exhausted for 'timeout' seconds.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._condition:
+                connection, expired = self._take_idle()
+                if connection is None and not expired:
+                    if self._size >= self.max_size:
+                        self._stats['waits'] += 1
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._condition.wait(remaining):
+                            self._stats['timeouts'] += 1
+                            raise PoolTimeout(f'No database connection available within {self.timeout}s (pool size {self.max_size})')
+                        continue
+                    # Reserve the slot before connecting outside of the lock
+                    self._size += 1
+
+            if expired:
+                for expired_connection in expired:
+                    self._close(expired_connection)
+                if connection is None:
+                    # Their slots are free now
+                    continue
+
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._condition:
+                    self._stats['created'] += 1
+                return connection
+
+            # Health check outside of the lock, as it is a round trip to the server
+            if self._is_healthy(connection):
+                with self._condition:
+                    self._stats['reused'] += 1
+                return connection
+            self._close(connection)
+
+    def release(self, connection):
+        """
+        Returns a checked out connection to the pool.
+        """
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def close(self, connection):
+        """
+        Closes a checked out connection instead of returning it (e.g. after an unrecoverable error).
+        """
+        self._close(connection)
+
+    def clear(self):
+        """
+        Closes every idle connection.
+        """
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+    def stats(self):
+        """
+        Returns the pool statistics: current 'size', 'idle' and 'in_use' connections, 'max_size', and the counts of connections
+        'created', 'reused' (healthy checkouts of idle connections), 'discarded', checkouts that had to wait ('waits') and 'timeouts'.
+        """
+        with self._condition:
+            return {
+                'size': self._size, 'idle': len(self._idle), 'in_use': self._size - len(self._idle), 'max_size': self.max_size,
+                **self._stats,
+            }
+
+    def _take_idle(self):
+        """
+        Takes the most recently used idle connection (None if there is none) and the connections idle for too long out of the pool,
+        the latter to be closed by the caller once the lock is released (see _close()). Called with the lock held.
+
+        Returns:
+            tuple: The idle connection to check out, or None, and the list of expired connections.
+        """
+        now = time.monotonic()
+        expired = [connection for connection, released in self._idle if now - released > self.max_idle]
+        if expired:
+            self._idle = [(connection, released) for connection, released in self._idle if now - released <= self.max_idle]
+        connection = self._idle.pop()[0] if self._idle else None
+        return connection, expired
+
+    def _is_healthy(self, connection):
+        try:
+            return self.check(connection)
+        except Exception:
+            return False
+
+    def _close(self, connection):
+        """
+        Closes a connection taken out of the pool, then frees its slot. Called without the lock: closing is a round trip to the server,
+        which must not block the other checkouts.
+        """
+        try:
+            self.discard(connection)
+        except Exception:
+            pass
+        with self._condition:
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._condition.notify()
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, options, check, discard):
+    """
+    Returns the pool of a database alias, created on first use with the 'pool' options of its settings
+    ('max_size', 'timeout' and 'max_idle').
+    """
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(
+                check, discard,
+                max_size=options.get('max_size', DEFAULT_MAX_SIZE),
+                timeout=options.get('timeout', DEFAULT_TIMEOUT),
+                max_idle=options.get('max_idle', DEFAULT_MAX_IDLE),
+            )
+        return _pools[alias]
+
+
+def pool_stats():
+    """
+    Returns the statistics of the pools of the current process, by database alias.
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in pools.items()}
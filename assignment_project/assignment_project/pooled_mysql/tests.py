@@ -0,0 +1,117 @@
+import threading
+from django.test import SimpleTestCase
+from .pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """
+    Stand-in for a driver connection, counting the health checks.
+    """
+
+    def __init__(self, number):
+        self.number = number
+        self.healthy = True
+        self.closed = False
+        self.checks = 0
+        self.blocked_pool = None
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    """
+    Test case for the bounded, health-checked connection pool of the pooled MySQL backend.
+    """
+
+    def setUp(self):
+        self.opened = []
+
+        def check(connection):
+            connection.checks += 1
+            return connection.healthy
+
+        def discard(connection):
+            connection.closed = True
+            # Whether another thread could use the pool meanwhile
+            other = threading.Thread(target=self.pool.stats)
+            other.start()
+            other.join(1)
+            connection.blocked_pool = other.is_alive()
+
+        self.pool = ConnectionPool(check, discard, max_size=2, timeout=0.05, max_idle=60)
+
+    def connect(self):
+        connection = FakeConnection(len(self.opened) + 1)
+        self.opened.append(connection)
+        return connection
+
+    def test_reuse_with_health_check(self):
+        """
+        Test that released connections are reused after a successful health check, and replaced when it fails.
+        """
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire(self.connect), first)
+        self.assertEqual(first.checks, 1)
+
+        first.healthy = False
+        self.pool.release(first)
+        second = self.pool.acquire(self.connect)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+        self.assertEqual(self.pool.stats(), {
+            'size': 1, 'idle': 0, 'in_use': 1, 'max_size': 2, 'created': 2, 'reused': 1, 'discarded': 1, 'waits': 0, 'timeouts': 0,
+        })
+
+    def test_bounded_size(self):
+        """
+        Test that an exhausted pool makes threads wait for a released connection, and times out if none is released.
+        """
+        first = self.pool.acquire(self.connect)
+        self.pool.acquire(self.connect)
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire(self.connect)
+
+        self.pool.timeout = 5
+        releaser = threading.Timer(0.05, self.pool.release, args=(first,))
+        releaser.start()
+        self.assertIs(self.pool.acquire(self.connect), first)
+        releaser.join()
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(self.pool.stats()['timeouts'], 1)
+
+    def test_idle_expiry(self):
+        """
+        Test that connections idle for longer than max_idle are closed instead of reused.
+        """
+        self.pool.max_idle = 0
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first)
+        self.assertIsNot(self.pool.acquire(self.connect), first)
+        self.assertTrue(first.closed)
+        self.assertEqual(first.checks, 0)
+
+    def test_failed_connect_frees_its_slot(self):
+        """
+        Test that a failing connection attempt does not permanently take a slot of the pool.
+        """
+        def fail():
+            raise OSError('Connection refused')
+
+        for _ in range(3):
+            with self.assertRaises(OSError):
+                self.pool.acquire(fail)
+        self.assertEqual(self.pool.stats()['size'], 0)
+
+    def test_close_outside_of_the_lock(self):
+        """
+        Test that connections are closed without holding the pool's lock: unhealthy, expired and explicitly closed ones.
+        """
+        first = self.pool.acquire(self.connect)
+        first.healthy = False
+        self.pool.release(first)
+        second = self.pool.acquire(self.connect)
+        self.pool.max_idle = 0
+        self.pool.release(second)
+        third = self.pool.acquire(self.connect)
+        self.pool.close(third)
+        self.assertEqual([(connection.closed, connection.blocked_pool) for connection in (first, second, third)], [(True, False)] * 3)
+        self.assertEqual(self.pool.stats()['size'], 0)
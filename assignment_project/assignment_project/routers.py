@@ -0,0 +1,167 @@
+import contextvars
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Routing of the analytics reads to a read replica of the database.
+# - settings.ANALYTICS_DATABASE names the replica alias ('analytics' when ANALYTICS_DB_HOST is set, see settings.py), kept up to date
+#   by MySQL replication from the primary (the 'default' database). Without it, every query goes to the primary.
+# - Views decorated with analytics_reads() (the films dashboard and its data endpoints, the user lists) read from the replica:
+#   their ORM queries through AnalyticsRouter, their raw SQL through read_connection(). Every other read, and every write, uses the primary.
+# - Reads follow writes: once a request has written, its remaining reads go to the primary. If the request is a client-initiated write
+#   (a non-safe HTTP method, e.g. the status updates), ReplicaRoutingMiddleware also sets a cookie pinning the reads of that client
+#   to the primary for settings.ANALYTICS_PIN_SECONDS (longer than the replication lag), so that a user sees their own changes
+#   in the next pages and requests. Writes made on the side of a GET (caches, maintenance) do not pin the client.
+#
+# The routing state of a request is held in a context variable: the dashboard chart workers (see films/executor.py) run in a copy of the
+# request's context and share its state, and the body of a streaming response is produced with the state of its request.
+
+# Methods of the requests that do not pin the client when they write
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Cookie pinning the reads of a client to the primary after one of its requests wrote
+PIN_COOKIE = 'primary_reads'
+
+# Routing state of the request being served, None outside of a request
+_current_routing = contextvars.ContextVar('database_routing', default=None)
+
+
+class RoutingState:
+    """
+    Replica routing of one request. Updated from any thread working for the request.
+    """
+
+    def __init__(self, pinned=False):
+        # Whether the view reads from the replica (see analytics_reads())
+        self.analytics = False
+        # Whether the reads must see the primary: the client wrote recently, or the request has written
+        self.pinned = pinned
+        # Whether the request has written
+        self.wrote = False
+
+
+def read_alias():
+    """
+    Returns the alias of the database the reads of the current request go to: the replica for the analytics reads
+    of a request not pinned to the primary, 'default' otherwise.
+    """
+    state = _current_routing.get()
+    if settings.ANALYTICS_DATABASE and state is not None and state.analytics and not state.pinned:
+        return settings.ANALYTICS_DATABASE
+    return DEFAULT_DB_ALIAS
+
+
+def read_connection():
+    """
+    Returns the connection raw SQL reads should use (see read_alias()).
+    """
+    return connections[read_alias()]
+
+
+def analytics_reads(view):
+    """
+    View decorator sending the reads of the view to the analytics replica, including the reads made while its response is streamed.
+    Decorators applied before it (e.g. condition()) run inside it, so their reads go to the replica as well.
+    Requires ReplicaRoutingMiddleware; outside of it, the reads stay on the primary.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _current_routing.get()
+        if state is not None:
+            state.analytics = True
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class AnalyticsRouter:
+    """
+    Database router sending the analytics reads to the replica (see read_alias()) and every write to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias()
+        # None lets Django read related objects from the database their instance came from
+        return alias if alias != DEFAULT_DB_ALIAS else None
+
+    def db_for_write(self, model, **hints):
+        state = _current_routing.get()
+        if state is not None:
+            state.wrote = state.pinned = True
+        # Even for instances read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, settings.ANALYTICS_DATABASE}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication
+        if db == settings.ANALYTICS_DATABASE:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware holding the routing state of each request (see RoutingState), pinning its reads to the primary if the client wrote recently,
+    and pinning the client once a request with a non-safe method has written.
+    Should come right after SQLInstrumentationMiddleware in settings.MIDDLEWARE, before any middleware querying the database.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _current_routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_routing.reset(token)
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _routed_async_stream(response.streaming_content, state)
+            else:
+                response.streaming_content = _routed_stream(response.streaming_content, state)
+        # Writes made while streaming come too late to set the cookie; the views write before they respond
+        if state.wrote and request.method not in SAFE_METHODS and settings.ANALYTICS_DATABASE:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.ANALYTICS_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+
+def _routed_stream(content, state):
+    """
+    Yields the chunks of a streaming response body, routing the queries made to produce each one like those of its request.
+    """
+    chunks = iter(content)
+    while True:
+        token = _current_routing.set(state)
+        try:
+            chunk = next(chunks, None)
+        finally:
+            _current_routing.reset(token)
+        if chunk is None:
+            break
+        yield chunk
+
+
+async def _routed_async_stream(content, state):
+    """
+    Asynchronous version of _routed_stream(), for the streaming responses of asynchronous views.
+    """
+    chunks = aiter(content)
+    while True:
+        token = _current_routing.set(state)
+        try:
+            chunk = await anext(chunks, None)
+        finally:
+            _current_routing.reset(token)
+        if chunk is None:
+            break
+        yield chunk
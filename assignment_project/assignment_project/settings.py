@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,10 +46,13 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'users',
     'films',
+    'benchmarks',
     'rest_framework',
 ]
 
 MIDDLEWARE = [
+    'assignment_project.instrumentation.SQLInstrumentationMiddleware',  # First, so that its timings cover the whole request
+    'assignment_project.routers.ReplicaRoutingMiddleware',  # Before any middleware querying the database
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,15 +88,135 @@ WSGI_APPLICATION = 'assignment_project.wsgi.application'
 
 SECRET_KEY = os.getenv("SECRET_KEY", "default_secret")
 
+# Connection reuse:
+# - DB_CONN_MAX_AGE: seconds a thread keeps its connection open across requests (0 closes it at the end of each request).
+#   Persistent connections are checked with a ping before being reused by a new request (CONN_HEALTH_CHECKS).
+#   It defaults to 0 with the pool, so that idle threads do not hold on to pooled connections.
+# - DB_POOL_MAX_SIZE > 0 switches to the pooled backend (assignment_project/pooled_mysql): closed connections go back to a pool
+#   of at most DB_POOL_MAX_SIZE connections per worker process, health-checked on checkout. DB_POOL_TIMEOUT (seconds) bounds the wait
+#   for a connection when the pool is exhausted, and DB_POOL_MAX_IDLE (seconds) how long an unused connection is kept.
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'mysql.connector.django', # django.db.backends.mysql
+        'ENGINE': 'assignment_project.pooled_mysql' if DB_POOL_MAX_SIZE else 'mysql.connector.django', # django.db.backends.mysql
         'NAME': os.getenv("MYSQL_DATABASE"),
         'USER': os.getenv("MYSQL_USER"),
         'PASSWORD': os.getenv("MYSQL_PASSWORD"),
         'HOST': os.getenv("MYSQL_HOST", "db"),  # MYSQL_HOST supports GitHub Actions, db supports Docker
         'PORT': '3306',
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "0" if DB_POOL_MAX_SIZE else "60")),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': float(os.getenv("DB_POOL_TIMEOUT", "5")),
+                'max_idle': float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+            },
+        } if DB_POOL_MAX_SIZE else {},
+    }
+}
+
+# Analytics read replica (see assignment_project/routers.py):
+# - ANALYTICS_DB_HOST adds an 'analytics' database, a MySQL replica of the default one, with the same settings unless overridden
+#   by ANALYTICS_DB_PORT, ANALYTICS_DB_NAME, ANALYTICS_DB_USER and ANALYTICS_DB_PASSWORD. The dashboard and user list reads go to it.
+#   Tests use the default test database for it (TEST MIRROR).
+# - ANALYTICS_PIN_SECONDS: seconds a client keeps reading from the primary after one of its requests wrote, bounding the replication lag.
+ANALYTICS_DB_HOST = os.getenv("ANALYTICS_DB_HOST")
+if ANALYTICS_DB_HOST:
+    DATABASES['analytics'] = {
+        **DATABASES['default'],
+        'HOST': ANALYTICS_DB_HOST,
+        'PORT': os.getenv("ANALYTICS_DB_PORT", DATABASES['default']['PORT']),
+        'NAME': os.getenv("ANALYTICS_DB_NAME", DATABASES['default']['NAME']),
+        'USER': os.getenv("ANALYTICS_DB_USER", DATABASES['default']['USER']),
+        'PASSWORD': os.getenv("ANALYTICS_DB_PASSWORD", DATABASES['default']['PASSWORD']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),  # The pool of each alias is separate
+        'TEST': {'MIRROR': 'default'},
     }
+
+# Alias of the replica serving the analytics reads, None to read everything from the primary
+ANALYTICS_DATABASE = 'analytics' if 'analytics' in DATABASES else None
+ANALYTICS_PIN_SECONDS = int(os.getenv("ANALYTICS_PIN_SECONDS", "5"))
+
+DATABASE_ROUTERS = ['assignment_project.routers.AnalyticsRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# The 'dashboard' cache holds the films dashboard chart data, keyed by data version (see films/cache.py).
+# DASHBOARD_CACHE_BACKEND selects 'locmem' (per process, evicts the least recently used entries beyond MAX_ENTRIES)
+# or 'file' (shared by every worker process on the host, culls a fraction of the entries beyond MAX_ENTRIES).
+DASHBOARD_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'films-dashboard'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(tempfile.gettempdir(), 'films-dashboard-cache')),
+}
+DASHBOARD_CACHE_BACKEND, DASHBOARD_CACHE_LOCATION = DASHBOARD_CACHE_BACKENDS[os.getenv("DASHBOARD_CACHE_BACKEND", "locmem")]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': DASHBOARD_CACHE_BACKEND,
+        'LOCATION': os.getenv("DASHBOARD_CACHE_LOCATION", DASHBOARD_CACHE_LOCATION),
+        'TIMEOUT': int(os.getenv("DASHBOARD_CACHE_TIMEOUT", "3600")),  # TTL in seconds
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "300")),  # Bound on the number of cached chart payloads
+        },
+    },
+}
+
+# Films dashboard
+# DASHBOARD_QUERY_WORKERS > 0 builds the charts concurrently on a bounded thread pool, each query on its own database connection (see films/executor.py).
+# 0 builds them sequentially on the request's connection. DASHBOARD_QUERY_TIMEOUT (seconds) bounds each chart, from the start of its build
+# in concurrent mode, and every chart query on MySQL (max_execution_time) in both modes.
+DASHBOARD_QUERY_WORKERS = int(os.getenv("DASHBOARD_QUERY_WORKERS", "0"))
+DASHBOARD_QUERY_TIMEOUT = float(os.getenv("DASHBOARD_QUERY_TIMEOUT", "10"))
+
+# DASHBOARD_DISTINCT_COUNTS = 'approximate' answers the unique customer counts of filtered donut charts from HyperLogLog sketches
+# (see films/sketches.py) instead of exact COUNT(DISTINCT) queries. DASHBOARD_SKETCH_ERROR is the target relative standard error of the sketches.
+# Run 'python manage.py rebuild_rollups' after enabling the approximate mode or changing the error.
+DASHBOARD_DISTINCT_COUNTS = os.getenv("DASHBOARD_DISTINCT_COUNTS", "exact")
+DASHBOARD_SKETCH_ERROR = float(os.getenv("DASHBOARD_SKETCH_ERROR", "0.02"))
+
+# DASHBOARD_ENGINE = 'snapshot' aggregates every chart from an in-process NumPy snapshot of the fact columns (see films/snapshot.py),
+# refreshed incrementally before each use. 'sql' (the default) reads the rollup tables and queries the database for filtered charts.
+DASHBOARD_ENGINE = os.getenv("DASHBOARD_ENGINE", "sql")
+
+# Broker fanning out the user status changes to the clients of /api/users/events/ (see users/events.py).
+# The default in-process broker only reaches the clients connected to the same server process.
+USER_EVENTS_BROKER = os.getenv("USER_EVENTS_BROKER", "users.events.InProcessBroker")
+# Under a WSGI server (runserver, gunicorn sync workers), each open ./user page holds one server thread for as long as its event stream lasts:
+# the stream ends after USER_EVENTS_WSGI_STREAM_SECONDS, releasing the thread, and the browser reconnects. 0 for no limit.
+# ASGI streams wait in the event loop without holding a thread and are not limited.
+USER_EVENTS_WSGI_STREAM_SECONDS = float(os.getenv("USER_EVENTS_WSGI_STREAM_SECONDS", "300")) or None
+
+# SQL instrumentation (see assignment_project/instrumentation.py): queries slower than SLOW_QUERY_THRESHOLD_MS are logged as JSON lines
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+
+# Metrics endpoint (see assignment_project/metrics.py): comma-separated client addresses allowed to read /metrics (empty for any client)
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv("METRICS_ALLOWED_IPS", "").split(",") if ip.strip()]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json_line': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json_line',
+        },
+    },
+    'loggers': {
+        'assignment_project.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
 # Password validation
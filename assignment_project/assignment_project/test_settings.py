@@ -0,0 +1,26 @@
+from .settings import *  # noqa: F401,F403
+
+# Settings of the in-process test runs: python manage.py test --settings=assignment_project.test_settings
+# The test database is an in-memory SQLite database, created from the models rather than by the migrations (which expect the Sakila tables
+# loaded from sql_files/, see the Readme). Tests needing realistic data load the compact Sakila slice of films/fixtures/sakila_sample.json
+# (fixtures = ['sakila_sample']), once per test case class.
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    # SQLite stand-in for the analytics replica: a second connection to the test database (see assignment_project/routers.py).
+    # The routing is off unless a test enables it with override_settings(ANALYTICS_DATABASE='analytics').
+    'analytics': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+ANALYTICS_DATABASE = None
+
+MIGRATION_MODULES = {'films': None, 'users': None}
+
+# Keep the chart data cache in the test process, whatever DASHBOARD_CACHE_BACKEND says
+CACHES['dashboard'].update(BACKEND='django.core.cache.backends.locmem.LocMemCache', LOCATION='films-dashboard-tests')  # noqa: F405
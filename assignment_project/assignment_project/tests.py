@@ -0,0 +1,300 @@
+import json
+import threading
+from unittest import skipUnless
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from films.cache import CACHE_ALIAS
+from films.views import CHART_ENDPOINTS
+from users.models import Customer
+from . import metrics
+from .instrumentation import RequestMetrics
+from .routers import PIN_COOKIE
+
+
+def server_timing(response):
+    """
+    Returns the Server-Timing metrics of a response as a dict of metric name -> parameters.
+    """
+    metrics = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, *params = entry.split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+
+class SQLInstrumentationTestCase(TestCase):
+    """
+    Test case for the per-request SQL instrumentation and its Server-Timing header.
+    """
+
+    def setUp(self):
+        for customer_id in range(1, 4):
+            Customer.objects.create(customer_id=customer_id, first_name=f'Customer{customer_id}', last_name='Active', active=True)
+
+    def test_server_timing_without_debug(self):
+        """
+        Test that the queries and fetched rows of a request are reported with DEBUG = False (connection.queries stays empty).
+
+        Asserts:
+            - The status update makes a single query, and fetches no rows.
+            - Every response carries the database, slowest query and total timings.
+        """
+        response = self.client.patch(reverse('api_update_status'), {'id': 1, 'type': 'customer', 'active': False}, content_type='application/json')
+        metrics = server_timing(response)
+        self.assertEqual(metrics['db']['desc'], '"1 queries / 0 rows"')
+        self.assertGreaterEqual(float(metrics['total']['dur']), float(metrics['db']['dur']))
+        self.assertIn('db-slowest', metrics)
+        self.assertEqual(connection.queries, [])
+
+    def test_chart_timings(self):
+        """
+        Test that chart data responses report the build time of their chart and the rows it fetched.
+        """
+        response = self.client.get(reverse('film_chart_data', args=['bar']))
+        metrics = server_timing(response)
+        self.assertIn('bar_chart', metrics)
+        self.assertGreater(int(metrics['db']['desc'].split()[0].strip('"')), 0)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_query_log(self):
+        """
+        Test that queries over the threshold are logged as JSON lines with their duration, path and SQL.
+        """
+        with self.assertLogs('assignment_project.slow_queries', 'WARNING') as logs:
+            self.client.patch(reverse('api_update_status'), {'id': 1, 'type': 'customer', 'active': False}, content_type='application/json')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['event'], 'slow_query')
+        self.assertEqual(entry['path'], reverse('api_update_status'))
+        self.assertTrue(entry['sql'].startswith('UPDATE'))
+
+    def test_request_metrics(self):
+        """
+        Test the Server-Timing header value built from recorded measures.
+        """
+        metrics = RequestMetrics()
+        metrics.record_query(0.002)
+        metrics.record_query(0.005)
+        metrics.record_rows(10)
+        metrics.record_timing('pie_chart', 0.004)
+        self.assertEqual(
+            metrics.server_timing(0.01),
+            'db;desc="2 queries / 10 rows";dur=7.0, db-slowest;dur=5.0, pie_chart;dur=4.0, total;dur=10.0',
+        )
+
+
+class MetricsRegistryTestCase(SimpleTestCase):
+    """
+    Test case for the thread-sharded metrics and their text exposition.
+    """
+
+    def test_histogram_merges_threads(self):
+        """
+        Test that the observations of every thread are merged on collection, including threads that have ended.
+        """
+        histogram = metrics.Histogram('test_duration_seconds', 'Test.', ('route',), buckets=(0.1, 1))
+
+        def observe():
+            for _ in range(1000):
+                histogram.observe(0.05, 'a')
+            histogram.observe(5, 'b')
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        histogram.observe(0.5, 'a')
+
+        series = histogram.collect()
+        self.assertEqual(series[('a',)][:3], [4000, 1, 0])
+        self.assertAlmostEqual(series[('a',)][-1], 200.5)
+        self.assertEqual(series[('b',)][:3], [0, 0, 4])
+        # The shards of the ended threads were folded into the totals, only the current thread's shard is left
+        self.assertEqual(len(histogram._shards), 1)
+        self.assertEqual(histogram.collect(), series)
+
+    def test_exposition(self):
+        """
+        Test the text format of counters and histograms (cumulative buckets, sum and count).
+        """
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter('test_total', 'Test counter.', ('status',)))
+        histogram = registry.register(metrics.Histogram('test_size_bytes', 'Test histogram.', buckets=(10, 100)))
+        counter.inc('200', amount=3)
+        histogram.observe(5)
+        histogram.observe(50)
+        self.assertEqual(registry.exposition().splitlines(), [
+            '# HELP test_total Test counter.',
+            '# TYPE test_total counter',
+            'test_total{status="200"} 3',
+            '# HELP test_size_bytes Test histogram.',
+            '# TYPE test_size_bytes histogram',
+            'test_size_bytes_bucket{le="10"} 1',
+            'test_size_bytes_bucket{le="100"} 2',
+            'test_size_bytes_bucket{le="+Inf"} 2',
+            'test_size_bytes_sum 55',
+            'test_size_bytes_count 2',
+        ])
+        with self.assertRaises(ValueError):
+            registry.register(metrics.Counter('test_total', 'Duplicate.'))
+
+
+class MetricsEndpointTestCase(TestCase):
+    """
+    Test case for the per-route request metrics and the /metrics endpoint.
+    """
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        for customer_id in range(1, 4):
+            Customer.objects.create(customer_id=customer_id, first_name=f'Customer{customer_id}', last_name='Active', active=True)
+
+    def test_request_metrics(self):
+        """
+        Test that requests are recorded under their route name, streamed responses once their body has been sent.
+        """
+        def request_count(route):
+            # Sum of the bucket counts, the last element of a series being the sum of the observed values
+            return sum(metrics.REQUEST_DURATION.collect().get((route,), [0])[:-1])
+
+        count = request_count('api_user_list')
+        response = self.client.get(reverse('api_user_list'))
+        body = b''.join(response.streaming_content)
+        self.client.patch(reverse('api_update_status'), {'id': 1, 'type': 'customer', 'active': False}, content_type='application/json')
+
+        self.assertEqual(request_count('api_user_list'), count + 1)
+        sizes = metrics.RESPONSE_SIZE.collect()[('api_user_list',)]
+        self.assertGreaterEqual(sizes[-1], len(body))
+        self.assertGreaterEqual(metrics.RESPONSES.value('api_update_status', '200'), 1)
+
+        exposition = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_request_duration_seconds_count{route="api_user_list"}', exposition)
+        self.assertIn('http_request_db_duration_seconds_bucket{route="api_update_status",le="+Inf"}', exposition)
+        self.assertIn('db_connections_open{alias="default"}', exposition)
+
+    def test_cache_hit_ratio(self):
+        """
+        Test that chart data lookups are counted as dashboard cache hits or misses.
+        """
+        hits, misses = metrics.DASHBOARD_CACHE_REQUESTS.value('hit'), metrics.DASHBOARD_CACHE_REQUESTS.value('miss')
+        url = reverse('film_chart_data', args=['bar'])
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(metrics.DASHBOARD_CACHE_REQUESTS.value('hit'), hits + 1)
+        self.assertEqual(metrics.DASHBOARD_CACHE_REQUESTS.value('miss'), misses + 1)
+        self.assertIn('dashboard_cache_hit_ratio ', self.client.get(reverse('metrics')).content.decode())
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_allowed_ips(self):
+        """
+        Test that the endpoint is hidden from clients outside of METRICS_ALLOWED_IPS.
+        """
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+
+@skipUnless('analytics' in settings.DATABASES, 'No analytics database configured')
+@override_settings(ANALYTICS_DATABASE='analytics')
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """
+    Test case for the routing of the analytics reads to the replica, with the SQLite stand-in of the test settings
+    (a second connection to the test database). A TransactionTestCase, so that the replica connection sees the committed rows.
+    Skipped with settings that have no 'analytics' database.
+    """
+    # The test runner sets up the databases of skipped test cases too
+    databases = {'default', 'analytics'} if 'analytics' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        for customer_id in range(1, 4):
+            Customer.objects.create(customer_id=customer_id, first_name=f'Customer{customer_id}', last_name='Active', active=True)
+
+    def get(self, url):
+        """
+        Sends a GET request, consuming a streamed body, and returns the response with the queries made on the primary and on the replica.
+        """
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['analytics']) as replica:
+            response = self.client.get(url)
+            if response.streaming:
+                response.content_bytes = b''.join(response.streaming_content)
+        return response, primary, replica
+
+    def update_status(self, customer_id, active):
+        return self.client.patch(
+            reverse('api_update_status'), {'id': customer_id, 'type': 'customer', 'active': active}, content_type='application/json',
+        )
+
+    def test_analytics_reads_use_the_replica(self):
+        """
+        Test that the user lists, the chart data and the exports are read from the replica, including the streamed bodies.
+        """
+        for url in (reverse('api_user_list'), reverse('film_chart_data', args=['donut']), reverse('film_export', args=['rentals'])):
+            with self.subTest(url=url):
+                response, primary, replica = self.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(primary), 0)
+                self.assertGreater(len(replica), 0)
+                self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response, _, _ = self.get(reverse('api_user_list'))
+        self.assertEqual(len(json.loads(response.content_bytes)['active_users']), 3)
+
+    def test_dashboard_requests_do_not_pin(self):
+        """
+        Test that viewing the dashboard and every chart reads from the replica only, and never pins the client to the primary.
+        """
+        for url in [reverse('film_dashboard')] + [reverse('film_chart_data', args=[chart]) for chart in CHART_ENDPOINTS]:
+            with self.subTest(url=url):
+                response, primary, _ = self.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(primary), 0)
+                self.assertNotIn(PIN_COOKIE, response.cookies)
+                self.assertNotIn(PIN_COOKIE, self.client.cookies)
+
+    def test_writes_use_the_primary_and_pin_the_reads(self):
+        """
+        Test that a status update writes to the primary, then pins the reads of the client to the primary until the pin expires.
+        """
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['analytics']) as replica:
+            response = self.update_status(1, False)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(primary), 0)
+        self.assertEqual(len(replica), 0)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        # The next reads of the client see its own write
+        response, primary, replica = self.get(reverse('api_user_list'))
+        self.assertGreater(len(primary), 0)
+        self.assertEqual(len(replica), 0)
+        self.assertEqual([user['id'] for user in json.loads(response.content_bytes)['inactive_users']], [1])
+
+        # Once the pin has expired, the reads go back to the replica
+        self.client.cookies.pop(PIN_COOKIE)
+        _, primary, replica = self.get(reverse('api_user_list'))
+        self.assertEqual(len(primary), 0)
+        self.assertGreater(len(replica), 0)
+
+    def test_instances_read_from_the_replica_are_saved_to_the_primary(self):
+        """
+        Test that objects read from the replica are written to the primary.
+        """
+        customer = Customer.objects.using('analytics').get(customer_id=2)
+        customer.first_name = 'Renamed'
+        with CaptureQueriesContext(connections['default']) as primary:
+            customer.save()
+        self.assertGreater(len(primary), 0)
+        self.assertEqual(Customer.objects.get(customer_id=2).first_name, 'Renamed')
+
+    @override_settings(ANALYTICS_DATABASE=None)
+    def test_without_replica(self):
+        """
+        Test that without a replica every read goes to the primary, and writes do not set the pin cookie.
+        """
+        _, primary, replica = self.get(reverse('api_user_list'))
+        self.assertGreater(len(primary), 0)
+        self.assertEqual(len(replica), 0)
+        self.assertNotIn(PIN_COOKIE, self.update_status(1, False).cookies)
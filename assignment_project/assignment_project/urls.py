@@ -18,16 +18,20 @@ from django.contrib import admin
 from django.urls import path
 from django.urls import include
 from django.views.generic import TemplateView
-from users.views import UserListView, UpdateUserStatusView
+from assignment_project.metrics import metrics_view
+from users.views import UserListView, UpdateUserStatusView, BulkUpdateUserStatusView, user_status_events
 
 urlpatterns = [
     path('', TemplateView.as_view(template_name="main_page.html"), name='main_page'),
     # REST API routes 
     path('api/', include([
         path('users/', UserListView.as_view(), name='api_user_list'),
+        path('users/events/', user_status_events, name='api_user_events'),
         path('status/', UpdateUserStatusView.as_view(), name='api_update_status'),
+        path('status/bulk/', BulkUpdateUserStatusView.as_view(), name='api_bulk_update_status'),
     ])), 
     path('users/', include('users.urls')), # UI routes for users
     path('films/', include('films.urls')), 
     path('admin/', admin.site.urls), # Admin panel
+    path('metrics', metrics_view, name='metrics'), # Prometheus metrics of the process
 ]
@@ -0,0 +1,58 @@
+import threading
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connections
+from .load import client, run_workers, send
+
+# Measures the throughput of the app's endpoints with and without database connection reuse (see settings.DATABASES).
+# Requests are sent as by the load test (see load.py): each one is surrounded by the connection handling a server does
+# at the start and end of every request, so that connections are closed, kept or returned to the pool exactly as when serving real traffic.
+# The database and the app run as configured; only reuse is toggled.
+
+# Connection age used for the run with reuse when the settings disable both persistent connections and pooling
+PERSISTENT_CONN_MAX_AGE = 60
+
+
+@contextmanager
+def connection_reuse(enabled, alias=DEFAULT_DB_ALIAS):
+    """
+    Enables or disables connection reuse of a database alias for the duration of the block.
+    Without reuse, every request opens and closes its own connection (CONN_MAX_AGE = 0, no pool).
+    With reuse, the configured persistent connections and pool are used, falling back to persistent connections if neither is configured.
+    """
+    settings_dict = connections[alias].settings_dict
+    saved = settings_dict['CONN_MAX_AGE'], settings_dict['OPTIONS'].get('pool')
+    if not enabled:
+        settings_dict['CONN_MAX_AGE'] = 0
+        settings_dict['OPTIONS'].pop('pool', None)
+    elif not settings_dict['CONN_MAX_AGE'] and not saved[1]:
+        settings_dict['CONN_MAX_AGE'] = PERSISTENT_CONN_MAX_AGE
+    connections.close_all()
+    try:
+        yield
+    finally:
+        connections.close_all()
+        settings_dict['CONN_MAX_AGE'] = saved[0]
+        if saved[1] is not None:
+            settings_dict['OPTIONS']['pool'] = saved[1]
+
+
+def run_requests(urls, total, concurrency):
+    """
+    Sends 'total' GET requests, cycling through 'urls', from 'concurrency' threads.
+
+    Returns:
+        dict: 'requests' sent, 'errors' (responses with an error status), 'seconds' elapsed and 'requests_per_second'.
+    """
+    errors = []
+    lock = threading.Lock()
+
+    def work(count, offset):
+        thread_client = client()
+        for index in range(count):
+            response = send(thread_client, 'get', urls[(offset + index) % len(urls)])
+            if response.status_code >= 400:
+                with lock:
+                    errors.append(response.status_code)
+
+    seconds = run_workers(total, concurrency, work)
+    return {'requests': total, 'errors': len(errors), 'seconds': seconds, 'requests_per_second': total / seconds if seconds else 0.0}
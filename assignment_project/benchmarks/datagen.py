@@ -0,0 +1,276 @@
+import random
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import islice
+from django.db import connection, transaction
+from django.utils import timezone as django_timezone
+from films.models import Category, Language, Store
+from films.rollups import rebuild_rollups
+from users.models import Staff
+from users.search import rebuild_name_index
+
+# Synthetic Sakila-shaped data for benchmarks and load tests, at a multiple of the volumes of sql_files/02_sakila-data.sql.
+# - The catalog (actors, films and their actors and category, inventory) and the customers, rentals and payments are scaled;
+#   the languages, categories, stores and staff are kept (or created with the Sakila values when the database is empty).
+# - Rows are written with multi-row INSERTs of the full Sakila columns that exist in each table: the MySQL tables loaded from
+#   the Sakila scripts have more (NOT NULL) columns than the models map, the tables created by the migrations only the mapped ones.
+# - Generated ids continue after the current maximum of each table, so data can be added to an existing database.
+# - Rows are inserted directly, without going through the signal handlers: the rollups and the name search index are rebuilt afterwards.
+# Generation is deterministic for a given seed and database content.
+
+# Row counts of the Sakila sample database, the unit of the scale factor. Every rental gets one payment.
+SAKILA_VOLUMES = {
+    'actor': 200,
+    'film': 1000,
+    'inventory': 4581,
+    'customer': 599,
+    'rental': 16044,
+}
+# Period of the Sakila rentals
+RENTAL_PERIOD = (datetime(2005, 5, 24, tzinfo=timezone.utc), datetime(2006, 2, 15, tzinfo=timezone.utc))
+BATCH_SIZE = 5000
+
+LANGUAGES = ['English', 'Italian', 'Japanese', 'Mandarin', 'French', 'German']
+CATEGORIES = [
+    'Action', 'Animation', 'Children', 'Classics', 'Comedy', 'Documentary', 'Drama', 'Family',
+    'Foreign', 'Games', 'Horror', 'Music', 'New', 'Sci-Fi', 'Sports', 'Travel',
+]
+FIRST_NAMES = ['MARY', 'PATRICIA', 'LINDA', 'BARBARA', 'ELIZABETH', 'JENNIFER', 'MARIA', 'SUSAN', 'JOHN', 'ROBERT', 'MICHAEL', 'WILLIAM',
+               'DAVID', 'RICHARD', 'CHARLES', 'JOSEPH', 'THOMAS', 'CHRISTOPHER', 'DANIEL', 'PAUL', 'MARK', 'DONALD', 'GEORGE', 'KENNETH']
+LAST_NAMES = ['SMITH', 'JOHNSON', 'WILLIAMS', 'JONES', 'BROWN', 'DAVIS', 'MILLER', 'WILSON', 'MOORE', 'TAYLOR', 'ANDERSON', 'THOMAS',
+              'JACKSON', 'WHITE', 'HARRIS', 'MARTIN', 'THOMPSON', 'GARCIA', 'MARTINEZ', 'ROBINSON', 'CLARK', 'RODRIGUEZ', 'LEWIS', 'LEE']
+TITLE_WORDS = ['ACADEMY', 'DINOSAUR', 'ACE', 'GOLDFINGER', 'ADAPTATION', 'HOLES', 'AFFAIR', 'PREJUDICE', 'AFRICAN', 'EGG', 'AGENT', 'TRUMAN',
+               'AIRPLANE', 'SIERRA', 'AIRPORT', 'POLLOCK', 'ALABAMA', 'DEVIL', 'ALADDIN', 'CALENDAR', 'ALAMO', 'VIDEOTAPE', 'ALASKA', 'PHANTOM']
+RATINGS = ['G', 'PG', 'PG-13', 'R', 'NC-17']
+SPECIAL_FEATURES = ['Trailers', 'Commentaries', 'Deleted Scenes', 'Behind the Scenes']
+RENTAL_RATES = [Decimal('0.99'), Decimal('2.99'), Decimal('4.99')]
+# Share of the customers who are inactive and of the rentals not returned yet, as in the Sakila data
+INACTIVE_SHARE = 0.025
+UNRETURNED_SHARE = 0.011
+
+# Keys of the stock Sakila schema (sql_files/01_sakila-schema.sql) too narrow for the larger scales: largest id, wider type,
+# and the columns holding the key (the primary key first). See widen_keys().
+NARROW_KEYS = {
+    'actor': (65535, 'MEDIUMINT UNSIGNED', [('actor', 'actor_id'), ('film_actor', 'actor_id')]),
+    'film': (65535, 'MEDIUMINT UNSIGNED', [('film', 'film_id'), ('film_actor', 'film_id'), ('film_category', 'film_id'),
+                                            ('film_text', 'film_id'), ('inventory', 'film_id')]),
+    'customer': (65535, 'MEDIUMINT UNSIGNED', [('customer', 'customer_id'), ('payment', 'customer_id'), ('rental', 'customer_id')]),
+    'payment': (65535, 'INT UNSIGNED', [('payment', 'payment_id')]),
+}
+
+
+def scaled_volumes(scale):
+    """
+    Returns the number of rows to generate for each scaled table (at least one).
+    """
+    return {table: max(1, round(volume * scale)) for table, volume in SAKILA_VOLUMES.items()}
+
+
+def _next_id(table, column):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MAX({connection.ops.quote_name(column)}) FROM {connection.ops.quote_name(table)}')
+        return (cursor.fetchone()[0] or 0) + 1
+
+
+def _ids(table, column):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {connection.ops.quote_name(column)} FROM {connection.ops.quote_name(table)}')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _adapt(value):
+    if isinstance(value, datetime):
+        return connection.ops.adapt_datetimefield_value(value)
+    return value
+
+
+def insert_rows(table, columns, rows, batch_size=BATCH_SIZE):
+    """
+    Inserts rows with multi-row INSERTs, leaving out the columns the table does not have.
+
+    Args:
+        table (str): Table name.
+        columns (list): Names of the columns of the rows.
+        rows (iterable): Tuples of values, in the order of 'columns'. Consumed one batch at a time.
+        batch_size (int): Number of rows per INSERT.
+
+    Returns:
+        int: The number of rows inserted.
+    """
+    with connection.cursor() as cursor:
+        existing = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+    kept = [index for index, column in enumerate(columns) if column in existing]
+    quote = connection.ops.quote_name
+    sql = (f'INSERT INTO {quote(table)} ({", ".join(quote(columns[index]) for index in kept)}) '
+           f'VALUES ({", ".join(["%s"] * len(kept))})')
+    inserted = 0
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, [[_adapt(row[index]) for index in kept] for row in batch])
+        inserted += len(batch)
+    return inserted
+
+
+def check_key_capacity(volumes):
+    """
+    Checks that the generated ids fit in the keys of the stock Sakila schema (MySQL only).
+
+    Raises:
+        ValueError: If a key would overflow; widen_keys() makes room for them.
+    """
+    if connection.vendor != 'mysql':
+        return
+    generated = {**volumes, 'payment': volumes['rental']}
+    overflows = []
+    for table, (capacity, _, columns) in NARROW_KEYS.items():
+        last_id = _next_id(table, columns[0][1]) - 1 + generated[table]
+        if last_id > capacity:
+            overflows.append(f'{table} ({last_id} > {capacity})')
+    if overflows:
+        raise ValueError(f'Generated ids would overflow the keys of {", ".join(overflows)}; widen the keys first')
+
+
+def widen_keys():
+    """
+    Alters the narrow keys of the stock Sakila schema to wider integer types (MySQL only), so that they hold the larger scales.
+    The columns referencing a key are altered along with it, with the foreign key checks disabled meanwhile.
+    Only meant for benchmark databases: it rewrites the tables.
+    """
+    if connection.vendor != 'mysql':
+        return
+    tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+        try:
+            for _, column_type, columns in NARROW_KEYS.values():
+                for index, (column_table, column) in enumerate(columns):
+                    if column_table in tables:
+                        extra = ' AUTO_INCREMENT' if index == 0 else ''
+                        cursor.execute(f'ALTER TABLE `{column_table}` MODIFY `{column}` {column_type} NOT NULL{extra}')
+        finally:
+            cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+
+
+def _ensure_dimensions():
+    """
+    Creates the Sakila languages, categories, stores and staff if the database has none.
+    """
+    if not Language.objects.exists():
+        Language.objects.bulk_create([Language(language_id=index, name=name) for index, name in enumerate(LANGUAGES, 1)])
+    if not Category.objects.exists():
+        Category.objects.bulk_create([Category(category_id=index, name=name) for index, name in enumerate(CATEGORIES, 1)])
+    if not Staff.objects.exists():
+        Staff.objects.bulk_create([
+            Staff(staff_id=1, first_name='Mike', last_name='Hillyer', active=True),
+            Staff(staff_id=2, first_name='Jon', last_name='Stephens', active=True),
+        ])
+    if not Store.objects.exists():
+        Store.objects.bulk_create([Store(store_id=index, manager_staff_id=index, address_id=index) for index in (1, 2)])
+
+
+def _random_date(rng):
+    start, end = RENTAL_PERIOD
+    return start + timedelta(seconds=rng.randrange(int((end - start).total_seconds())))
+
+
+def generate_data(scale=1, seed=0, batch_size=BATCH_SIZE, widen=False):
+    """
+    Adds Sakila-shaped data to the database, then rebuilds the rollups and the name search index.
+
+    Args:
+        scale (float): Multiple of the Sakila volumes to generate (see SAKILA_VOLUMES).
+        seed (int): Seed of the random generator.
+        batch_size (int): Number of rows per INSERT.
+        widen (bool): Widens the narrow keys of the stock Sakila schema first (see widen_keys()) instead of checking their capacity.
+
+    Returns:
+        dict: The number of rows inserted into each table.
+
+    Raises:
+        ValueError: If the generated ids do not fit in the keys of the stock Sakila schema and 'widen' is False.
+    """
+    rng = random.Random(seed)
+    volumes = scaled_volumes(scale)
+    if widen:
+        widen_keys()
+    else:
+        check_key_capacity(volumes)
+    _ensure_dimensions()
+    now = django_timezone.now()
+
+    language_ids = list(Language.objects.values_list('language_id', flat=True))
+    category_ids = list(Category.objects.values_list('category_id', flat=True))
+    store_ids = list(Store.objects.values_list('store_id', flat=True))
+    staff_ids = list(Staff.objects.values_list('staff_id', flat=True))
+    # The Sakila customer table references an address (the models do not map it)
+    address_ids = _ids('address', 'address_id') if 'address' in connection.introspection.table_names() else [None]
+
+    counts = {}
+    first_actor = _next_id('actor', 'actor_id')
+    actor_ids = list(range(first_actor, first_actor + volumes['actor']))
+    counts['actor'] = insert_rows('actor', ['actor_id', 'first_name', 'last_name', 'last_update'], (
+        (actor_id, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), now) for actor_id in actor_ids
+    ), batch_size)
+
+    first_film = _next_id('film', 'film_id')
+    film_ids = list(range(first_film, first_film + volumes['film']))
+    counts['film'] = insert_rows('film', [
+        'film_id', 'title', 'description', 'release_year', 'language_id', 'rental_duration', 'rental_rate', 'length',
+        'replacement_cost', 'rating', 'special_features', 'last_update',
+    ], (
+        (film_id, f'{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)} {film_id}', 'A Generated Drama of a Benchmark', 2006,
+         rng.choice(language_ids), rng.randint(3, 7), rng.choice(RENTAL_RATES), rng.randint(46, 185),
+         Decimal(rng.randint(9, 29)) + Decimal('0.99'), rng.choice(RATINGS),
+         ','.join(sorted(rng.sample(SPECIAL_FEATURES, rng.randint(1, 3)))), now)
+        for film_id in film_ids
+    ), batch_size)
+    # 1 to 10 actors per film: about 5.5 on average, as in Sakila
+    counts['film_actor'] = insert_rows('film_actor', ['actor_id', 'film_id', 'last_update'], (
+        (actor_id, film_id, now)
+        for film_id in film_ids for actor_id in rng.sample(actor_ids, min(len(actor_ids), rng.randint(1, 10)))
+    ), batch_size)
+    counts['film_category'] = insert_rows('film_category', ['film_id', 'category_id', 'last_update'], (
+        (film_id, rng.choice(category_ids), now) for film_id in film_ids
+    ), batch_size)
+
+    first_inventory = _next_id('inventory', 'inventory_id')
+    inventory_ids = list(range(first_inventory, first_inventory + volumes['inventory']))
+    counts['inventory'] = insert_rows('inventory', ['inventory_id', 'film_id', 'store_id', 'last_update'], (
+        (inventory_id, rng.choice(film_ids), rng.choice(store_ids), now) for inventory_id in inventory_ids
+    ), batch_size)
+
+    first_customer = _next_id('customer', 'customer_id')
+    customer_ids = list(range(first_customer, first_customer + volumes['customer']))
+    counts['customer'] = insert_rows('customer', [
+        'customer_id', 'store_id', 'first_name', 'last_name', 'email', 'address_id', 'active', 'create_date', 'last_update',
+    ], (
+        (customer_id, rng.choice(store_ids), first_name, last_name, f'{first_name}.{last_name}@sakilacustomer.org',
+         rng.choice(address_ids), rng.random() >= INACTIVE_SHARE, RENTAL_PERIOD[0], now)
+        for customer_id in customer_ids
+        for first_name, last_name in [(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))]
+    ), batch_size)
+
+    first_rental = _next_id('rental', 'rental_id')
+    first_payment = _next_id('payment', 'payment_id')
+    rentals, payments = [], []
+    for index in range(volumes['rental']):
+        rental_id = first_rental + index
+        rental_date = _random_date(rng)
+        return_date = None if rng.random() < UNRETURNED_SHARE else rental_date + timedelta(hours=rng.randint(24, 240))
+        customer_id, staff_id = rng.choice(customer_ids), rng.choice(staff_ids)
+        rentals.append((rental_id, rental_date, rng.choice(inventory_ids), customer_id, return_date, staff_id, now))
+        payments.append((first_payment + index, customer_id, staff_id, rental_id, rng.choice(RENTAL_RATES) + rng.randint(0, 5),
+                         rental_date + timedelta(minutes=rng.randint(0, 60)), now))
+        if len(rentals) == batch_size or index == volumes['rental'] - 1:
+            counts['rental'] = counts.get('rental', 0) + insert_rows('rental', [
+                'rental_id', 'rental_date', 'inventory_id', 'customer_id', 'return_date', 'staff_id', 'last_update',
+            ], rentals, batch_size)
+            counts['payment'] = counts.get('payment', 0) + insert_rows('payment', [
+                'payment_id', 'customer_id', 'staff_id', 'rental_id', 'amount', 'payment_date', 'last_update',
+            ], payments, batch_size)
+            rentals, payments = [], []
+
+    rebuild_rollups()
+    rebuild_name_index()
+    return counts
@@ -0,0 +1,174 @@
+import json
+import random
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.test import Client
+from django.urls import reverse
+from films.views import CHART_ENDPOINTS
+from users.models import Customer
+
+# Load test of the app's main endpoints at a given concurrency, reporting latency percentiles and throughput as JSON.
+# Requests go through the Django test client from several threads, each request being surrounded by the connection handling
+# a server does at the start and end of every request (close_old_connections), against the configured database.
+# The latency of a request covers the whole response, including the body of streaming responses; the network is not measured.
+#
+# Scenarios:
+# - dashboard: the films dashboard page, then the data of each of its charts, in turn (FilmDashboardView and ChartDataView).
+# - user_list: the first page of the user lists (UserListView).
+# - update_status: status changes of random customers (UpdateUserStatusView).
+#
+# Errors are the responses with an error status, and the chart data degraded to an empty chart with a 200 status
+# (a chart that failed or timed out, see films/executor.py), which are also counted separately as 'unavailable'.
+
+PERCENTILES = (50, 95, 99)
+
+
+def client():
+    """
+    Returns a test client addressing its requests to the first allowed host, as a server would receive them.
+    """
+    return Client(HTTP_HOST=next(iter(settings.ALLOWED_HOSTS), 'localhost'))
+
+
+def send(client, method, path, data=None):
+    """
+    Sends one request as a server would serve it, reading the whole response body. Returns the response.
+    """
+    close_old_connections()  # request_started
+    if data is None:
+        response = getattr(client, method)(path)
+    else:
+        response = getattr(client, method)(path, json.dumps(data), content_type='application/json')
+    if response.streaming:
+        b''.join(response.streaming_content)
+    response.close()
+    close_old_connections()  # request_finished
+    return response
+
+
+def is_unavailable(response):
+    """
+    Returns whether a response is chart data degraded to an empty chart ({"unavailable": true}, sent with a 200 status).
+    """
+    if response.streaming or not response.get('Content-Type', '').startswith('application/json'):
+        return False
+    data = json.loads(response.content)
+    return isinstance(data, dict) and bool(data.get('unavailable'))
+
+
+def run_workers(total, concurrency, work):
+    """
+    Calls work(count, offset) from 'concurrency' threads, the 'total' iterations being split between them.
+
+    Returns:
+        float: The elapsed time in seconds.
+    """
+    def worker(count, offset):
+        try:
+            work(count, offset)
+        finally:
+            connections.close_all()
+
+    counts = [total // concurrency + (1 if index < total % concurrency else 0) for index in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(count, index)) for index, count in enumerate(counts)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def percentile(values, rank):
+    """
+    Returns the nearest-rank percentile of sorted values, or None if there are none.
+    """
+    if not values:
+        return None
+    return values[max(0, -(-rank * len(values) // 100) - 1)]
+
+
+def dashboard_requests():
+    """
+    Returns the requests of the dashboard scenario, as (method, path, data) tuples.
+    """
+    return [('get', reverse('film_dashboard'), None)] + [
+        ('get', reverse('film_chart_data', args=[chart]), None) for chart in CHART_ENDPOINTS
+    ]
+
+
+def user_list_requests():
+    return [('get', reverse('api_user_list'), None)]
+
+
+def update_status_requests(count=100, seed=0):
+    """
+    Returns the requests of the status update scenario: 'count' status changes of random customers.
+    """
+    rng = random.Random(seed)
+    customer_ids = list(Customer.objects.values_list('customer_id', flat=True)[:10000])
+    if not customer_ids:
+        return []
+    return [
+        ('patch', reverse('api_update_status'), {'id': rng.choice(customer_ids), 'type': 'customer', 'active': rng.random() < 0.5})
+        for _ in range(count)
+    ]
+
+
+SCENARIOS = {
+    'dashboard': dashboard_requests,
+    'user_list': user_list_requests,
+    'update_status': update_status_requests,
+}
+
+
+def run_load(requests, total, concurrency):
+    """
+    Sends 'total' requests, cycling through 'requests', from 'concurrency' threads.
+
+    Args:
+        requests (list): (method, path, data) tuples; 'data' is sent as a JSON body when not None.
+        total (int): Number of requests to send.
+        concurrency (int): Number of client threads.
+
+    Returns:
+        dict: 'requests' sent, 'errors' (responses with an error status or unavailable chart data),
+            'unavailable' (unavailable chart data, see is_unavailable()), 'seconds' elapsed, 'requests_per_second',
+            and the 'latency_ms' percentiles ('p50', 'p95', 'p99'), 'mean' and 'max' of the requests.
+    """
+    latencies, errors, unavailable = [], [], []
+    lock = threading.Lock()
+
+    def work(count, offset):
+        thread_client = client()
+        thread_latencies, thread_errors, thread_unavailable = [], [], []
+        for index in range(count):
+            method, path, data = requests[(offset + index * concurrency) % len(requests)]
+            start = time.perf_counter()
+            response = send(thread_client, method, path, data)
+            thread_latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                thread_errors.append(response.status_code)
+            elif is_unavailable(response):
+                thread_errors.append(response.status_code)
+                thread_unavailable.append(path)
+        with lock:
+            latencies.extend(thread_latencies)
+            errors.extend(thread_errors)
+            unavailable.extend(thread_unavailable)
+
+    seconds = run_workers(total, concurrency, work)
+    latencies.sort()
+    latency_ms = {f'p{rank}': percentile(latencies, rank) * 1000 if latencies else None for rank in PERCENTILES}
+    latency_ms['mean'] = sum(latencies) / len(latencies) * 1000 if latencies else None
+    latency_ms['max'] = latencies[-1] * 1000 if latencies else None
+    return {
+        'requests': total,
+        'errors': len(errors),
+        'unavailable': len(unavailable),
+        'seconds': seconds,
+        'requests_per_second': total / seconds if seconds else 0.0,
+        'latency_ms': latency_ms,
+    }
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from assignment_project.pooled_mysql.pool import pool_stats
+from benchmarks.connections import connection_reuse, run_requests
+
+
+class Command(BaseCommand):
+    """
+    Management command comparing the requests per second of the app with and without database connection reuse.
+
+    Usage: python manage.py benchmark_connections [--requests 500] [--concurrency 8] [--url /api/users/ ...]
+    """
+    help = 'Measures requests per second with and without persistent or pooled database connections.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Number of requests of each run (default 500).')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent client threads (default 8).')
+        parser.add_argument('--url', action='append', dest='urls',
+                            help='URL to request (repeatable). Defaults to the user list and a dashboard chart.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        urls = options['urls'] or [reverse('api_user_list'), reverse('film_chart_data', args=['bar'])]
+        self.stdout.write(f"Database: {connection.vendor} ({connection.settings_dict['ENGINE']}), "
+                          f"{options['requests']} requests per run, {options['concurrency']} threads")
+
+        # Warm-up run, so that caches and lazily built state do not favor the second run
+        with connection_reuse(True):
+            run_requests(urls, options['concurrency'], options['concurrency'])
+
+        results = {}
+        for label, enabled in (('without reuse', False), ('with reuse', True)):
+            with connection_reuse(enabled):
+                results[label] = run_requests(urls, options['requests'], options['concurrency'])
+                stats = pool_stats().get(connection.alias) if enabled else None
+            result = results[label]
+            self.stdout.write(f"{label}: {result['requests_per_second']:.1f} requests/s "
+                              f"({result['seconds']:.2f}s, {result['errors']} errors)")
+            if stats:
+                self.stdout.write(f'pool: {stats}')
+
+        baseline = results['without reuse']['requests_per_second']
+        if baseline:
+            self.stdout.write(self.style.SUCCESS(f"Speedup with reuse: {results['with reuse']['requests_per_second'] / baseline:.2f}x"))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from benchmarks.plans import plan_probes, run_plan_checks
+
+
+class Command(BaseCommand):
+    """
+    Management command checking the MySQL query plans of the dashboard, user list and status update endpoints (see benchmarks/plans.py).
+    Exits with an error if a plan regressed, e.g. in CI against a MySQL container loaded from sql_files/.
+
+    Usage: python manage.py check_query_plans [--probe bar_chart ...] [--verbose-plans]
+    """
+    help = 'Checks the EXPLAIN plans of the main endpoints for unexpected scans, indexes, row estimates, filesorts and temporary tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--probe', action='append', dest='probes', help='Probe to run (repeatable). Defaults to every probe.')
+        parser.add_argument('--verbose-plans', action='store_true', help='Prints the table accesses of every statement.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'mysql':
+            raise CommandError(f'Query plans are checked on MySQL, not {connection.vendor}')
+        probes = plan_probes()
+        if options['probes']:
+            unknown = set(options['probes']) - {probe.name for probe in probes}
+            if unknown:
+                raise CommandError(f'Unknown probes: {", ".join(sorted(unknown))}')
+            probes = [probe for probe in probes if probe.name in options['probes']]
+
+        try:
+            reports = run_plan_checks(probes)
+        except AssertionError as e:
+            raise CommandError(e)
+        regressions = 0
+        for report in reports:
+            if report.violations or options['verbose_plans']:
+                self.stdout.write(f'[{report.probe}] {" ".join(report.sql.split())[:200]}')
+                for access in report.accesses:
+                    self.stdout.write(f'    {access.table}: {access.access_type} via {access.key or "-"}, ~{access.rows} rows')
+                for violation in report.violations:
+                    self.stdout.write(self.style.ERROR(f'    {violation}'))
+            regressions += bool(report.violations)
+        if regressions:
+            raise CommandError(f'{regressions} of {len(reports)} statements have unexpected plans')
+        self.stdout.write(self.style.SUCCESS(f'{len(reports)} statements of {len(probes)} probes have the expected plans'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from benchmarks.datagen import BATCH_SIZE, generate_data
+
+
+class Command(BaseCommand):
+    """
+    Management command adding synthetic Sakila-shaped data to the database, at a multiple of the Sakila volumes.
+
+    Usage: python manage.py generate_sakila_data [--scale 10] [--seed 0] [--batch-size 5000] [--widen-keys]
+    """
+    help = 'Adds Sakila-shaped data at a multiple of the sample database volumes (for benchmarks and load tests).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1, help='Multiple of the Sakila volumes to generate (default 1).')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default 0).')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f'Rows per INSERT (default {BATCH_SIZE}).')
+        parser.add_argument('--widen-keys', action='store_true',
+                            help='Widens the SMALLINT keys of the stock Sakila schema first (MySQL; needed once generated ids exceed 65535).')
+
+    def handle(self, *args, **options):
+        if options['scale'] <= 0:
+            raise CommandError('--scale must be positive')
+        self.stdout.write(f"Generating {options['scale']:g}x the Sakila volumes into {connection.vendor} ({connection.settings_dict['NAME']})")
+        try:
+            counts = generate_data(options['scale'], options['seed'], options['batch_size'], options['widen_keys'])
+        except ValueError as e:
+            raise CommandError(e)
+        for table, count in counts.items():
+            self.stdout.write(f'{table}: {count} rows')
+        self.stdout.write(self.style.SUCCESS('Rollups and name search index rebuilt'))
@@ -0,0 +1,45 @@
+import json
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from benchmarks.load import SCENARIOS, run_load
+
+
+class Command(BaseCommand):
+    """
+    Management command load testing the app's main endpoints and reporting latency percentiles and throughput as JSON.
+
+    Usage: python manage.py load_test [--scenario dashboard ...] [--requests 200] [--concurrency 8] [--output results.json]
+    """
+    help = 'Load tests the dashboard, user list and status update endpoints; prints p50/p95/p99 latencies and throughput as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=list(SCENARIOS),
+                            help='Scenario to run (repeatable). Defaults to every scenario.')
+        parser.add_argument('--requests', type=int, default=200, help='Number of requests of each scenario (default 200).')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent client threads (default 8).')
+        parser.add_argument('--output', help='File to write the JSON report to, instead of the standard output.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        report = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'database': {'vendor': connection.vendor, 'engine': connection.settings_dict['ENGINE']},
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'scenarios': {},
+        }
+        for name in options['scenarios'] or SCENARIOS:
+            requests = SCENARIOS[name]()
+            if not requests:
+                raise CommandError(f'Nothing to request for the {name} scenario; generate data first (generate_sakila_data)')
+            report['scenarios'][name] = run_load(requests, options['requests'], options['concurrency'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,237 @@
+import json
+from collections import namedtuple
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+from films.views import CHART_ENDPOINTS
+from .load import client
+
+# Query plan regression checks, against MySQL (EXPLAIN FORMAT=JSON).
+# Each probe sends one request to the app and captures the SQL statements it runs (SELECT, UPDATE and DELETE, with their parameters)
+# on every database alias, including the analytics replica the dashboard and user list reads go to (see assignment_project/routers.py).
+# Every statement is then explained on the database it ran on, and the table accesses of its plan are checked against the probe's expectation:
+# - tables read through a given index must use it,
+# - only the small tables listed as such may be read by a full table or index scan,
+# - the estimated rows examined per scan must stay under a bound,
+# - filesorts and temporary tables are only allowed over the tables listed as such.
+# Sorts and temporary tables over derived tables or union results (already limited intermediate results) are not checked.
+#
+# The expectations match the Sakila sample database (sql_files/) with the migrations applied, at its original volumes.
+# Probes run in a transaction rolled back afterwards, without the dashboard cache (so that the charts are built) and with
+# the dashboard charts built on the request's connection.
+
+# Access types of full table scans and full index scans
+SCAN_ACCESS_TYPES = {'ALL', 'index'}
+# Plan keys holding the query blocks of subqueries and unions: the tables below them belong to another block
+NESTED_BLOCKS = {
+    'query_block', 'query_specifications', 'materialized_from_subquery', 'attached_subqueries', 'select_list_subqueries',
+    'optimized_away_subqueries', 'having_subqueries', 'order_by_subqueries', 'group_by_subqueries',
+}
+# Statements that are explained
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+# One table access of a plan: table name, access type ('const', 'ref', 'range', 'index', 'ALL', ...), index used and estimated rows per scan
+TableAccess = namedtuple('TableAccess', ['table', 'access_type', 'key', 'rows'])
+
+# Filesort or temporary table of a plan ('filesort' or 'temporary'), with the base tables whose rows it holds
+PlanOperation = namedtuple('PlanOperation', ['kind', 'tables'])
+
+# Expected plans of the statements of a probe:
+# - indexes: table -> name of the index the table must be read through (or a tuple of the acceptable ones).
+# - scans: tables that may be read by a full table or index scan.
+# - max_rows: largest estimated number of rows examined per scan of a table.
+# - filesort / temporary: tables whose rows may be sorted / held in a temporary table.
+PlanExpectation = namedtuple('PlanExpectation', ['indexes', 'scans', 'max_rows', 'filesort', 'temporary'],
+                             defaults=[{}, (), 1000, (), ()])
+
+# Request of a probe ('data' sent as a JSON body when not None) and the expected plans of its statements
+PlanProbe = namedtuple('PlanProbe', ['name', 'method', 'path', 'data', 'expectation'])
+
+# Checked statement of a probe: SQL, table accesses and the violations of the expectation (empty if the plan is as expected)
+PlanReport = namedtuple('PlanReport', ['probe', 'sql', 'accesses', 'violations'])
+
+# Small tables of the data version probe (see films/cache.py): COUNT(*) and MAX(last_update) scan them
+VERSION_PROBE_SCANS = ('film', 'category', 'film_category', 'film_rollup', 'category_rollup', 'category_language_rollup')
+
+
+def plan_probes():
+    """
+    Returns the probes of the dashboard, user list and status update endpoints, with their expected plans.
+    """
+    chart = {name: reverse('film_chart_data', args=[name]) for name in CHART_ENDPOINTS}
+    # The revenue series is only read by the charts (it is refreshed on the write path, see films/timeseries.py)
+    revenue_series = PlanExpectation(scans=VERSION_PROBE_SCANS + ('monthly_store_revenue',))
+    user_list = PlanExpectation(indexes={'customer': 'idx_customer_active_update', 'staff': 'idx_staff_active_update'})
+    status_update = PlanExpectation(indexes={'customer': 'PRIMARY'}, max_rows=1)
+    return [
+        PlanProbe('film_dashboard', 'get', reverse('film_dashboard'), None, PlanExpectation()),
+        # Top films from the film rollup, read in order from idx_film_rollup_rentals / idx_film_rollup_revenue (no sort)
+        PlanProbe('bar_chart', 'get', chart['bar'], None, PlanExpectation(scans=VERSION_PROBE_SCANS)),
+        PlanProbe('pie_chart', 'get', chart['pie'], None, revenue_series),
+        PlanProbe('line_chart', 'get', chart['line'], None, revenue_series),
+        PlanProbe('clustered_bar_chart', 'get', chart['clustered-bar'], None, PlanExpectation(scans=VERSION_PROBE_SCANS)),
+        # Unique customers: COUNT(*) of the customers scans the smallest customer index
+        PlanProbe('donut_chart', 'get', chart['donut'], None, PlanExpectation(scans=VERSION_PROBE_SCANS + ('customer',))),
+        PlanProbe('scatter_plot', 'get', chart['scatter'], None, PlanExpectation(scans=VERSION_PROBE_SCANS)),
+        # Filtered chart: the payments of the period through the (payment_date, rental_id, amount) index, then their rentals and inventory
+        PlanProbe('bar_chart_filtered', 'get', f"{chart['bar']}?from=2005-06-01&to=2005-06-30&store=1", None, PlanExpectation(
+            indexes={'payment': 'idx_payment_date_rental', 'rental': 'PRIMARY', 'inventory': 'PRIMARY'},
+            scans=VERSION_PROBE_SCANS + ('film',), max_rows=5000, temporary=('payment', 'rental', 'inventory'),
+        )),
+        PlanProbe('api_user_list', 'get', reverse('api_user_list'), None, user_list),
+        # Short name search: the users are read in list order, each one checked against the gram index (no grouping)
+        PlanProbe('api_user_list_search', 'get', f"{reverse('api_user_list')}?search=mar", None, user_list._replace(
+            indexes={**user_list.indexes, 'user_name_gram': 'idx_user_name_gram'},
+        )),
+        # Longer name search: the candidates come from the gram index, grouped per user (the users may then be read by primary key)
+        PlanProbe('api_user_list_search_long', 'get', f"{reverse('api_user_list')}?search=mary", None, user_list._replace(
+            indexes={
+                'customer': ('idx_customer_active_update', 'PRIMARY'),
+                'staff': ('idx_staff_active_update', 'PRIMARY'),
+                'user_name_gram': 'idx_user_name_gram',
+            },
+            temporary=('user_name_gram',),
+        )),
+        PlanProbe('api_update_status', 'patch', reverse('api_update_status'),
+                  {'id': 1, 'type': 'customer', 'active': True}, status_update),
+        PlanProbe('api_update_status_guarded', 'patch', reverse('api_update_status'),
+                  {'id': 1, 'type': 'customer', 'active': True, 'last_update': '2006-02-15T04:57:20Z'}, status_update),
+    ]
+
+
+def plan_details(plan):
+    """
+    Returns the table accesses and the filesorts and temporary tables of an EXPLAIN FORMAT=JSON plan.
+
+    Returns:
+        tuple: The list of TableAccess and the list of PlanOperation of the plan, including its subqueries.
+    """
+    accesses, operations = [], []
+    _walk(plan, accesses, operations)
+    return accesses, operations
+
+
+def _walk(node, accesses, operations):
+    """
+    Collects the table accesses and operations of a plan node. Returns the tables read in the node's query block.
+    """
+    if isinstance(node, list):
+        return [table for item in node for table in _walk(item, accesses, operations)]
+    if not isinstance(node, dict):
+        return []
+    tables = []
+    if 'table_name' in node:
+        accesses.append(TableAccess(node['table_name'], node.get('access_type'), node.get('key'), node.get('rows_examined_per_scan')))
+        tables.append(node['table_name'])
+    for key, value in node.items():
+        block_tables = _walk(value, accesses, operations)
+        if key not in NESTED_BLOCKS:
+            tables += block_tables
+    for flag, kind in (('using_filesort', 'filesort'), ('using_temporary_table', 'temporary')):
+        if node.get(flag):
+            operations.append(PlanOperation(kind, tuple(table for table in tables if not _is_derived(table))))
+    return tables
+
+
+def _is_derived(table):
+    # Derived tables, union results and materialized subqueries are named <derived2>, <union1,2>, <subquery2>, ...
+    return table.startswith('<')
+
+
+def check_plan(plan, expectation):
+    """
+    Returns the ways a plan violates an expectation, as messages (empty if none).
+    """
+    accesses, operations = plan_details(plan)
+    violations = []
+    for access in accesses:
+        if _is_derived(access.table):
+            continue
+        expected_keys = expectation.indexes.get(access.table)
+        if isinstance(expected_keys, str):
+            expected_keys = (expected_keys,)
+        if expected_keys is not None and access.key not in expected_keys:
+            violations.append(f'{access.table} is read through {access.key or "no index"} instead of {" or ".join(expected_keys)}')
+        if access.access_type in SCAN_ACCESS_TYPES and access.table not in expectation.scans:
+            violations.append(f'{access.table} is read by a full {"table" if access.access_type == "ALL" else "index"} scan')
+        if access.rows is not None and access.rows > expectation.max_rows:
+            violations.append(f'{access.table} examines about {access.rows} rows per scan (at most {expectation.max_rows} expected)')
+    for operation in operations:
+        allowed = expectation.filesort if operation.kind == 'filesort' else expectation.temporary
+        unexpected = [table for table in operation.tables if table not in allowed]
+        if unexpected:
+            violations.append(f'{"filesort" if operation.kind == "filesort" else "temporary table"} over {", ".join(unexpected)}')
+    return violations
+
+
+def capture_statements(probe):
+    """
+    Sends the request of a probe and returns the statements it ran, as (alias, sql, params) tuples, 'alias' being the database
+    they ran on. Must be called within the transaction the statements are then explained in (see run_plan_checks()).
+    """
+    statements = []
+
+    def recorder(alias):
+        def record(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+                statements.append((alias, sql, params))
+            return execute(sql, params, many, context)
+        return record
+
+    with ExitStack() as stack:
+        # Every alias, so that the reads routed to the analytics replica are captured as well
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder(alias)))
+        send = getattr(client(), probe.method)
+        if probe.data is None:
+            response = send(probe.path)
+        else:
+            response = send(probe.path, json.dumps(probe.data), content_type='application/json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        response.close()
+    # Missing users and conflicting updates still run the statements being checked
+    if response.status_code >= 400 and response.status_code not in (404, 409):
+        raise AssertionError(f'{probe.name}: {probe.method.upper()} {probe.path} returned {response.status_code}')
+    return statements
+
+
+def explain(sql, params, using=DEFAULT_DB_ALIAS):
+    """
+    Returns the EXPLAIN FORMAT=JSON plan of a statement, as a dict.
+
+    Args:
+        sql (str): Statement to explain.
+        params: Parameters of the statement.
+        using (str): Alias of the database the statement ran on.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'EXPLAIN FORMAT=JSON {sql.strip().rstrip(";")}', params)
+        return json.loads(cursor.fetchone()[0])
+
+
+def run_plan_checks(probes=None):
+    """
+    Runs probes and checks the plans of their statements.
+
+    Args:
+        probes (list): PlanProbe to run. Defaults to plan_probes().
+
+    Returns:
+        list: A PlanReport per statement run by the probes.
+
+    Raises:
+        AssertionError: If a probe request fails.
+    """
+    no_dashboard_cache = {**settings.CACHES, 'dashboard': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    reports = []
+    with override_settings(CACHES=no_dashboard_cache, DASHBOARD_QUERY_WORKERS=0):
+        for probe in probes or plan_probes():
+            with transaction.atomic():
+                for alias, sql, params in capture_statements(probe):
+                    plan = explain(sql, params, using=alias)
+                    reports.append(PlanReport(probe.name, sql, plan_details(plan)[0], check_plan(plan, probe.expectation)))
+                transaction.set_rollback(True)
+    return reports
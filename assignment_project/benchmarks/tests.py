@@ -0,0 +1,214 @@
+from io import StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from films.charts import CHARTS
+from films.models import Film, FilmRollup, Payment, Rental
+from users.models import Customer, UserNameGram
+from .connections import connection_reuse, run_requests
+from .datagen import generate_data, scaled_volumes
+from .load import SCENARIOS, percentile, run_load
+from .plans import PlanExpectation, capture_statements, check_plan, plan_details, plan_probes
+
+
+class ConnectionBenchmarkTestCase(TransactionTestCase):
+    """
+    Test case for the connection reuse benchmark.
+    """
+
+    def test_run_requests(self):
+        """
+        Test that the benchmark sends every request successfully from several threads, and restores the connection settings.
+        """
+        Customer.objects.create(customer_id=1, first_name='Blue', last_name='Blue', active=True)
+        conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+        for enabled in (False, True):
+            with connection_reuse(enabled):
+                result = run_requests([reverse('api_user_list')], 6, 3)
+            self.assertEqual(result['requests'], 6)
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['requests_per_second'], 0)
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], conn_max_age)
+
+    def test_invalid_options(self):
+        """
+        Test that the benchmark command rejects a request count or concurrency below 1 instead of failing or hanging.
+        """
+        for options in ({'concurrency': 0}, {'concurrency': -2}, {'requests': 0}):
+            with self.subTest(**options), self.assertRaises(CommandError):
+                call_command('benchmark_connections', stdout=StringIO(), **options)
+
+
+class LoadTestTestCase(TransactionTestCase):
+    """
+    Test case for the Sakila data generator and the load test.
+    """
+
+    def test_generate_data(self):
+        """
+        Test that the generator inserts the scaled volumes and rebuilds the rollups and the name search index.
+        """
+        volumes = scaled_volumes(0.01)
+        counts = generate_data(scale=0.01)
+        self.assertEqual(counts['film'], volumes['film'])
+        self.assertEqual(Film.objects.count(), volumes['film'])
+        self.assertEqual(Rental.objects.count(), volumes['rental'])
+        self.assertEqual(Payment.objects.count(), volumes['rental'])
+        self.assertEqual(Customer.objects.count(), volumes['customer'])
+        self.assertTrue(FilmRollup.objects.exists())
+        self.assertTrue(UserNameGram.objects.filter(user_type='customer').exists())
+
+        # Generated ids continue after the existing rows
+        generate_data(scale=0.01, seed=1)
+        self.assertEqual(Film.objects.count(), 2 * volumes['film'])
+
+    def test_run_load(self):
+        """
+        Test that every scenario runs without errors and reports latency percentiles.
+        """
+        generate_data(scale=0.01)
+        for name, requests in SCENARIOS.items():
+            result = run_load(requests(), 8, 2)
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['unavailable'], 0, name)
+            self.assertEqual(result['requests'], 8)
+            latency = result['latency_ms']
+            self.assertLessEqual(latency['p50'], latency['p95'])
+            self.assertLessEqual(latency['p99'], latency['max'])
+
+    def test_unavailable_charts_are_errors(self):
+        """
+        Test that chart data degraded to an empty chart counts as an error, although it is sent with a 200 status.
+        """
+        generate_data(scale=0.01)
+        with mock.patch.dict(CHARTS, {'line_chart_data': mock.Mock(side_effect=RuntimeError('Lock wait timeout'))}):
+            with self.assertLogs('films.executor', 'ERROR'):
+                result = run_load(SCENARIOS['dashboard'](), 7, 1)
+        self.assertEqual(result['unavailable'], 1)
+        self.assertEqual(result['errors'], 1)
+
+    def test_percentile(self):
+        """
+        Test the nearest-rank percentiles.
+        """
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+
+# EXPLAIN FORMAT=JSON plan of a user list page (MySQL 8): each branch reads its newest users through the pagination index,
+# then the union result is sorted
+USER_LIST_PLAN = {
+    'query_block': {
+        'union_result': {
+            'using_temporary_table': True,
+            'table_name': '<union1,3>',
+            'query_specifications': [
+                {'query_block': {'select_id': 1, 'table': {
+                    'table_name': '<derived2>', 'access_type': 'ALL', 'rows_examined_per_scan': 51,
+                    'materialized_from_subquery': {'using_temporary_table': True, 'query_block': {'select_id': 2, 'ordering_operation': {
+                        'using_filesort': False,
+                        'table': {'table_name': 'customer', 'access_type': 'ref', 'key': 'idx_customer_active_update', 'rows_examined_per_scan': 584},
+                    }}},
+                }}},
+                {'query_block': {'select_id': 3, 'table': {
+                    'table_name': '<derived4>', 'access_type': 'ALL', 'rows_examined_per_scan': 2,
+                    'materialized_from_subquery': {'using_temporary_table': True, 'query_block': {'select_id': 4, 'ordering_operation': {
+                        'using_filesort': False,
+                        'table': {'table_name': 'staff', 'access_type': 'ref', 'key': 'idx_staff_active_update', 'rows_examined_per_scan': 2},
+                    }}},
+                }}},
+            ],
+        },
+    },
+}
+
+
+class QueryPlanTestCase(SimpleTestCase):
+    """
+    Test case for the query plan checks (the plans themselves are checked on MySQL by the check_query_plans command).
+    """
+
+    def test_plan_details(self):
+        """
+        Test that the table accesses of nested query blocks are collected, and the sorts of derived tables are not attributed to base tables.
+        """
+        accesses, operations = plan_details(USER_LIST_PLAN)
+        self.assertEqual([(access.table, access.key) for access in accesses if not access.table.startswith('<')],
+                         [('customer', 'idx_customer_active_update'), ('staff', 'idx_staff_active_update')])
+        self.assertTrue(all(operation.tables == () for operation in operations))
+
+    def test_expected_plan(self):
+        """
+        Test that a plan matching its expectation has no violations.
+        """
+        expectation = PlanExpectation(indexes={'customer': 'idx_customer_active_update', 'staff': 'idx_staff_active_update'})
+        self.assertEqual(check_plan(USER_LIST_PLAN, expectation), [])
+
+    def test_regressions(self):
+        """
+        Test that full scans, other indexes, large row estimates, filesorts and temporary tables over base tables are reported.
+        """
+        plan = {'query_block': {'grouping_operation': {
+            'using_temporary_table': True,
+            'using_filesort': True,
+            'nested_loop': [
+                {'table': {'table_name': 'payment', 'access_type': 'ALL', 'rows_examined_per_scan': 16049}},
+                {'table': {'table_name': 'rental', 'access_type': 'eq_ref', 'key': 'rental_date', 'rows_examined_per_scan': 1}},
+            ],
+        }}}
+        violations = check_plan(plan, PlanExpectation(indexes={'rental': 'PRIMARY'}, max_rows=5000))
+        self.assertEqual(violations, [
+            'payment is read by a full table scan',
+            'payment examines about 16049 rows per scan (at most 5000 expected)',
+            'rental is read through rental_date instead of PRIMARY',
+            'filesort over payment, rental',
+            'temporary table over payment, rental',
+        ])
+        allowed = PlanExpectation(indexes={'rental': 'rental_date'}, scans=('payment',), max_rows=20000,
+                                  filesort=('payment', 'rental'), temporary=('payment', 'rental'))
+        self.assertEqual(check_plan(plan, allowed), [])
+
+
+class QueryPlanCaptureTestCase(TestCase):
+    """
+    Test case for the capture of the statements run by the query plan probes.
+    """
+
+    def test_capture_statements(self):
+        """
+        Test that every probe request succeeds and its statements are captured, the status updates being made in the test's transaction.
+        """
+        Customer.objects.create(customer_id=1, first_name='Blue', last_name='Blue', active=False)
+        probes = {probe.name: probe for probe in plan_probes()}
+        self.assertEqual(capture_statements(probes['film_dashboard']), [])
+        statements = capture_statements(probes['api_user_list'])
+        self.assertTrue(any('UNION ALL' in sql for _, sql, _ in statements))
+        statements = capture_statements(probes['api_update_status'])
+        self.assertEqual([(alias, sql.split()[0]) for alias, sql, _ in statements], [('default', 'UPDATE')])
+
+
+@skipUnless('analytics' in settings.DATABASES, 'No analytics database configured')
+@override_settings(ANALYTICS_DATABASE='analytics')
+class QueryPlanReplicaCaptureTestCase(TransactionTestCase):
+    """
+    Test case for the capture of the statements the probes run on the analytics replica (the SQLite stand-in of the test settings).
+    Skipped with settings that have no 'analytics' database.
+    """
+    # The test runner sets up the databases of skipped test cases too
+    databases = {'default', 'analytics'} if 'analytics' in settings.DATABASES else {'default'}
+
+    def test_replica_statements_are_captured(self):
+        """
+        Test that the reads routed to the replica are captured with its alias, so that they are explained on it.
+        """
+        probes = {probe.name: probe for probe in plan_probes()}
+        statements = capture_statements(probes['api_user_list'])
+        self.assertTrue(statements)
+        self.assertEqual({alias for alias, _, _ in statements}, {'analytics'})
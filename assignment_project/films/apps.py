@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FilmsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'films'
+
+    def ready(self):
+        # Register the signal handlers maintaining the dashboard rollup tables
+        from . import signals  # noqa: F401
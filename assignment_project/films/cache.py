@@ -0,0 +1,107 @@
+import hashlib
+from collections import namedtuple
+from datetime import datetime, timezone
+from django.core.cache import caches
+from django.utils.dateparse import parse_datetime
+from assignment_project.metrics import record_cache_lookups
+from assignment_project.routers import read_connection
+from . import charts
+from .executor import build_charts
+from .filters import NO_FILTERS, cache_key
+
+# Versioned cache for the films dashboard chart data.
+# Every cache entry is keyed by a data version computed with one cheap probe query, so entries never need to be deleted:
+# as soon as the underlying data changes, the version changes and the charts are rebuilt under new keys.
+# Filtered charts are cached under the same version, with the filters as part of the key.
+# Stale entries expire after the TIMEOUT of the 'dashboard' cache or are evicted once its MAX_ENTRIES bound is reached (see settings.CACHES).
+
+CACHE_ALIAS = 'dashboard'
+KEY_PREFIX = 'films:dashboard'
+
+# Data version probe:
+# - MAX() of the fact table primary keys detects new payments, rentals and customers (index lookups, not scans).
+# - COUNT(*) and MAX(last_update) of the small dimension tables detect edited films and categories.
+# - MAX(last_update) of rental and inventory detects edited rentals (e.g. a rental moved to another inventory item) and inventory
+#   moved to another film or store, which change the filtered charts. Both are index lookups (idx_rental_last_update, idx_inventory_last_update).
+#   Their COUNT(*) is not probed: it would scan these tables on every chart request, and the charts only see the inventory through
+#   the rentals (new rentals are probed by MAX(rental_id)).
+# - MAX(last_update) of the rollup tables detects incremental updates and full rebuilds of the rollups the charts are built from.
+#   The monthly revenue series is not probed: it only changes with new payments (already probed) or with a full rebuild of the rollups.
+VERSION_QUERY = """
+SELECT
+    (SELECT MAX(payment_id) FROM payment),
+    (SELECT MAX(rental_id) FROM rental), (SELECT MAX(last_update) FROM rental),
+    (SELECT MAX(last_update) FROM inventory),
+    (SELECT MAX(customer_id) FROM customer),
+    (SELECT COUNT(*) FROM film), (SELECT MAX(last_update) FROM film),
+    (SELECT COUNT(*) FROM category), (SELECT MAX(last_update) FROM category),
+    (SELECT COUNT(*) FROM film_category), (SELECT MAX(last_update) FROM film_category),
+    (SELECT MAX(last_update) FROM film_rollup),
+    (SELECT MAX(last_update) FROM category_rollup),
+    (SELECT MAX(last_update) FROM category_language_rollup);
+"""
+
+
+# Result of the data version probe:
+# - key: short hash of the probe row, used in cache keys and as the ETag of the chart endpoints.
+# - last_modified: latest last_update among the probed tables (aware datetime or None), used as the Last-Modified of the chart endpoints.
+DataVersion = namedtuple('DataVersion', ['key', 'last_modified'])
+
+
+def _as_datetime(value):
+    """
+    Converts a MAX(last_update) value to an aware datetime.
+    Depending on the database backend, raw cursors return it as a naive datetime or as a string; it is stored in UTC either way.
+    """
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def data_version():
+    """
+    Runs the data version probe.
+
+    Returns:
+        DataVersion: The version key and last modification time of the dashboard data.
+    """
+    with read_connection().cursor() as cursor:
+        cursor.execute(VERSION_QUERY)
+        row = cursor.fetchone()
+    timestamps = [timestamp for timestamp in map(_as_datetime, row) if isinstance(timestamp, datetime)]
+    return DataVersion(
+        key=hashlib.md5(repr(row).encode()).hexdigest(),
+        last_modified=max(timestamps, default=None),
+    )
+
+
+def get_chart_data(names=None, version=None, filters=NO_FILTERS):
+    """
+    Returns the data of the requested charts, building only the charts missing from the cache (see films/executor.py).
+
+    Args:
+        names (list): Names of the charts to return (keys of films.charts.CHARTS). Defaults to every chart.
+        version (DataVersion): Data version to use, as returned by data_version(). Computed when not given.
+        filters (DashboardFilters): Dashboard filters to apply (see films/filters.py). Defaults to no filter.
+
+    Returns:
+        dict: The data of each requested chart by chart name.
+    """
+    dashboard_cache = caches[CACHE_ALIAS]
+    names = list(charts.CHARTS) if names is None else names
+    version = version or data_version()
+
+    keys = {name: f'{KEY_PREFIX}:{name}:{cache_key(filters)}:{version.key}' for name in names}
+    cached = dashboard_cache.get_many(keys.values())
+
+    chart_data = {name: cached[key] for name, key in keys.items() if key in cached}
+    record_cache_lookups(hits=len(chart_data), misses=len(names) - len(chart_data))
+    built = build_charts([name for name in names if keys[name] not in cached], filters)
+    chart_data.update(built)
+    # Charts that could not be built are returned empty but not cached, so the next request tries again
+    missing = {keys[name]: data for name, data in built.items() if not data.get('unavailable')}
+    if missing:
+        dashboard_cache.set_many(missing)
+    return chart_data
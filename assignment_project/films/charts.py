@@ -0,0 +1,221 @@
+from decimal import Decimal
+from django.db.models import Count
+from assignment_project.routers import read_connection
+from .filters import NO_FILTERS, filter_payments, filter_rentals
+from .models import CategoryLanguageRollup, CategoryRollup, FilmCategory, FilmRollup
+from . import sketches, snapshot
+from .scan import scan_payments
+from .timeseries import revenue_by_month
+
+# Builders for the data of each chart on the films dashboard.
+# Every builder takes the dashboard filters (see films/filters.py) and returns a dict ready to be passed to Chart.js.
+# Without filters, the builders read the pre-aggregated rollup tables (see films/rollups.py) and the monthly revenue series (see films/timeseries.py).
+# With filters, they aggregate the filtered slice of the fact tables: the payment scan (see films/scan.py) or the filtered rentals.
+# With settings.DASHBOARD_ENGINE = 'snapshot', every chart, filtered or not, is aggregated from the in-process snapshot instead (see films/snapshot.py).
+
+
+def _use_rollups(filters):
+    return filters == NO_FILTERS and not snapshot.enabled()
+
+
+def _scan(filters):
+    """
+    Aggregates the payments matching the filters, from the snapshot or from the database.
+    """
+    if snapshot.enabled():
+        return snapshot.scan(filters)
+    return scan_payments(filter_payments(filters))
+
+
+def _top_films(filters, index, order_by):
+    """
+    Returns the top 10 films as (title, rental_count, total_revenue) tuples, by the tuple item at 'index' in descending order, then by title.
+    Without filters, the rollup table is sorted and limited by the database ('order_by').
+    """
+    if _use_rollups(filters):
+        return list(FilmRollup.objects.order_by(order_by, 'title').values_list('title', 'rental_count', 'total_revenue')[:10])
+    return _top_scanned_films(_scan(filters), index)
+
+
+def _top_scanned_films(scan, index):
+    films = [(title, totals.rental_count, totals.total_revenue) for title, totals in scan.films.values()]
+    return sorted(films, key=lambda film: (-film[index], film[0]))[:10]
+
+
+def _category_totals(filters):
+    """
+    Returns a list of (name, rental_count, total_revenue) tuples, one per category with at least one rental.
+    """
+    if _use_rollups(filters):
+        return list(CategoryRollup.objects.filter(rental_count__gt=0).values_list('name', 'rental_count', 'total_revenue'))
+    return [(name, totals.rental_count, totals.total_revenue) for name, totals in _scan(filters).categories.values()]
+
+
+def bar_chart_data(filters=NO_FILTERS):
+    """
+    Bar chart: the top 10 most rented films with their rental counts and total revenue.
+    Films are ordered by rental count in descending order.
+    """
+    films = _top_films(filters, 1, '-rental_count')
+    return {
+        "titles": [title for title, _, _ in films],
+        "rental_counts": [rental_count for _, rental_count, _ in films],
+        "total_revenues": [float(total_revenue) for _, _, total_revenue in films],
+    }
+
+
+def pie_chart_data(filters=NO_FILTERS):
+    """
+    Pie chart: the top 10 films by revenue and their percentage contribution to the overall revenue.
+    The overall revenue includes payments that are not linked to a rental, as the monthly revenue series does.
+    """
+    if _use_rollups(filters):
+        films = _top_films(filters, 2, '-total_revenue')
+        overall_revenue = sum((total_revenue for _, total_revenue in revenue_by_month()), Decimal(0))
+    else:
+        # One scan gives both the film totals and the overall revenue of the filtered payments
+        scan = _scan(filters)
+        films = _top_scanned_films(scan, 2)
+        overall_revenue = scan.overall_revenue
+    return {
+        "titles": [title for title, _, _ in films],
+        "total_revenues": [float(total_revenue) for _, _, total_revenue in films],
+        "percentages": [
+            f"{round(total_revenue / overall_revenue * 100, 2) if overall_revenue else 0}%" for _, _, total_revenue in films
+        ],
+    }
+
+
+def line_chart_data(filters=NO_FILTERS):
+    """
+    Line chart: the total revenue for each month, in chronological order.
+    Without a date range, the months come from the revenue series, whose sealed months are never re-aggregated.
+    """
+    if filters.date_from is None and filters.date_to is None and not snapshot.enabled():
+        months = revenue_by_month(filters.store_id)
+    else:
+        months = sorted(_scan(filters).months.items())
+
+    return {
+        "months": [month.strftime('%Y-%m') for month, _ in months],
+        "total_revenues": [float(total_revenue) for _, total_revenue in months],
+    }
+
+
+def clustered_bar_chart_data(filters=NO_FILTERS):
+    """
+    Clustered bar chart: the number of films for each combination of category and language.
+    With filters, only the films rented in the filtered period and store are counted.
+    Categories are ordered by their largest film count in descending order.
+    """
+    if _use_rollups(filters):
+        rows = CategoryLanguageRollup.objects.values_list('category_name', 'language_name', 'film_count')
+    elif snapshot.enabled():
+        rows = snapshot.category_language_counts(filters)
+    else:
+        rows = (
+            FilmCategory.objects.filter(film_id__in=filter_rentals(filters).values('inventory__film_id'))
+            .values_list('category__name', 'film__language__name')
+            .annotate(film_count=Count('film_id'))
+        )
+    rows = sorted(rows, key=lambda row: (-row[2], row[0], row[1]))
+
+    categories = {}
+    languages = set()
+    for category_name, language_name, film_count in rows:
+        languages.add(language_name)
+        if category_name not in categories:
+            categories[category_name] = {}
+        categories[category_name][language_name] = film_count
+
+    # Organize data for Chart.js
+    languages = sorted(languages)
+    return {
+        "categories": list(categories.keys()),
+        "languages": languages,
+        "data": [
+            [categories[category].get(language, 0) for language in languages]
+            for category in categories
+        ],
+    }
+
+
+def donut_chart_data(filters=NO_FILTERS):
+    """
+    Donut chart: the number of unique customers who rented films from each category,
+    and their percentage share of all customers.
+    In approximate mode, filtered counts over whole months are estimated from the category sketches and flagged with 'approximate'.
+    """
+    approximate = None
+    if filters != NO_FILTERS and sketches.enabled() and not snapshot.enabled():
+        approximate = sketches.estimate_customer_counts(filters)
+
+    if _use_rollups(filters):
+        # The rollup holds exact counts, which are cheaper to read than merging every sketch
+        categories = list(CategoryRollup.objects.filter(customer_count__gt=0).values_list('name', 'customer_count'))
+    elif snapshot.enabled():
+        categories = snapshot.customer_counts(filters)
+    elif approximate is not None:
+        categories = [(name, customer_count) for name, customer_count in approximate if customer_count > 0]
+    else:
+        categories = list(
+            filter_rentals(filters).filter(inventory__film__filmcategory__isnull=False)
+            .values_list('inventory__film__filmcategory__category__name')
+            .annotate(customer_count=Count('customer_id', distinct=True))
+        )
+    categories.sort(key=lambda category: (-category[1], category[0]))
+
+    if snapshot.enabled():
+        total_customers = snapshot.customer_count()
+    else:
+        # The customer table is small and indexed; counting it is cheap compared to the fact tables
+        with read_connection().cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM customer")
+            total_customers = cursor.fetchone()[0]
+
+    chart_data = {
+        "categories": [name for name, _ in categories],
+        "customer_counts": [customer_count for _, customer_count in categories],
+        "percentages": [
+            round(customer_count / total_customers * 100, 2) if total_customers else 0
+            for _, customer_count in categories
+        ],
+    }
+    if approximate is not None:
+        chart_data["approximate"] = True
+    return chart_data
+
+
+def scatter_plot_data(filters=NO_FILTERS):
+    """
+    Scatter plot: the number of rentals, total revenue and average revenue per rental for each category.
+    Categories are ordered by total revenue in descending order.
+    """
+    categories = sorted(_category_totals(filters), key=lambda category: (-category[2], category[0]))
+    return {
+        "categories": [name for name, _, _ in categories],
+        "rental_counts": [rental_count for _, rental_count, _ in categories],
+        "total_revenues": [float(total_revenue) for _, _, total_revenue in categories],
+        "avg_revenue_per_rentals": [round(float(total_revenue) / rental_count, 2) for _, rental_count, total_revenue in categories],
+    }
+
+
+# Chart builders by the name of the template context variable holding their data
+CHARTS = {
+    'bar_chart_data': bar_chart_data,
+    'pie_chart_data': pie_chart_data,
+    'line_chart_data': line_chart_data,
+    'clustered_bar_chart_data': clustered_bar_chart_data,
+    'donut_chart_data': donut_chart_data,
+    'scatter_plot_data': scatter_plot_data,
+}
+
+# Data of each chart when it cannot be built (see films/executor.py): the same keys, without any data point
+EMPTY_CHARTS = {
+    'bar_chart_data': {"titles": [], "rental_counts": [], "total_revenues": []},
+    'pie_chart_data': {"titles": [], "total_revenues": [], "percentages": []},
+    'line_chart_data': {"months": [], "total_revenues": []},
+    'clustered_bar_chart_data': {"categories": [], "languages": [], "data": []},
+    'donut_chart_data': {"categories": [], "customer_counts": [], "percentages": []},
+    'scatter_plot_data': {"categories": [], "rental_counts": [], "total_revenues": [], "avg_revenue_per_rentals": []},
+}
@@ -0,0 +1,138 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.db import connections
+from assignment_project.instrumentation import timing
+from assignment_project.routers import read_connection
+from . import charts
+from .filters import NO_FILTERS
+
+# Execution of the dashboard chart builders.
+# With settings.DASHBOARD_QUERY_WORKERS > 0, the builders run concurrently on a bounded thread pool shared by every request of the process.
+# Each worker thread uses its own database connection (Django connections are per thread), kept across charts like a request thread's
+# connection (CONN_MAX_AGE, pool), and closed once unusable or expired.
+# Every chart is isolated from the others: a chart that raises or exceeds settings.DASHBOARD_QUERY_TIMEOUT, counted from the start of its
+# own build, is replaced by its empty data (see charts.EMPTY_CHARTS) flagged with 'unavailable', instead of failing the whole request.
+# On MySQL the timeout is also enforced by the server on every chart query (max_execution_time), in sequential mode as well.
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """
+    Returns the thread pool of the process, creating it on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.DASHBOARD_QUERY_WORKERS, thread_name_prefix='dashboard-query')
+        return _executor
+
+
+def unavailable_chart_data(name):
+    """
+    Returns the empty data of a chart, flagged as unavailable so that it is neither cached nor mistaken for real data.
+    """
+    return {**charts.EMPTY_CHARTS[name], 'unavailable': True}
+
+
+def _build(name, filters, timeout=None):
+    """
+    Builds one chart for the given filters on the current thread's connection, degrading to its empty data if the builder fails.
+    With a timeout on MySQL, the server also enforces it on each query (max_execution_time) for the time of the build,
+    so a timed out query does not keep running.
+    """
+    # The connection the chart reads from: the analytics replica, if the request reads from it (see assignment_project/routers.py)
+    connection = read_connection()
+    limited = timeout is not None and connection.vendor == 'mysql'
+    try:
+        if limited:
+            with connection.cursor() as cursor:
+                cursor.execute('SET SESSION max_execution_time = %s', [int(timeout * 1000)])
+        # Reported in the Server-Timing header of the request, e.g. 'bar_chart' (see assignment_project/instrumentation.py)
+        with timing(name.removesuffix('_data')):
+            return charts.CHARTS[name](filters)
+    except Exception:
+        logger.exception('Building the %s failed', name)
+        return unavailable_chart_data(name)
+    finally:
+        if limited:
+            _reset_session_timeout(connection)
+
+
+def _reset_session_timeout(connection):
+    """
+    Restores the server's default statement timeout on a connection kept open for other requests (persistent or pooled connections).
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SET SESSION max_execution_time = DEFAULT')
+    except Exception:
+        # The connection is broken; it is discarded when its thread closes its unusable connections
+        logger.warning('Resetting the statement timeout failed', exc_info=True)
+
+
+def _build_in_worker(name, filters, timeout, started):
+    """
+    Builds one chart on a pool thread, recording when the build started (the start of its own timeout).
+    """
+    started[name] = time.monotonic()
+    try:
+        return _build(name, filters, timeout)
+    finally:
+        # The pool thread keeps its connections across tasks like a request thread (CONN_MAX_AGE, pool), unless they are unusable or expired
+        for connection in connections.all(initialized_only=True):
+            connection.close_if_unusable_or_obsolete()
+
+
+def build_charts(names, filters=NO_FILTERS):
+    """
+    Builds the data of the given charts.
+
+    Args:
+        names (list): Names of the charts to build (keys of films.charts.CHARTS).
+        filters (DashboardFilters): Dashboard filters to apply (see films/filters.py). Defaults to no filter.
+
+    Returns:
+        dict: The data of each chart by chart name. Charts that failed or timed out have their empty data flagged with 'unavailable'.
+    """
+    timeout = settings.DASHBOARD_QUERY_TIMEOUT
+    if settings.DASHBOARD_QUERY_WORKERS <= 0:
+        # Sequential mode: every chart runs on the request's connection, one after another, each query bounded by the timeout on MySQL
+        return {name: _build(name, filters, timeout) for name in names}
+
+    # Each task runs in a copy of the request's context, so that its queries and timings are part of the request's measures
+    started = {}
+    submitted = time.monotonic()
+    futures = {
+        name: _get_executor().submit(contextvars.copy_context().run, _build_in_worker, name, filters, timeout, started)
+        for name in names
+    }
+
+    # Each chart has 'timeout' seconds from the start of its build; a chart still queued 'timeout' seconds after submission
+    # (every worker busy) times out too, which bounds the request to twice the timeout
+    chart_data = {}
+    pending = dict(futures)
+    while pending:
+        now = time.monotonic()
+        for name in [name for name in pending if started.get(name, submitted) + timeout <= now]:
+            future = pending.pop(name)
+            if future.done():
+                chart_data[name] = future.result()
+                continue
+            future.cancel()  # Only succeeds if the chart has not started yet
+            logger.warning('Building the %s timed out after %s seconds', name, timeout)
+            chart_data[name] = unavailable_chart_data(name)
+        if not pending:
+            break
+        next_deadline = min(started.get(name, submitted) + timeout for name in pending)
+        done, _ = wait(pending.values(), timeout=next_deadline - now, return_when=FIRST_COMPLETED)
+        for name in [name for name, future in pending.items() if future in done]:
+            chart_data[name] = pending.pop(name).result()
+    return {name: chart_data[name] for name in names}
@@ -0,0 +1,193 @@
+import csv
+from datetime import datetime
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from .filters import filter_payments
+
+# Streaming exports of the dashboard data, as CSV or NDJSON (one JSON object per line), for analysts (see ExportView).
+# - Chart datasets: the rows behind each chart, built like the chart data endpoints (same filters, cache and rollups).
+# - Rentals: the raw 'payment INNER JOIN rental' rows matching the filters, with the film and store of the rented inventory.
+#
+# Raw rows are read with QuerySet.iterator(chunk_size): Django fetches CHUNK_SIZE rows at a time from the database cursor, and each chunk
+# is encoded and sent before the next one is fetched, so the app holds one chunk of rows and lines at a time (measured on SQLite by
+# ExportTestCase.test_rentals_export_memory_is_bounded). Whether the driver also streams the result set from the server depends on
+# its cursor: a buffered cursor (mysqlclient's default) receives the whole result set before the first row is returned; whether the
+# mysql.connector.django backend's cursors are unbuffered has not been measured.
+# Under ASGI, each chunk is fetched from the same iterator through sync_to_async(): the fetches run in the thread of the request's
+# connection and the event loop keeps serving other requests while the client consumes the export.
+
+CHUNK_SIZE = 2000
+
+# Format -> (content type, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# Chart payload keys (lists of equal length, see films/charts.py) -> export columns, per chart.
+# The clustered bar chart is a matrix and is exported as (category, language, film_count) rows instead.
+CHART_COLUMNS = {
+    'bar_chart_data': [('title', 'titles'), ('rental_count', 'rental_counts'), ('total_revenue', 'total_revenues')],
+    'pie_chart_data': [('title', 'titles'), ('total_revenue', 'total_revenues'), ('percentage', 'percentages')],
+    'line_chart_data': [('month', 'months'), ('total_revenue', 'total_revenues')],
+    'donut_chart_data': [('category', 'categories'), ('customer_count', 'customer_counts'), ('percentage', 'percentages')],
+    'scatter_plot_data': [
+        ('category', 'categories'), ('rental_count', 'rental_counts'), ('total_revenue', 'total_revenues'),
+        ('avg_revenue_per_rental', 'avg_revenue_per_rentals'),
+    ],
+}
+CLUSTERED_BAR_COLUMNS = ['category', 'language', 'film_count']
+
+# Export columns of the rentals -> ORM paths from Payment
+RENTAL_FIELDS = {
+    'payment_id': 'payment_id',
+    'payment_date': 'payment_date',
+    'amount': 'amount',
+    'customer_id': 'customer_id',
+    'staff_id': 'staff_id',
+    'rental_id': 'rental_id',
+    'rental_date': 'rental__rental_date',
+    'return_date': 'rental__return_date',
+    'inventory_id': 'rental__inventory_id',
+    'film_id': 'rental__inventory__film_id',
+    'store_id': 'rental__inventory__store_id',
+}
+RENTAL_COLUMNS = list(RENTAL_FIELDS)
+
+
+def chart_rows(name, chart_data):
+    """
+    Returns the dataset of a chart as rows.
+
+    Args:
+        name (str): Chart builder name (a key of films.charts.CHARTS).
+        chart_data (dict): The chart payload.
+
+    Returns:
+        tuple: The list of column names and the list of rows (tuples).
+    """
+    if name == 'clustered_bar_chart_data':
+        rows = [
+            (category, language, film_count)
+            for category, counts in zip(chart_data['categories'], chart_data['data'])
+            for language, film_count in zip(chart_data['languages'], counts)
+        ]
+        return CLUSTERED_BAR_COLUMNS, rows
+    columns = CHART_COLUMNS[name]
+    return [column for column, _ in columns], list(zip(*(chart_data[key] for _, key in columns)))
+
+
+def rentals_queryset(filters):
+    """
+    Returns the 'payment INNER JOIN rental' rows matching the filters, as tuples of the RENTAL_COLUMNS values.
+    A date range is read in payment date order, through the (payment_date, rental_id, amount) index without a sort;
+    a whole-history export is read in primary key order.
+    """
+    ordering = 'payment_date' if filters.date_from or filters.date_to else 'payment_id'
+    return (
+        filter_payments(filters).filter(rental__isnull=False)
+        .order_by(ordering)
+        .values_list(*RENTAL_FIELDS.values())
+    )
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class _Echo:
+    """
+    File-like object returning what is written to it, so that csv.writer formats one line at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def row_encoder(export_format, columns):
+    """
+    Returns the header of an export (or '') and a function encoding one row as a line.
+
+    Args:
+        export_format (str): 'csv' or 'ndjson'.
+        columns (list): Column names.
+    """
+    if export_format == 'csv':
+        writer = csv.writer(_Echo())
+        return writer.writerow(columns), lambda row: writer.writerow([_csv_value(value) for value in row])
+    encoder = DjangoJSONEncoder()
+    return '', lambda row: encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def stream_rows(export_format, columns, rows, chunk_size=CHUNK_SIZE):
+    """
+    Yields an export chunk by chunk: the header, then the lines of 'chunk_size' rows at a time.
+    """
+    header, encode = row_encoder(export_format, columns)
+    if header:
+        yield header
+    lines = []
+    for row in rows:
+        lines.append(encode(row))
+        if len(lines) == chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+async def astream_rows(export_format, columns, rows, chunk_size=CHUNK_SIZE):
+    """
+    Asynchronous version of stream_rows(), over an asynchronous iterable of rows.
+    """
+    header, encode = row_encoder(export_format, columns)
+    if header:
+        yield header
+    lines = []
+    async for row in rows:
+        lines.append(encode(row))
+        if len(lines) == chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+async def _async_rows(rows):
+    for row in rows:
+        yield row
+
+
+async def _fetch_rows(rows, chunk_size):
+    """
+    Yields the rows of a blocking iterator, fetching 'chunk_size' of them at a time outside the event loop.
+    """
+    fetch = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while True:
+        chunk = await fetch()
+        for row in chunk:
+            yield row
+        if len(chunk) < chunk_size:
+            break
+
+
+def stream_chart(export_format, name, chart_data, asynchronous=False):
+    """
+    Returns the export of a chart dataset, as an iterator of chunks (an asynchronous one if 'asynchronous').
+    """
+    columns, rows = chart_rows(name, chart_data)
+    if asynchronous:
+        return astream_rows(export_format, columns, _async_rows(rows))
+    return stream_rows(export_format, columns, rows)
+
+
+def stream_rentals(export_format, filters, asynchronous=False, chunk_size=CHUNK_SIZE):
+    """
+    Returns the rentals export, as an iterator of chunks (an asynchronous one if 'asynchronous').
+    The rows are read 'chunk_size' at a time from a server-side cursor, when the first chunk is requested.
+    """
+    rows = rentals_queryset(filters).iterator(chunk_size=chunk_size)
+    if asynchronous:
+        return astream_rows(export_format, RENTAL_COLUMNS, _fetch_rows(rows, chunk_size), chunk_size)
+    return stream_rows(export_format, RENTAL_COLUMNS, rows, chunk_size)
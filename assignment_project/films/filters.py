@@ -0,0 +1,109 @@
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Payment, Rental
+
+# Filters of the films dashboard, taken from the 'from', 'to' and 'store' query parameters of the dashboard and chart data URLs.
+# Without any filter, the charts read the rollup tables. With filters, they aggregate the matching slice of the fact tables instead.
+#
+# The date range is pushed down as sargable predicates on the raw columns (payment_date >= start AND payment_date < end, same for rental_date),
+# never as a function of the column, so that it is resolved by the composite indexes added in migration 0003:
+# - payment (payment_date, rental_id, amount): the payments of the range, covering everything the payment scan reads from payment.
+# - rental (inventory_id, rental_date): the rentals of a store's inventory within the range.
+
+# - date_from / date_to: first and last day of the range (datetime.date, inclusive), or None for an open range.
+# - store_id: store of the rented inventory, or None for every store.
+DashboardFilters = namedtuple('DashboardFilters', ['date_from', 'date_to', 'store_id'], defaults=[None, None, None])
+
+NO_FILTERS = DashboardFilters()
+
+
+def parse_filters(params):
+    """
+    Reads the dashboard filters from query parameters.
+
+    Args:
+        params (QueryDict): The query parameters, e.g. request.GET ('from' and 'to' as YYYY-MM-DD dates, 'store' as a store id).
+
+    Returns:
+        DashboardFilters: The filters; missing or empty parameters are not applied.
+
+    Raises:
+        ValueError: If a parameter is malformed or the range ends before it starts.
+    """
+    date_from = _parse_date(params.get('from'), 'from')
+    date_to = _parse_date(params.get('to'), 'to')
+    if date_from and date_to and date_to < date_from:
+        raise ValueError("'to' must not be before 'from'")
+
+    store_id = params.get('store') or None
+    if store_id is not None:
+        if not store_id.isdigit():
+            raise ValueError(f"Invalid store: {store_id}")
+        store_id = int(store_id)
+    return DashboardFilters(date_from, date_to, store_id)
+
+
+def _parse_date(value, name):
+    if not value:
+        return None
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValueError(f"Invalid '{name}' date: {value} (expected YYYY-MM-DD)")
+    return date
+
+
+def cache_key(filters):
+    """
+    Returns a short string identifying the filters in cache keys ('all' without filters).
+    """
+    if filters == NO_FILTERS:
+        return 'all'
+    return '-'.join('' if value is None else str(value) for value in filters)
+
+
+def date_bounds(filters):
+    """
+    Returns the range as half-open [start, end) aware datetimes, in the current time zone (the days the dashboard shows).
+    """
+    start = end = None
+    if filters.date_from:
+        start = timezone.make_aware(datetime.combine(filters.date_from, time.min))
+    if filters.date_to:
+        end = timezone.make_aware(datetime.combine(filters.date_to + timedelta(days=1), time.min))
+    return start, end
+
+
+def filter_payments(filters):
+    """
+    Returns the payments matching the filters.
+    With a store filter, only payments linked to a rental of that store's inventory match.
+    """
+    start, end = date_bounds(filters)
+    payments = Payment.objects.all()
+    if start:
+        payments = payments.filter(payment_date__gte=start)
+    if end:
+        payments = payments.filter(payment_date__lt=end)
+    if filters.store_id is not None:
+        payments = payments.filter(rental__inventory__store_id=filters.store_id)
+    return payments
+
+
+def filter_rentals(filters):
+    """
+    Returns the rentals matching the filters.
+    """
+    start, end = date_bounds(filters)
+    rentals = Rental.objects.all()
+    if start:
+        rentals = rentals.filter(rental_date__gte=start)
+    if end:
+        rentals = rentals.filter(rental_date__lt=end)
+    if filters.store_id is not None:
+        rentals = rentals.filter(inventory__store_id=filters.store_id)
+    return rentals
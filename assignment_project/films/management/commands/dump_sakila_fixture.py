@@ -0,0 +1,61 @@
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from films.models import Category, Film, FilmCategory, Inventory, Language, Payment, Rental, Store
+from users.models import Customer, Staff
+
+# Default location of the fixture, loaded by the tests with fixtures = ['sakila_sample']
+FIXTURE_PATH = 'films/fixtures/sakila_sample.json'
+
+
+class Command(BaseCommand):
+    """
+    Management command writing a compact, self-consistent slice of a Sakila database as a JSON fixture (see films/fixtures/).
+
+    The slice keeps every language, category, store and staff member, the first films of each category (by film_id), their inventory,
+    every rental of that inventory with its payments, and the customers of these rentals.
+
+    Usage: python manage.py dump_sakila_fixture [--films-per-category 2] [--output films/fixtures/sakila_sample.json]
+    """
+    help = 'Writes a compact slice of the Sakila database (the first films of each category and their rentals) as a JSON fixture.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--films-per-category', type=int, default=2, help='Films kept per category (default 2).')
+        parser.add_argument('--output', default=FIXTURE_PATH, help=f'Fixture file to write (default {FIXTURE_PATH}).')
+
+    def handle(self, *args, **options):
+        if options['films_per_category'] <= 0:
+            raise CommandError('--films-per-category must be positive')
+
+        film_ids = set()
+        for category_id in Category.objects.values_list('category_id', flat=True):
+            film_ids.update(
+                FilmCategory.objects.filter(category_id=category_id).order_by('film_id')
+                .values_list('film_id', flat=True)[:options['films_per_category']]
+            )
+        rentals = Rental.objects.filter(inventory__film_id__in=film_ids).order_by('rental_id')
+
+        # In dependency order, so that the fixture loads without deferred constraint checks
+        querysets = [
+            Language.objects.order_by('language_id'),
+            Category.objects.order_by('category_id'),
+            Store.objects.order_by('store_id'),
+            Staff.objects.order_by('staff_id'),
+            Customer.objects.filter(customer_id__in=rentals.values('customer_id')).order_by('customer_id'),
+            Film.objects.filter(film_id__in=film_ids).order_by('film_id'),
+            FilmCategory.objects.filter(film_id__in=film_ids).order_by('film_id', 'category_id'),
+            Inventory.objects.filter(film_id__in=film_ids).order_by('inventory_id'),
+            rentals,
+            Payment.objects.filter(rental__in=rentals).order_by('payment_id'),
+        ]
+        counts = {}
+        objects = []
+        for queryset in querysets:
+            rows = list(queryset)
+            counts[queryset.model._meta.db_table] = len(rows)
+            objects.extend(rows)
+        with open(options['output'], 'w') as fixture:
+            serializers.serialize('json', objects, indent=1, stream=fixture)
+
+        for table, count in counts.items():
+            self.stdout.write(f'{table}: {count} rows')
+        self.stdout.write(self.style.SUCCESS(f"Fixture written to {options['output']}"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from films.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    """
+    Management command to recompute the films dashboard rollup tables from the fact tables.
+
+    Usage: python manage.py rebuild_rollups
+    """
+    help = 'Recomputes the films dashboard rollup tables from the payment, rental and film tables.'
+
+    def handle(self, *args, **options):
+        counts = rebuild_rollups()
+        for table, count in counts.items():
+            self.stdout.write(f'{table}: {count} rows')
+        self.stdout.write(self.style.SUCCESS('Rollup tables rebuilt successfully'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from films.timeseries import refresh_revenue_series
+
+
+class Command(BaseCommand):
+    """
+    Management command recomputing the open months of the monthly revenue series and the months of the payments inserted since
+    the last refresh, and sealing the months that are over (see films/timeseries.py).
+
+    Meant to run periodically (e.g. hourly from cron): payments saved through the ORM are added to the series as they are saved,
+    but payments loaded by other means wait for the next refresh.
+
+    Usage: python manage.py refresh_revenue_series
+    """
+    help = 'Recomputes the open months and the months of the new payments in the monthly revenue series, and seals the months that are over.'
+
+    def handle(self, *args, **options):
+        months = refresh_revenue_series()
+        self.stdout.write(self.style.SUCCESS(f'{months} months of the revenue series recomputed'))
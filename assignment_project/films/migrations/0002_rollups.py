@@ -0,0 +1,119 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0001_initial'),
+    ]
+
+    operations = [
+        # The Sakila schema already has these columns: film_actor and film_category use 'film_id', 'actor_id' and 'category_id',
+        # and payment.rental_id is nullable. Only the model state is updated to match it.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='filmactor',
+                    old_name='film_id',
+                    new_name='film',
+                ),
+                migrations.RenameField(
+                    model_name='filmactor',
+                    old_name='actor_id',
+                    new_name='actor',
+                ),
+                migrations.RenameField(
+                    model_name='filmcategory',
+                    old_name='film_id',
+                    new_name='film',
+                ),
+                migrations.RenameField(
+                    model_name='filmcategory',
+                    old_name='category_id',
+                    new_name='category',
+                ),
+                migrations.AlterField(
+                    model_name='filmactor',
+                    name='film',
+                    field=models.ForeignKey(db_column='film_id', on_delete=django.db.models.deletion.CASCADE, to='films.film'),
+                ),
+                migrations.AlterField(
+                    model_name='filmactor',
+                    name='actor',
+                    field=models.ForeignKey(db_column='actor_id', on_delete=django.db.models.deletion.CASCADE, to='films.actor'),
+                ),
+                migrations.AlterField(
+                    model_name='filmcategory',
+                    name='film',
+                    field=models.ForeignKey(db_column='film_id', on_delete=django.db.models.deletion.CASCADE, to='films.film'),
+                ),
+                migrations.AlterField(
+                    model_name='filmcategory',
+                    name='category',
+                    field=models.ForeignKey(db_column='category_id', on_delete=django.db.models.deletion.CASCADE, to='films.category'),
+                ),
+                migrations.AlterField(
+                    model_name='payment',
+                    name='rental',
+                    field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='films.rental'),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryLanguageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_id', models.IntegerField()),
+                ('category_name', models.CharField(max_length=25)),
+                ('language_id', models.IntegerField()),
+                ('language_name', models.CharField(max_length=20)),
+                ('film_count', models.IntegerField(default=0)),
+                ('last_update', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'category_language_rollup',
+                'unique_together': {('category_id', 'language_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryRollup',
+            fields=[
+                ('category_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=25)),
+                ('rental_count', models.IntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('customer_count', models.IntegerField(default=0)),
+                ('last_update', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'category_rollup',
+            },
+        ),
+        migrations.CreateModel(
+            name='FilmRollup',
+            fields=[
+                ('film_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('rental_count', models.IntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_update', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'film_rollup',
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('month', models.DateField(primary_key=True, serialize=False)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_update', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'monthly_rollup',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0002_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date', 'rental', 'amount'], name='idx_payment_date_rental'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['inventory', 'rental_date'], name='idx_rental_inventory_date'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0003_dashboard_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyStoreRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('store_id', models.IntegerField(blank=True, null=True)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('sealed', models.BooleanField(default=False)),
+                ('last_update', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'monthly_store_revenue',
+                'unique_together': {('month', 'store_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RevenueSeriesWatermark',
+            fields=[
+                ('watermark_id', models.IntegerField(default=1, primary_key=True, serialize=False)),
+                ('last_payment_id', models.IntegerField(default=0)),
+                ('last_update', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'revenue_series_watermark',
+            },
+        ),
+        migrations.DeleteModel(
+            name='MonthlyRollup',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0004_revenue_series'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryCustomerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_id', models.IntegerField()),
+                ('store_id', models.IntegerField()),
+                ('month', models.DateField()),
+                ('precision', models.SmallIntegerField()),
+                ('registers', models.BinaryField()),
+                ('last_update', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'category_customer_sketch',
+                'unique_together': {('category_id', 'store_id', 'month')},
+            },
+        ),
+    ]
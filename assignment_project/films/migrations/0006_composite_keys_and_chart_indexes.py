@@ -0,0 +1,146 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+# Composite primary keys of the Sakila link tables, by table
+KEY_COLUMNS = {
+    'film_actor': ['actor_id', 'film_id'],
+    'film_category': ['film_id', 'category_id'],
+}
+
+
+def _primary_key_columns(connection, table):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    for constraint in constraints.values():
+        if constraint['primary_key']:
+            return list(constraint['columns'])
+    return []
+
+
+def _create_table(schema_editor, model):
+    """
+    Creates the table of a link model with its composite primary key, without its indexes (added once the table is complete).
+    """
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    # Deferred like the foreign keys Django creates, where the backend supports it (flushes delete tables in any order)
+    deferrable = ' DEFERRABLE INITIALLY DEFERRED' if connection.features.can_defer_constraint_checks else ''
+    definitions = []
+    foreign_keys = []
+    for field in model._meta.local_concrete_fields:
+        definitions.append(f'{quote(field.column)} {field.db_type(connection)} {"NULL" if field.null else "NOT NULL"}')
+        if field.remote_field and field.db_constraint:
+            target = field.target_field
+            foreign_keys.append(
+                f'FOREIGN KEY ({quote(field.column)}) REFERENCES {quote(target.model._meta.db_table)} ({quote(target.column)})'
+                f'{deferrable}'
+            )
+    key_columns = KEY_COLUMNS[model._meta.db_table]
+    definitions.append(f'PRIMARY KEY ({", ".join(quote(column) for column in key_columns)})')
+    schema_editor.execute(f'CREATE TABLE {quote(model._meta.db_table)} ({", ".join(definitions + foreign_keys)})')
+
+
+def _rebuild_table(schema_editor, model):
+    """
+    Recreates the table of a link model with its composite primary key and copies its rows over.
+    Rows duplicating a key are merged, keeping the latest values of the other columns.
+    """
+    quote = schema_editor.quote_name
+    table = model._meta.db_table
+    old_table = f'{table}__rebuilt'
+    key_columns = KEY_COLUMNS[table]
+    other_columns = [field.column for field in model._meta.local_concrete_fields if field.column not in key_columns]
+
+    schema_editor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}')
+    _create_table(schema_editor, model)
+    columns = ', '.join(quote(column) for column in key_columns + other_columns)
+    values = ', '.join([quote(column) for column in key_columns] + [f'MAX({quote(column)})' for column in other_columns])
+    schema_editor.execute(
+        f'INSERT INTO {quote(table)} ({columns}) SELECT {values} FROM {quote(old_table)} '
+        f'GROUP BY {", ".join(quote(column) for column in key_columns)}'
+    )
+    schema_editor.execute(f'DROP TABLE {quote(old_table)}')
+
+
+def ensure_composite_keys(schema_editor, models):
+    """
+    Gives the tables of the link models their composite primary key, creating or rebuilding them as needed,
+    then adds the indexes of the models the tables do not have yet.
+    """
+    connection = schema_editor.connection
+    tables = connection.introspection.table_names()
+    for model in models:
+        table = model._meta.db_table
+        if table not in tables:
+            _create_table(schema_editor, model)
+        elif _primary_key_columns(connection, table) != KEY_COLUMNS[table]:
+            _rebuild_table(schema_editor, model)
+
+        with connection.cursor() as cursor:
+            existing = connection.introspection.get_constraints(cursor, table)
+        for index in model._meta.indexes:
+            if index.name not in existing:
+                schema_editor.add_index(model, index)
+
+
+def create_composite_keys(apps, schema_editor):
+    # The Sakila tables loaded from sql_files/ already have their composite key (and idx_fk_film_id);
+    # the tables created by 0001, with a surrogate id column, are rebuilt with it, keeping their rows
+    ensure_composite_keys(schema_editor, [apps.get_model('films', 'FilmActor'), apps.get_model('films', 'FilmCategory')])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0005_category_customer_sketch'),
+    ]
+
+    operations = [
+        # film_actor and film_category have no surrogate id: their primary key is (actor_id, film_id) / (film_id, category_id).
+        # Django cannot migrate a table to a composite primary key: the model state gets the keys here,
+        # and the tables are given them by create_composite_keys().
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='filmactor',
+                    name='id',
+                ),
+                migrations.RemoveField(
+                    model_name='filmcategory',
+                    name='id',
+                ),
+                migrations.AddField(
+                    model_name='filmactor',
+                    name='pk',
+                    field=models.CompositePrimaryKey('actor_id', 'film_id', blank=True, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AddField(
+                    model_name='filmcategory',
+                    name='pk',
+                    field=models.CompositePrimaryKey('film_id', 'category_id', blank=True, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AddIndex(
+                    model_name='filmactor',
+                    index=models.Index(fields=['film'], name='idx_fk_film_id'),
+                ),
+                migrations.AddIndex(
+                    model_name='filmcategory',
+                    index=models.Index(fields=['category', 'film'], name='idx_film_category_category'),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_composite_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='filmrollup',
+            index=models.Index(fields=['-rental_count', 'title', 'total_revenue'], name='idx_film_rollup_rentals'),
+        ),
+        migrations.AddIndex(
+            model_name='filmrollup',
+            index=models.Index(fields=['-total_revenue', 'title', 'rental_count'], name='idx_film_rollup_revenue'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['rental', 'amount'], name='idx_payment_rental'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0006_composite_keys_and_chart_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['last_update'], name='idx_inventory_last_update'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['last_update'], name='idx_rental_last_update'),
+        ),
+    ]
@@ -51,6 +51,10 @@ class Inventory(models.Model):
 
     class Meta:
         db_table = 'inventory'
+        indexes = [
+            # MAX(last_update) of the dashboard data version probe (see films/cache.py)
+            models.Index(fields=['last_update'], name='idx_inventory_last_update'),
+        ]
 
 class Store(models.Model):
     store_id = models.AutoField(primary_key=True)
@@ -72,31 +76,155 @@ class Rental(models.Model):
 
     class Meta:
         db_table = 'rental'
+        indexes = [
+            # Rentals of a store's inventory within a date range (dashboard filters, see films/filters.py)
+            models.Index(fields=['inventory', 'rental_date'], name='idx_rental_inventory_date'),
+            # MAX(last_update) of the dashboard data version probe (see films/cache.py)
+            models.Index(fields=['last_update'], name='idx_rental_last_update'),
+        ]
 
 class Payment(models.Model):
     payment_id = models.AutoField(primary_key=True)
     customer_id = models.IntegerField()
     staff_id = models.IntegerField()
-    rental = models.ForeignKey(Rental, on_delete=models.CASCADE)
+    rental = models.ForeignKey(Rental, on_delete=models.SET_NULL, null=True, blank=True)
     amount = models.DecimalField(max_digits=5, decimal_places=2)
     payment_date = models.DateTimeField()
     last_update = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'payment'
+        indexes = [
+            # Payments within a date range; also covers the columns read by the payment scan (see films/scan.py)
+            models.Index(fields=['payment_date', 'rental', 'amount'], name='idx_payment_date_rental'),
+            # Payments of given rentals (rental INNER JOIN payment in the rollup rebuild and revenue series), covering their amounts
+            models.Index(fields=['rental', 'amount'], name='idx_payment_rental'),
+        ]
 
 class FilmActor(models.Model):
-    film_id = models.ForeignKey(Film, on_delete=models.CASCADE)
-    actor_id = models.ForeignKey(Actor, on_delete=models.CASCADE)
+    """
+    Actors of a film. The table's primary key is (actor_id, film_id).
+    """
+    pk = models.CompositePrimaryKey('actor_id', 'film_id')
+    actor = models.ForeignKey(Actor, on_delete=models.CASCADE, db_column='actor_id')
+    film = models.ForeignKey(Film, on_delete=models.CASCADE, db_column='film_id')
     last_update = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'film_actor'
+        indexes = [
+            models.Index(fields=['film'], name='idx_fk_film_id'),
+        ]
 
 class FilmCategory(models.Model):
-    film_id = models.ForeignKey(Film, on_delete=models.CASCADE)
-    category_id = models.ForeignKey(Category, on_delete=models.CASCADE)
+    """
+    Categories of a film. The table's primary key is (film_id, category_id).
+    """
+    pk = models.CompositePrimaryKey('film_id', 'category_id')
+    film = models.ForeignKey(Film, on_delete=models.CASCADE, db_column='film_id')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, db_column='category_id')
     last_update = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'film_category'
+        indexes = [
+            # Films of a category (category rollups, category filters), without reading the rows
+            models.Index(fields=['category', 'film'], name='idx_film_category_category'),
+        ]
+
+
+# Rollup tables behind the films dashboard.
+# They hold pre-aggregated values derived from the fact tables (payment, rental) so that the dashboard reads a few hundred rows instead of scanning the whole rental history.
+# Rows are kept up to date incrementally by the handlers in films/signals.py and can be rebuilt from scratch with `python manage.py rebuild_rollups`.
+# Dimension ids are stored as plain integers (not foreign keys) because the rollups are derived data and the Sakila key columns are unsigned SMALLINT/TINYINT.
+
+class FilmRollup(models.Model):
+    """
+    Rental count and total revenue per film (bar chart and pie chart).
+    A rental is counted once per payment made for it, matching the original 'rental INNER JOIN payment' aggregation.
+    """
+    film_id = models.IntegerField(primary_key=True)
+    title = models.CharField(max_length=255)
+    rental_count = models.IntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'film_rollup'
+        indexes = [
+            # Top films of the bar chart and pie chart, read in order without a sort
+            models.Index(fields=['-rental_count', 'title', 'total_revenue'], name='idx_film_rollup_rentals'),
+            models.Index(fields=['-total_revenue', 'title', 'rental_count'], name='idx_film_rollup_revenue'),
+        ]
+
+class CategoryRollup(models.Model):
+    """
+    Rental count, total revenue and number of unique customers per category (donut chart and scatter plot).
+    """
+    category_id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=25)
+    rental_count = models.IntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    customer_count = models.IntegerField(default=0)
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'category_rollup'
+
+class MonthlyStoreRevenue(models.Model):
+    """
+    Total revenue per calendar month and store (line chart and pie chart percentages). 'month' is the first day of the month.
+    'store_id' is the store of the rented inventory, None for payments that are not linked to a rental.
+    Maintained by films/timeseries.py: payments are added as they are saved, and a sealed month is only recomputed if new payments are dated in it.
+    """
+    month = models.DateField()
+    store_id = models.IntegerField(null=True, blank=True)
+    total_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    sealed = models.BooleanField(default=False)
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'monthly_store_revenue'
+        unique_together = (('month', 'store_id'),)
+
+class RevenueSeriesWatermark(models.Model):
+    """
+    Single row holding the highest payment_id already applied to MonthlyStoreRevenue.
+    """
+    watermark_id = models.IntegerField(primary_key=True, default=1)
+    last_payment_id = models.IntegerField(default=0)
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'revenue_series_watermark'
+
+class CategoryCustomerSketch(models.Model):
+    """
+    HyperLogLog sketch of the customers who rented films of a category, per store and month (donut chart, approximate mode).
+    Sketches of several months or stores merge into the sketch of their union (see films/sketches.py).
+    """
+    category_id = models.IntegerField()
+    store_id = models.IntegerField()
+    month = models.DateField()
+    precision = models.SmallIntegerField()
+    registers = models.BinaryField()
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'category_customer_sketch'
+        unique_together = (('category_id', 'store_id', 'month'),)
+
+class CategoryLanguageRollup(models.Model):
+    """
+    Number of films per category and language combination (clustered bar chart).
+    """
+    category_id = models.IntegerField()
+    category_name = models.CharField(max_length=25)
+    language_id = models.IntegerField()
+    language_name = models.CharField(max_length=20)
+    film_count = models.IntegerField(default=0)
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'category_language_rollup'
+        unique_together = (('category_id', 'language_id'),)
@@ -0,0 +1,174 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .models import Category, CategoryLanguageRollup, CategoryRollup, FilmCategory, FilmRollup, Rental
+from . import sketches
+from .scan import scan_payments
+from .timeseries import rebuild_revenue_series
+
+# Maintenance of the dashboard rollup tables (FilmRollup, CategoryRollup, CategoryLanguageRollup).
+# The monthly revenue is a time series maintained by films/timeseries.py.
+# - record_payment() / record_rental() / record_film_category() apply one newly inserted fact row to the rollups (called from films/signals.py).
+# - rebuild_rollups() recomputes every rollup table from the fact tables (called by the 'rebuild_rollups' management command).
+
+
+def _increment(model, key, defaults, **deltas):
+    """
+    Adds 'deltas' to the counters of the rollup row identified by 'key' (its primary key, or a dict of the fields of a unique constraint),
+    creating the row with 'defaults' if it does not exist yet.
+    The counters are updated with F() expressions so concurrent inserts never overwrite each other's increments.
+    """
+    lookup = key if isinstance(key, dict) else {'pk': key}
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    # QuerySet.update() does not apply auto_now; last_update is part of the dashboard cache version (see films/cache.py)
+    increments['last_update'] = timezone.now()
+    if model.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        # Savepoint so that losing a creation race does not break the surrounding transaction
+        with transaction.atomic():
+            model.objects.create(**lookup, **defaults, **deltas)
+    except IntegrityError:
+        # Another transaction created the row first; apply the increment to it instead
+        model.objects.filter(**lookup).update(**increments)
+
+
+def _film_categories(film_id):
+    """
+    Returns a list of (category_id, category_name) tuples for the given film.
+    """
+    return list(FilmCategory.objects.filter(film_id=film_id).values_list('category_id', 'category__name'))
+
+
+@transaction.atomic
+def record_payment(payment):
+    """
+    Applies a newly inserted payment to the rollups.
+
+    Payments linked to a rental count as one rental and add their amount to the rented film and to each of the film's categories.
+    The monthly revenue is not updated here: the payment signal adds the payment to the revenue time series (see films/signals.py).
+    """
+    if payment.rental_id is None:
+        return
+
+    film = Rental.objects.filter(pk=payment.rental_id).values_list('inventory__film_id', 'inventory__film__title').first()
+    if film is None:
+        return
+    film_id, title = film
+
+    _increment(FilmRollup, film_id, {'title': title}, rental_count=1, total_revenue=payment.amount)
+    for category_id, category_name in _film_categories(film_id):
+        _increment(CategoryRollup, category_id, {'name': category_name}, rental_count=1, total_revenue=payment.amount)
+
+
+@transaction.atomic
+def record_rental(rental):
+    """
+    Applies a newly inserted rental to the unique customer counts per category.
+
+    The customer is counted for a category only if none of their other rentals already belongs to that category.
+    That check is a lookup on the customer's own rentals, so it stays cheap regardless of the size of the rental table.
+    """
+    film_id = rental.inventory.film_id
+    categories = _film_categories(film_id)
+    if not categories:
+        return
+
+    already_counted = set(
+        Rental.objects.filter(
+            customer_id=rental.customer_id,
+            inventory__film__filmcategory__category_id__in=[category_id for category_id, _ in categories],
+        )
+        .exclude(pk=rental.pk)
+        .values_list('inventory__film__filmcategory__category_id', flat=True)
+    )
+    for category_id, category_name in categories:
+        if category_id not in already_counted:
+            _increment(CategoryRollup, category_id, {'name': category_name}, customer_count=1)
+
+    if sketches.enabled():
+        sketches.record_rental(rental, [category_id for category_id, _ in categories])
+
+
+@transaction.atomic
+def record_film_category(film_category):
+    """
+    Applies a newly inserted film/category link to the film counts per category and language.
+    """
+    film = film_category.film
+    category = film_category.category
+    _increment(
+        CategoryLanguageRollup,
+        {'category_id': category.category_id, 'language_id': film.language_id},
+        {'category_name': category.name, 'language_name': film.language.name},
+        film_count=1,
+    )
+
+
+@transaction.atomic
+def rebuild_rollups():
+    """
+    Recomputes every rollup table from the fact tables.
+
+    Used for the initial load and to repair the rollups after changes the incremental handlers do not see
+    (bulk inserts, updates or deletes of payments and rentals, renamed films or categories).
+
+    Returns:
+        dict: The number of rows written to each rollup table.
+    """
+    # Per film, per category and per month and store: one pass over the payments (see films/scan.py)
+    scan = scan_payments()
+    film_rollups = [
+        FilmRollup(film_id=film_id, title=title, rental_count=totals.rental_count, total_revenue=totals.total_revenue)
+        for film_id, (title, totals) in scan.films.items()
+    ]
+    category_rollups = {
+        category_id: CategoryRollup(category_id=category_id, name=name)
+        for category_id, name in Category.objects.values_list('category_id', 'name')
+    }
+    for category_id, (name, totals) in scan.categories.items():
+        category_rollups[category_id].rental_count = totals.rental_count
+        category_rollups[category_id].total_revenue = totals.total_revenue
+
+    # Per category: unique customers, from rentals (with or without a payment)
+    customer_rows = (
+        Rental.objects.values('inventory__film__filmcategory__category_id')
+        .annotate(customer_count=Count('customer_id', distinct=True))
+    )
+    for row in customer_rows:
+        rollup = category_rollups.get(row['inventory__film__filmcategory__category_id'])
+        if rollup is not None:
+            rollup.customer_count = row['customer_count']
+
+    # Per category and language: number of films
+    category_language_rows = (
+        FilmCategory.objects.values('category_id', 'category__name', 'film__language_id', 'film__language__name')
+        .annotate(film_count=Count('film_id'))
+    )
+    category_language_rollups = [
+        CategoryLanguageRollup(
+            category_id=row['category_id'],
+            category_name=row['category__name'],
+            language_id=row['film__language_id'],
+            language_name=row['film__language__name'],
+            film_count=row['film_count'],
+        )
+        for row in category_language_rows
+    ]
+
+    # Replace the content of every rollup table in the same transaction, so readers never see a partial rebuild
+    for model in (FilmRollup, CategoryRollup, CategoryLanguageRollup):
+        model.objects.all().delete()
+    FilmRollup.objects.bulk_create(film_rollups)
+    CategoryRollup.objects.bulk_create(category_rollups.values())
+    monthly_store_revenue = rebuild_revenue_series(scan)
+    category_customer_sketch = sketches.rebuild_sketches()
+    CategoryLanguageRollup.objects.bulk_create(category_language_rollups)
+
+    return {
+        'film_rollup': len(film_rollups),
+        'category_rollup': len(category_rollups),
+        'monthly_store_revenue': monthly_store_revenue,
+        'category_customer_sketch': category_customer_sketch,
+        'category_language_rollup': len(category_language_rollups),
+    }
@@ -0,0 +1,84 @@
+from collections import namedtuple
+from decimal import Decimal
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncMonth
+from .models import Category, Film, FilmCategory, Payment
+
+# Single-pass aggregation of the payment fact set, shared by everything that needs rental counts and revenue
+# (the rollup rebuild feeding the bar chart, pie chart, line chart and scatter plot).
+#
+# The payment table is scanned once, joined to rental and inventory and grouped by (film, store, month).
+# Everything else is derived in Python from those few thousand groups and from the small dimension tables (film, category, film_category):
+# per-film totals, per-category totals, per-month and per-store revenue and the overall revenue.
+# Payments that are not linked to a rental fall into the group without a film: they only count towards the monthly and overall revenue.
+
+# Number of rentals (payments linked to a rental) and their total revenue
+Totals = namedtuple('Totals', ['rental_count', 'total_revenue'])
+
+# Result of scan_payments():
+# - films: {film_id: (title, Totals)}
+# - categories: {category_id: (name, Totals)}, only categories with at least one rental
+# - months: {first day of the month: total revenue}
+# - store_months: {(first day of the month, store_id): total revenue}, store_id None for payments without a rental
+# - overall_revenue: revenue of every scanned payment
+# - last_payment_id: highest scanned payment_id (0 without payments)
+PaymentScan = namedtuple('PaymentScan', ['films', 'categories', 'months', 'store_months', 'overall_revenue', 'last_payment_id'])
+
+
+def _add(totals, rental_count, total_revenue):
+    return Totals(totals.rental_count + rental_count, totals.total_revenue + total_revenue)
+
+
+def scan_payments(payments=None):
+    """
+    Aggregates payments in a single pass over the fact tables.
+
+    Args:
+        payments (QuerySet): The payments to aggregate. Defaults to every payment.
+
+    Returns:
+        PaymentScan: Per-film, per-category, per-month and overall totals.
+    """
+    payments = Payment.objects.all() if payments is None else payments
+    groups = (
+        payments.annotate(month=TruncMonth('payment_date'))
+        .values('rental__inventory__film_id', 'rental__inventory__store_id', 'month')
+        .annotate(rental_count=Count('rental_id'), total_revenue=Sum('amount'), last_payment_id=Max('payment_id'))
+        .order_by()
+    )
+
+    film_totals = {}
+    months = {}
+    store_months = {}
+    overall_revenue = Decimal(0)
+    last_payment_id = 0
+    empty = Totals(0, Decimal(0))
+    for group in groups:
+        film_id = group['rental__inventory__film_id']
+        month = group['month'].date()
+        store_month = (month, group['rental__inventory__store_id'])
+        months[month] = months.get(month, Decimal(0)) + group['total_revenue']
+        store_months[store_month] = store_months.get(store_month, Decimal(0)) + group['total_revenue']
+        overall_revenue += group['total_revenue']
+        last_payment_id = max(last_payment_id, group['last_payment_id'])
+        if film_id is not None:
+            film_totals[film_id] = _add(film_totals.get(film_id, empty), group['rental_count'], group['total_revenue'])
+
+    # Fan the film totals out to categories through the film_category map (one row per film and category)
+    category_totals = {}
+    for film_id, category_id in FilmCategory.objects.values_list('film_id', 'category_id'):
+        if film_id not in film_totals:
+            continue
+        totals = film_totals[film_id]
+        category_totals[category_id] = _add(category_totals.get(category_id, empty), totals.rental_count, totals.total_revenue)
+
+    titles = dict(Film.objects.values_list('film_id', 'title'))
+    names = dict(Category.objects.values_list('category_id', 'name'))
+    return PaymentScan(
+        films={film_id: (titles[film_id], totals) for film_id, totals in film_totals.items()},
+        categories={category_id: (names[category_id], totals) for category_id, totals in category_totals.items()},
+        months=months,
+        store_months=store_months,
+        overall_revenue=overall_revenue,
+        last_payment_id=last_payment_id,
+    )
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import FilmCategory, Payment, Rental
+from . import rollups
+from . import timeseries
+
+# Keep the dashboard rollups up to date as new fact rows are inserted.
+# Only inserts made through the ORM are seen here (bulk_create, raw SQL and fixture loading bypass these handlers);
+# run 'python manage.py rebuild_rollups' after loading data by other means.
+# The revenue time series is updated here rather than when the charts read it, so that the chart requests never write;
+# the 'refresh_revenue_series' command picks up the payments that bypassed this handler.
+
+@receiver(post_save, sender=Payment)
+def apply_payment_to_rollups(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        rollups.record_payment(instance)
+        timeseries.record_payment(instance)
+
+@receiver(post_save, sender=Rental)
+def apply_rental_to_rollups(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        rollups.record_rental(instance)
+
+@receiver(post_save, sender=FilmCategory)
+def apply_film_category_to_rollups(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        rollups.record_film_category(instance)
@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.functions import TruncMonth
+from .models import Category, CategoryCustomerSketch, Rental
+from .timeseries import month_of
+
+# Approximate unique customer counts per category for the donut chart (settings.DASHBOARD_DISTINCT_COUNTS = 'approximate').
+#
+# Each (category, store, month) keeps a HyperLogLog sketch of the customers who rented films of that category.
+# A sketch is a fixed array of 2^precision small registers, whatever the number of customers, and sketches merge by taking the register-wise maximum:
+# the sketch of a period or of every store is the merge of its monthly sketches, without reading the rental table.
+# The relative standard error of an estimate is about 1.04 / sqrt(2^precision); the precision is derived from settings.DASHBOARD_SKETCH_ERROR.
+#
+# Sketches are updated incrementally from new rentals (see rollups.record_rental()) and rebuilt by rebuild_rollups().
+# Only month-aligned periods can be answered from sketches; other periods fall back to the exact query.
+
+logger = logging.getLogger(__name__)
+
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+
+def precision_for_error(error):
+    """
+    Returns the smallest precision whose relative standard error (1.04 / sqrt(2^precision)) does not exceed 'error'.
+    """
+    precision = math.ceil(math.log2((1.04 / error) ** 2))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-value sketch (Flajolet et al., with linear counting for small cardinalities).
+
+    Args:
+        precision (int): Number of index bits; the sketch has 2^precision one-byte registers.
+        registers (bytes): Registers of an existing sketch. Defaults to an empty sketch.
+    """
+
+    def __init__(self, precision, registers=None):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f'Precision must be between {MIN_PRECISION} and {MAX_PRECISION}, not {precision}')
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+        if len(self.registers) != 1 << precision:
+            raise ValueError(f'A sketch of precision {precision} has {1 << precision} registers, not {len(self.registers)}')
+
+    def add(self, value):
+        """
+        Adds a value to the sketch. Returns True if the sketch changed.
+        """
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        remaining_bits = 64 - self.precision
+        index = hashed >> remaining_bits
+        # Position of the leftmost 1 bit in the remaining bits
+        rank = remaining_bits - (hashed & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        """
+        Merges another sketch into this one, which then estimates the number of distinct values of both.
+        """
+        if other.precision != self.precision:
+            raise ValueError(f'Cannot merge sketches of precision {self.precision} and {other.precision}')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """
+        Returns the estimated number of distinct values added to the sketch.
+        """
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+def enabled():
+    return settings.DASHBOARD_DISTINCT_COUNTS == 'approximate'
+
+
+def sketch_precision():
+    return precision_for_error(settings.DASHBOARD_SKETCH_ERROR)
+
+
+def _locked_sketch_row(category_id, store_id, month, precision):
+    """
+    Returns the sketch row of a category, store and month locked for update, creating it if it does not exist yet.
+    """
+    key = {'category_id': category_id, 'store_id': store_id, 'month': month}
+    row = CategoryCustomerSketch.objects.select_for_update().filter(**key).first()
+    if row is not None:
+        return row
+    try:
+        # Savepoint so that losing a creation race does not break the surrounding transaction
+        with transaction.atomic():
+            return CategoryCustomerSketch.objects.create(**key, precision=precision, registers=bytes(1 << precision))
+    except IntegrityError:
+        return CategoryCustomerSketch.objects.select_for_update().get(**key)
+
+
+@transaction.atomic
+def record_rental(rental, category_ids):
+    """
+    Adds the customer of a newly inserted rental to the sketches of the rented film's categories.
+    """
+    precision = sketch_precision()
+    month = month_of(rental.rental_date)
+    for category_id in category_ids:
+        row = _locked_sketch_row(category_id, rental.inventory.store_id, month, precision)
+        if row.precision != precision:
+            logger.warning('Sketch of category %s has precision %s instead of %s; run rebuild_rollups', category_id, row.precision, precision)
+            continue
+        sketch = HyperLogLog(row.precision, row.registers)
+        if sketch.add(rental.customer_id):
+            row.registers = bytes(sketch.registers)
+            row.save(update_fields=['registers', 'last_update'])
+
+
+def rebuild_sketches():
+    """
+    Recomputes every sketch from the rental table, or removes them when the approximate mode is disabled.
+    Called by rebuild_rollups(), in its transaction.
+
+    Returns:
+        int: The number of sketches written.
+    """
+    CategoryCustomerSketch.objects.all().delete()
+    if not enabled():
+        return 0
+
+    precision = sketch_precision()
+    sketches = {}
+    rows = (
+        Rental.objects.filter(inventory__film__filmcategory__isnull=False)
+        .annotate(month=TruncMonth('rental_date'))
+        .values_list('inventory__film__filmcategory__category_id', 'inventory__store_id', 'month', 'customer_id')
+        .distinct()
+    )
+    for category_id, store_id, month, customer_id in rows.iterator():
+        key = (category_id, store_id, month.date())
+        if key not in sketches:
+            sketches[key] = HyperLogLog(precision)
+        sketches[key].add(customer_id)
+
+    CategoryCustomerSketch.objects.bulk_create([
+        CategoryCustomerSketch(category_id=category_id, store_id=store_id, month=month, precision=precision, registers=bytes(sketch.registers))
+        for (category_id, store_id, month), sketch in sketches.items()
+    ])
+    return len(sketches)
+
+
+def _month_range(filters):
+    """
+    Returns the (first month, last month) covered by the filters' date range, None for an open end,
+    or None if the range does not consist of whole months.
+    """
+    if filters.date_from is not None and filters.date_from.day != 1:
+        return None
+    if filters.date_to is not None and (filters.date_to + timedelta(days=1)).day != 1:
+        return None
+    return filters.date_from, filters.date_to and filters.date_to.replace(day=1)
+
+
+def estimate_customer_counts(filters):
+    """
+    Estimates the number of unique customers per category for the given filters by merging the monthly sketches.
+
+    Args:
+        filters (DashboardFilters): Dashboard filters; the date range must consist of whole months.
+
+    Returns:
+        list: (category name, estimated customer count) tuples, or None if the filters cannot be answered from the sketches
+        (a date range of partial months, or no sketch matching the range and the current precision).
+    """
+    months = _month_range(filters)
+    if months is None:
+        return None
+
+    rows = CategoryCustomerSketch.objects.filter(precision=sketch_precision())
+    first_month, last_month = months
+    if first_month is not None:
+        rows = rows.filter(month__gte=first_month)
+    if last_month is not None:
+        rows = rows.filter(month__lte=last_month)
+    if filters.store_id is not None:
+        rows = rows.filter(store_id=filters.store_id)
+
+    merged = {}
+    for category_id, precision, registers in rows.values_list('category_id', 'precision', 'registers').iterator():
+        sketch = HyperLogLog(precision, registers)
+        if category_id in merged:
+            merged[category_id].merge(sketch)
+        else:
+            merged[category_id] = sketch
+
+    if not merged:
+        # No sketch at the current precision for these months and store: not built yet, or built at another DASHBOARD_SKETCH_ERROR
+        # (the exact query answers an empty range as cheaply)
+        return None
+
+    names = dict(Category.objects.filter(category_id__in=merged).values_list('category_id', 'name'))
+    return [(names[category_id], sketch.count()) for category_id, sketch in merged.items()]
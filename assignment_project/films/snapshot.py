@@ -0,0 +1,344 @@
+import threading
+from collections import namedtuple
+from decimal import Decimal
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from assignment_project.routers import read_connection
+from .filters import NO_FILTERS, date_bounds
+from .models import Category, Film, FilmCategory, Inventory, Language, Payment, Rental
+from .scan import PaymentScan, Totals
+
+# In-process columnar snapshot of the dashboard fact tables (settings.DASHBOARD_ENGINE = 'snapshot').
+#
+# The columns the charts need are held in compact NumPy arrays, shared read-only by every request of the process:
+# - payment: payment_id, amount (in cents), payment_date, month and rental_id, one array each (one entry per payment, in payment_id order).
+# - rental and inventory: dense arrays indexed by rental_id / inventory_id (index 0, never a valid id, stands for "no rental" / "no inventory").
+# - film_category: the (film_id, category_id) pairs; film: language_id indexed by film_id; and the names of films, categories and languages.
+#
+# The charts aggregate the arrays with vectorized masks and bincount/unique group-bys (scan(), customer_counts(), category_language_counts()),
+# for any filters, instead of querying the database.
+# Before each use the snapshot is refreshed: payments and rentals above the primary key watermarks are appended,
+# and the small dimension tables are reloaded only if their fingerprint (row count and last update) changed.
+# Like the rollups, updates and deletes of existing payments and rentals are not seen; reload() rebuilds the snapshot from scratch.
+# The refresh queries run without holding the lock, on the database the request reads from (the analytics replica, see
+# assignment_project/routers.py): requests refreshing at the same time each build their own tables, and the first one done is kept.
+
+Tables = namedtuple('Tables', [
+    'payment_ids', 'payment_amounts', 'payment_dates', 'payment_months', 'payment_rentals',
+    'rental_inventories', 'rental_customers', 'rental_dates',
+    'inventory_films', 'inventory_stores',
+    'film_category_films', 'film_category_categories', 'film_languages',
+    'titles', 'category_names', 'language_names', 'customer_count',
+    'last_payment_id', 'last_rental_id', 'fingerprint',
+])
+
+# Fingerprint of the dimension tables: any insert, update or delete changes a row count or a last update
+FINGERPRINT_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM film), (SELECT MAX(last_update) FROM film),
+    (SELECT COUNT(*) FROM film_category), (SELECT MAX(last_update) FROM film_category),
+    (SELECT COUNT(*) FROM category), (SELECT MAX(last_update) FROM category),
+    (SELECT COUNT(*) FROM language), (SELECT MAX(last_update) FROM language),
+    (SELECT COUNT(*) FROM inventory), (SELECT MAX(last_update) FROM inventory),
+    (SELECT COUNT(*) FROM customer);
+"""
+
+_tables = None
+_lock = threading.Lock()
+
+
+def enabled():
+    return settings.DASHBOARD_ENGINE == 'snapshot'
+
+
+def _read_only(*arrays):
+    for array in arrays:
+        array.setflags(write=False)
+    return arrays
+
+
+def _local_datetimes(values):
+    """
+    Converts aware datetimes to naive datetime64 values in the current time zone, the time zone used for days and months.
+    """
+    return np.array([timezone.localtime(value).replace(tzinfo=None) if timezone.is_aware(value) else value for value in values], dtype='datetime64[s]')
+
+
+def _grow(array, size, fill=0):
+    """
+    Returns a copy of a dense array extended to 'size' entries.
+    """
+    grown = np.full(max(size, len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _load_dimensions(fingerprint, customer_count):
+    """
+    Loads the small dimension tables: inventory, film_category, film languages and the names of films, categories and languages.
+    """
+    inventory = np.array(list(Inventory.objects.values_list('inventory_id', 'film_id', 'store_id')), dtype=np.int64).reshape(-1, 3)
+    size = int(inventory[:, 0].max()) + 1 if len(inventory) else 1
+    inventory_films = np.zeros(size, dtype=np.int64)
+    inventory_stores = np.zeros(size, dtype=np.int64)
+    inventory_films[inventory[:, 0]] = inventory[:, 1]
+    inventory_stores[inventory[:, 0]] = inventory[:, 2]
+
+    film_categories = np.array(list(FilmCategory.objects.values_list('film_id', 'category_id')), dtype=np.int64).reshape(-1, 2)
+    films = list(Film.objects.values_list('film_id', 'title', 'language_id'))
+    film_languages = np.zeros(max((film_id for film_id, _, _ in films), default=0) + 1, dtype=np.int64)
+    for film_id, _, language_id in films:
+        film_languages[film_id] = language_id
+
+    return {
+        'inventory_films': inventory_films,
+        'inventory_stores': inventory_stores,
+        'film_category_films': np.ascontiguousarray(film_categories[:, 0]),
+        'film_category_categories': np.ascontiguousarray(film_categories[:, 1]),
+        'film_languages': film_languages,
+        'titles': {film_id: title for film_id, title, _ in films},
+        'category_names': dict(Category.objects.values_list('category_id', 'name')),
+        'language_names': dict(Language.objects.values_list('language_id', 'name')),
+        'customer_count': customer_count,
+        'fingerprint': fingerprint,
+    }
+
+
+def _empty_tables():
+    return Tables(
+        payment_ids=np.zeros(0, dtype=np.int64), payment_amounts=np.zeros(0, dtype=np.int64),
+        payment_dates=np.zeros(0, dtype='datetime64[s]'), payment_months=np.zeros(0, dtype=np.int64),
+        payment_rentals=np.zeros(0, dtype=np.int64),
+        rental_inventories=np.zeros(1, dtype=np.int64), rental_customers=np.zeros(1, dtype=np.int64),
+        rental_dates=np.full(1, np.datetime64('NaT'), dtype='datetime64[s]'),
+        inventory_films=np.zeros(1, dtype=np.int64), inventory_stores=np.zeros(1, dtype=np.int64),
+        film_category_films=np.zeros(0, dtype=np.int64), film_category_categories=np.zeros(0, dtype=np.int64),
+        film_languages=np.zeros(1, dtype=np.int64),
+        titles={}, category_names={}, language_names={}, customer_count=0,
+        last_payment_id=0, last_rental_id=0, fingerprint=None,
+    )
+
+
+def _refresh(tables):
+    """
+    Returns the tables with the rows inserted since they were loaded, or the same tables if nothing changed.
+    Payments are read before rentals, and rentals before the dimensions, so every loaded payment finds its rental and inventory.
+    """
+    changes = {}
+
+    payments = list(
+        Payment.objects.filter(payment_id__gt=tables.last_payment_id).order_by('payment_id')
+        .values_list('payment_id', 'amount', 'payment_date', 'rental_id')
+    )
+    if payments:
+        ids, amounts, dates, rentals = zip(*payments)
+        dates = _local_datetimes(dates)
+        changes.update(
+            payment_ids=np.concatenate([tables.payment_ids, np.array(ids, dtype=np.int64)]),
+            payment_amounts=np.concatenate([tables.payment_amounts, np.array([int(amount * 100) for amount in amounts], dtype=np.int64)]),
+            payment_dates=np.concatenate([tables.payment_dates, dates]),
+            payment_months=np.concatenate([tables.payment_months, dates.astype('datetime64[M]').astype(np.int64)]),
+            payment_rentals=np.concatenate([tables.payment_rentals, np.array([rental_id or 0 for rental_id in rentals], dtype=np.int64)]),
+            last_payment_id=ids[-1],
+        )
+
+    rentals = list(
+        Rental.objects.filter(rental_id__gt=tables.last_rental_id).order_by('rental_id')
+        .values_list('rental_id', 'inventory_id', 'customer_id', 'rental_date')
+    )
+    if rentals:
+        ids, inventories, customers, dates = zip(*rentals)
+        ids = np.array(ids, dtype=np.int64)
+        size = int(ids[-1]) + 1
+        rental_inventories = _grow(tables.rental_inventories, size)
+        rental_customers = _grow(tables.rental_customers, size)
+        rental_dates = _grow(tables.rental_dates, size, np.datetime64('NaT'))
+        rental_inventories[ids] = inventories
+        rental_customers[ids] = customers
+        rental_dates[ids] = _local_datetimes(dates)
+        changes.update(
+            rental_inventories=rental_inventories, rental_customers=rental_customers, rental_dates=rental_dates,
+            last_rental_id=int(ids[-1]),
+        )
+
+    with read_connection().cursor() as cursor:
+        cursor.execute(FINGERPRINT_QUERY)
+        fingerprint = cursor.fetchone()
+    if fingerprint != tables.fingerprint:
+        changes.update(_load_dimensions(fingerprint, fingerprint[-1]))
+
+    if not changes:
+        return tables
+    _read_only(*(value for value in changes.values() if isinstance(value, np.ndarray)))
+    return tables._replace(**changes)
+
+
+def get_tables():
+    """
+    Returns the current snapshot, refreshed with the rows inserted since the last call.
+    The returned tables are immutable: a refresh builds new arrays, so callers can keep using the tables they got.
+    """
+    global _tables
+    current = _tables
+    # Queries the database outside of the lock, so that the other requests keep using the current snapshot meanwhile
+    refreshed = _refresh(current if current is not None else _empty_tables())
+    with _lock:
+        # Unless another request (or reload()) replaced the snapshot in the meantime: its tables are kept,
+        # and the next call refreshes them
+        if _tables is current:
+            _tables = refreshed
+    return refreshed
+
+
+def reload():
+    """
+    Discards the snapshot, so that the next use loads it from scratch.
+    """
+    global _tables
+    with _lock:
+        _tables = None
+
+
+def _date_mask(dates, filters):
+    start, end = date_bounds(filters)
+    mask = ~np.isnat(dates)
+    if start:
+        mask &= dates >= np.datetime64(timezone.localtime(start).replace(tzinfo=None), 's')
+    if end:
+        mask &= dates < np.datetime64(timezone.localtime(end).replace(tzinfo=None), 's')
+    return mask
+
+
+def _cents(value):
+    return Decimal(int(round(value))).scaleb(-2)
+
+
+def _month(value):
+    return np.datetime64(int(value), 'M').astype('datetime64[D]').item()
+
+
+def scan(filters=NO_FILTERS):
+    """
+    Aggregates the payments matching the filters, like films.scan.scan_payments() over films.filters.filter_payments().
+
+    Returns:
+        PaymentScan: Per-film, per-category, per-month and overall totals.
+    """
+    tables = get_tables()
+    inventories = tables.rental_inventories[tables.payment_rentals]
+    stores = tables.inventory_stores[inventories]
+    films = tables.inventory_films[inventories]
+
+    mask = _date_mask(tables.payment_dates, filters)
+    if filters.store_id is not None:
+        mask &= stores == filters.store_id
+    amounts = tables.payment_amounts[mask]
+    months = tables.payment_months[mask]
+    stores = stores[mask]
+    films = films[mask]
+
+    # Per film: payments linked to a rental
+    film_count = len(tables.film_languages)
+    linked = films > 0
+    film_rentals = np.bincount(films[linked], minlength=film_count)
+    film_revenues = np.bincount(films[linked], weights=amounts[linked], minlength=film_count)
+
+    # Per category: film totals fanned out through the film_category pairs
+    category_count = max(tables.category_names, default=0) + 1
+    category_rentals = np.bincount(tables.film_category_categories, weights=film_rentals[tables.film_category_films], minlength=category_count)
+    category_revenues = np.bincount(tables.film_category_categories, weights=film_revenues[tables.film_category_films], minlength=category_count)
+
+    # Per month and per (month, store), store 0 standing for payments without a rental
+    month_keys, month_index = np.unique(months, return_inverse=True)
+    month_revenues = np.bincount(month_index, weights=amounts, minlength=len(month_keys))
+    store_month_keys, store_month_index = np.unique(np.stack([months, stores]), axis=1, return_inverse=True)
+    store_month_revenues = np.bincount(store_month_index.ravel(), weights=amounts, minlength=store_month_keys.shape[1])
+
+    return PaymentScan(
+        films={
+            int(film_id): (tables.titles[int(film_id)], Totals(int(film_rentals[film_id]), _cents(film_revenues[film_id])))
+            for film_id in np.flatnonzero(film_rentals)
+        },
+        categories={
+            int(category_id): (tables.category_names[int(category_id)], Totals(int(category_rentals[category_id]), _cents(category_revenues[category_id])))
+            for category_id in np.flatnonzero(category_rentals)
+        },
+        months={_month(month): _cents(revenue) for month, revenue in zip(month_keys, month_revenues)},
+        store_months={
+            (_month(month), int(store) or None): _cents(revenue)
+            for (month, store), revenue in zip(store_month_keys.T, store_month_revenues)
+        },
+        overall_revenue=_cents(amounts.sum()),
+        last_payment_id=int(tables.payment_ids[mask].max()) if mask.any() else 0,
+    )
+
+
+def _rentals(tables, filters):
+    """
+    Returns the (film_id, customer_id) arrays of the rentals matching the filters.
+    """
+    inventories = tables.rental_inventories
+    mask = (inventories > 0) & _date_mask(tables.rental_dates, filters)
+    if filters.store_id is not None:
+        mask &= tables.inventory_stores[inventories] == filters.store_id
+    return tables.inventory_films[inventories[mask]], tables.rental_customers[mask]
+
+
+def customer_counts(filters=NO_FILTERS):
+    """
+    Returns the exact number of unique customers who rented films of each category, for the rentals matching the filters.
+
+    Returns:
+        list: (category name, customer count) tuples, for the categories with at least one customer.
+    """
+    tables = get_tables()
+    films, customers = _rentals(tables, filters)
+    if not len(films):
+        return []
+
+    # Unique (film, customer) pairs first, then one (category, customer) pair per category of the film
+    stride = int(customers.max()) + 1
+    film_customers = np.unique(films * stride + customers)
+    films, customers = film_customers // stride, film_customers % stride
+
+    order = np.argsort(tables.film_category_films, kind='stable')
+    category_films = tables.film_category_films[order]
+    categories = tables.film_category_categories[order]
+    starts = np.searchsorted(category_films, films, side='left')
+    counts = np.searchsorted(category_films, films, side='right') - starts
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_categories = categories[np.repeat(starts, counts) + offsets]
+    pair_customers = np.repeat(customers, counts)
+
+    category_customers = np.unique(pair_categories * stride + pair_customers)
+    totals = np.bincount(category_customers // stride)
+    return [(tables.category_names[int(category_id)], int(totals[category_id])) for category_id in np.flatnonzero(totals)]
+
+
+def category_language_counts(filters=NO_FILTERS):
+    """
+    Returns the number of films per category and language; with filters, only the films rented in the matching rentals.
+
+    Returns:
+        list: (category name, language name, film count) tuples.
+    """
+    tables = get_tables()
+    films = tables.film_category_films
+    categories = tables.film_category_categories
+    if filters != NO_FILTERS:
+        rented = np.isin(films, _rentals(tables, filters)[0])
+        films, categories = films[rented], categories[rented]
+
+    pairs, counts = np.unique(np.stack([categories, tables.film_languages[films]]), axis=1, return_counts=True)
+    return [
+        (tables.category_names[int(category_id)], tables.language_names[int(language_id)], int(count))
+        for (category_id, language_id), count in zip(pairs.T, counts)
+    ]
+
+
+def customer_count():
+    """
+    Returns the number of customers.
+    """
+    return get_tables().customer_count
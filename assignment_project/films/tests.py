@@ -1,3 +1,1056 @@
-from django.test import TestCase
+import csv
+import importlib
+import json
+import os
+import random
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest import SkipTest, mock
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from users.models import Customer
+from .models import (
+    Actor, Category, CategoryCustomerSketch, CategoryLanguageRollup, CategoryRollup, Film, FilmCategory, FilmRollup, Inventory, Language, MonthlyStoreRevenue,
+    FilmActor, Payment, Rental, RevenueSeriesWatermark,
+)
+from . import charts, executor, snapshot
+from .cache import CACHE_ALIAS, data_version, get_chart_data
+from .executor import build_charts
+from .export import RENTAL_COLUMNS, stream_rentals
+from .filters import NO_FILTERS, DashboardFilters, parse_filters
+from .rollups import rebuild_rollups
+from .scan import scan_payments
+from .sketches import HyperLogLog, estimate_customer_counts, precision_for_error
+from .timeseries import refresh_revenue_series, revenue_by_month
 
 # Create your tests here.
+
+class DashboardDataMixin:
+    """
+    Creates a small Sakila-like data set through the ORM:
+        - 2 languages, 2 categories and 3 films ('Alpha' and 'Beta' are Action films, 'Gamma' is a Comedy film in French).
+        - 3 customers, of whom 2 rent films.
+        - 4 rentals with one payment each, plus one payment that is not linked to a rental.
+    """
+
+    def create_dashboard_data(self):
+        self.english = Language.objects.create(language_id=1, name='English')
+        self.french = Language.objects.create(language_id=2, name='French')
+        self.action = Category.objects.create(category_id=1, name='Action')
+        self.comedy = Category.objects.create(category_id=2, name='Comedy')
+
+        self.alpha = self.create_film(1, 'Alpha', self.english, self.action)
+        self.beta = self.create_film(2, 'Beta', self.english, self.action)
+        self.gamma = self.create_film(3, 'Gamma', self.french, self.comedy)
+
+        for customer_id in (1, 2, 3):
+            Customer.objects.create(customer_id=customer_id, first_name=f'Customer{customer_id}', last_name='Test', active=True)
+
+        self.rent(1, self.alpha, customer_id=1, amount='2.99', when=datetime(2005, 5, 25, tzinfo=timezone.utc))
+        self.rent(2, self.alpha, customer_id=2, amount='4.99', when=datetime(2005, 5, 26, tzinfo=timezone.utc))
+        self.rent(3, self.beta, customer_id=1, amount='0.99', when=datetime(2005, 6, 1, tzinfo=timezone.utc))
+        self.rent(4, self.gamma, customer_id=1, amount='5.99', when=datetime(2005, 6, 2, tzinfo=timezone.utc))
+        Payment.objects.create(payment_id=100, customer_id=3, staff_id=1, rental=None, amount=Decimal('1.00'), payment_date=datetime(2005, 7, 1, tzinfo=timezone.utc))
+
+    def create_film(self, film_id, title, language, category):
+        film = Film.objects.create(
+            film_id=film_id, title=title, language=language, rental_duration=3,
+            rental_rate=Decimal('2.99'), replacement_cost=Decimal('19.99'),
+        )
+        FilmCategory.objects.create(film=film, category=category)
+        Inventory.objects.create(inventory_id=film_id, film=film, store_id=1)
+        return film
+
+    def rent(self, rental_id, film, customer_id, amount, when):
+        rental = Rental.objects.create(rental_id=rental_id, rental_date=when, inventory_id=film.film_id, customer_id=customer_id, staff_id=1)
+        Payment.objects.create(payment_id=rental_id, customer_id=customer_id, staff_id=1, rental=rental, amount=Decimal(amount), payment_date=when)
+        return rental
+
+
+class RollupTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the incremental maintenance and the full rebuild of the dashboard rollup tables.
+    """
+
+    def setUp(self):
+        self.create_dashboard_data()
+
+    def snapshot(self):
+        """
+        Returns the content of every rollup table in a comparable form.
+        """
+        return {
+            'films': list(FilmRollup.objects.order_by('film_id').values_list('film_id', 'title', 'rental_count', 'total_revenue')),
+            'categories': list(CategoryRollup.objects.order_by('category_id').values_list('category_id', 'name', 'rental_count', 'total_revenue', 'customer_count')),
+            'months': revenue_by_month(),
+            'category_languages': list(CategoryLanguageRollup.objects.order_by('category_id', 'language_id').values_list('category_name', 'language_name', 'film_count')),
+        }
+
+    def test_rollups_updated_incrementally(self):
+        """
+        Asserts that inserting rentals and payments through the ORM keeps the rollups up to date:
+            - Films and categories count one rental per payment and sum its amount.
+            - Customers are counted once per category, however many films of that category they rent.
+            - Payments without a rental are not counted.
+        """
+        self.assertEqual(FilmRollup.objects.get(film_id=self.alpha.film_id).rental_count, 2)
+        self.assertEqual(FilmRollup.objects.get(film_id=self.alpha.film_id).total_revenue, Decimal('7.98'))
+
+        action = CategoryRollup.objects.get(category_id=self.action.category_id)
+        self.assertEqual(action.rental_count, 3)
+        self.assertEqual(action.total_revenue, Decimal('8.97'))
+        # Customer 1 rented both Alpha and Beta, customer 2 rented Alpha
+        self.assertEqual(action.customer_count, 2)
+        self.assertEqual(CategoryRollup.objects.get(category_id=self.comedy.category_id).customer_count, 1)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        """
+        Asserts that a full rebuild produces exactly the rollups maintained incrementally.
+        """
+        incremental = self.snapshot()
+        counts = rebuild_rollups()
+        self.assertEqual(self.snapshot(), incremental)
+        self.assertEqual(counts['film_rollup'], 3)
+        self.assertEqual(counts['monthly_store_revenue'], 3)
+        self.assertEqual(counts['category_language_rollup'], 2)
+
+    def test_film_category_creation_race(self):
+        """
+        Asserts that a film/category link whose category/language rollup row is created by a concurrent insert, between the update
+        finding no row and its own creation, is counted in that row instead of failing the insert.
+        """
+        update = QuerySet.update
+        raced = []
+
+        def racing_update(queryset, **kwargs):
+            if queryset.model is CategoryLanguageRollup and not raced:
+                raced.append(True)
+                CategoryLanguageRollup.objects.create(category_id=self.comedy.category_id, category_name='Comedy',
+                                                      language_id=self.english.language_id, language_name='English', film_count=1)
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            self.create_film(4, 'Delta', self.english, self.comedy)
+        self.assertTrue(raced)
+        self.assertEqual(
+            CategoryLanguageRollup.objects.get(category_id=self.comedy.category_id, language_id=self.english.language_id).film_count, 2,
+        )
+
+
+class RevenueSeriesTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the monthly revenue time series.
+    """
+
+    def setUp(self):
+        self.create_dashboard_data()
+
+    def pay(self, payment_id, amount, when):
+        return Payment.objects.create(payment_id=payment_id, customer_id=1, staff_id=1, rental=None, amount=Decimal(amount), payment_date=when)
+
+    def test_payments_applied_as_saved(self):
+        """
+        Asserts that the payments saved through the ORM are added to the series as they are saved, without taking the watermark lock,
+        payments without a rental being kept apart from the store revenue, and that a refresh then seals the months that are over.
+        """
+        self.assertEqual(revenue_by_month(), [
+            (datetime(2005, 5, 1).date(), Decimal('7.98')),
+            (datetime(2005, 6, 1).date(), Decimal('6.98')),
+            (datetime(2005, 7, 1).date(), Decimal('1.00')),
+        ])
+        self.assertEqual(revenue_by_month(store_id=1)[-1], (datetime(2005, 6, 1).date(), Decimal('6.98')))
+        self.assertFalse(RevenueSeriesWatermark.objects.exists())
+        self.assertFalse(MonthlyStoreRevenue.objects.filter(sealed=True).exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.pay(101, '1.00', datetime(2005, 7, 2, tzinfo=timezone.utc))
+        self.assertFalse([query['sql'] for query in queries.captured_queries if 'revenue_series_watermark' in query['sql']])
+
+        self.assertEqual(refresh_revenue_series(), 3)
+        self.assertFalse(MonthlyStoreRevenue.objects.filter(sealed=False).exists())
+        self.assertEqual(RevenueSeriesWatermark.objects.get().last_payment_id, 101)
+        self.assertEqual(dict(revenue_by_month())[datetime(2005, 7, 1).date()], Decimal('2.00'))
+
+    def test_late_payments_are_applied_to_sealed_months(self):
+        """
+        Asserts that a payment saved in a sealed month is added to it, so that the series keeps matching the payments.
+        Its row, if new, stays open until the next refresh.
+        """
+        refresh_revenue_series()
+        self.pay(101, '1.50', datetime(2005, 5, 31, tzinfo=timezone.utc))
+        self.assertEqual(MonthlyStoreRevenue.objects.get(month=datetime(2005, 5, 1).date(), store_id=None).total_revenue, Decimal('1.50'))
+        self.assertEqual(revenue_by_month(), sorted(scan_payments().months.items()))
+        # The next refresh recomputes the month, with the same revenue, and seals its new row
+        refresh_revenue_series()
+        self.assertEqual(revenue_by_month(), sorted(scan_payments().months.items()))
+        self.assertFalse(MonthlyStoreRevenue.objects.filter(sealed=False).exists())
+
+    def test_refresh_recomputes_months_of_new_payments(self):
+        """
+        Asserts that a refresh recomputes the open months and the months of the payments above the watermark (here inserted without
+        the signal, one of them in a sealed month), and that a sealed month without new payments is left as it is.
+        """
+        refresh_revenue_series()
+        MonthlyStoreRevenue.objects.filter(month=datetime(2005, 6, 1).date()).update(total_revenue=Decimal('99.00'))
+        now = datetime.now(timezone.utc)
+        Payment.objects.bulk_create([
+            Payment(payment_id=101, customer_id=1, staff_id=1, amount=Decimal('2.00'), payment_date=now),
+            Payment(payment_id=102, customer_id=1, staff_id=1, amount=Decimal('3.00'), payment_date=now),
+            Payment(payment_id=103, customer_id=1, staff_id=1, amount=Decimal('9.99'), payment_date=datetime(2005, 5, 31, tzinfo=timezone.utc)),
+        ])
+        with mock.patch('films.timeseries.WATERMARK_LAG', 0):
+            self.assertEqual(refresh_revenue_series(), 2)
+
+        months = dict(revenue_by_month())
+        self.assertEqual(months[datetime(2005, 5, 1).date()], Decimal('17.97'))
+        self.assertEqual(months[datetime(2005, 6, 1).date()], Decimal('99.00'))
+        self.assertEqual(months[now.date().replace(day=1)], Decimal('5.00'))
+        self.assertTrue(MonthlyStoreRevenue.objects.filter(sealed=False).exists())
+        self.assertEqual(RevenueSeriesWatermark.objects.get().last_payment_id, 103)
+
+        # The payment signal adds the new payments to the open month too
+        self.pay(104, '1.00', now)
+        self.assertEqual(dict(revenue_by_month())[now.date().replace(day=1)], Decimal('6.00'))
+
+    def test_refresh_rescans_below_the_watermark(self):
+        """
+        Asserts that a payment committed after a payment with a higher id, and so below the watermark, is picked up by the next refresh.
+        """
+        refresh_revenue_series()
+        Payment.objects.bulk_create([
+            Payment(payment_id=110, customer_id=1, staff_id=1, amount=Decimal('2.00'), payment_date=datetime(2005, 6, 10, tzinfo=timezone.utc)),
+        ])
+        refresh_revenue_series()
+        self.assertEqual(RevenueSeriesWatermark.objects.get().last_payment_id, 110)
+        Payment.objects.bulk_create([
+            Payment(payment_id=105, customer_id=1, staff_id=1, amount=Decimal('3.00'), payment_date=datetime(2005, 6, 11, tzinfo=timezone.utc)),
+        ])
+        refresh_revenue_series()
+        self.assertEqual(dict(revenue_by_month())[datetime(2005, 6, 1).date()], Decimal('11.98'))
+        self.assertEqual(RevenueSeriesWatermark.objects.get().last_payment_id, 110)
+
+    def test_charts_do_not_write(self):
+        """
+        Asserts that reading the series, and building the charts built from it, only runs SELECT queries.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            revenue_by_month()
+            charts.pie_chart_data()
+            charts.line_chart_data()
+        self.assertTrue(queries.captured_queries)
+        for query in queries.captured_queries:
+            self.assertTrue(query['sql'].lstrip().upper().startswith('SELECT'), query['sql'])
+
+    def test_rebuild_matches_refresh(self):
+        """
+        Asserts that a full rebuild produces the same series as the payment signal and the refresh, and moves the watermark to the latest payment.
+        """
+        refresh_revenue_series()
+        refreshed = revenue_by_month()
+        rebuild_rollups()
+        self.assertEqual(RevenueSeriesWatermark.objects.get().last_payment_id, 100)
+        self.assertEqual(revenue_by_month(), refreshed)
+
+
+class PaymentScanTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the single-pass aggregation of the payments.
+    """
+
+    def setUp(self):
+        self.create_dashboard_data()
+
+    def test_scan_totals(self):
+        """
+        Asserts that one scan returns the per-film, per-category, per-month and overall totals:
+            - Films and categories only count payments linked to a rental.
+            - The monthly and overall revenue include every payment.
+        """
+        scan = scan_payments()
+        self.assertEqual(scan.films[self.alpha.film_id], ('Alpha', (2, Decimal('7.98'))))
+        self.assertEqual(scan.categories[self.action.category_id], ('Action', (3, Decimal('8.97'))))
+        self.assertEqual(scan.categories[self.comedy.category_id], ('Comedy', (1, Decimal('5.99'))))
+        self.assertEqual(scan.months[datetime(2005, 7, 1).date()], Decimal('1.00'))
+        self.assertEqual(scan.overall_revenue, Decimal('15.96'))
+
+    def test_scan_reads_payments_once(self):
+        """
+        Asserts that the payments are read by a single query, the other queries only reading the dimension tables.
+        """
+        # Payments, film_category, film and category
+        with self.assertNumQueries(4):
+            scan_payments()
+
+    def test_scan_of_filtered_payments(self):
+        """
+        Asserts that the scan aggregates only the given payments.
+        """
+        scan = scan_payments(Payment.objects.filter(payment_date__gte=datetime(2005, 6, 1, tzinfo=timezone.utc)))
+        self.assertNotIn(self.alpha.film_id, scan.films)
+        self.assertEqual(scan.overall_revenue, Decimal('7.98'))
+
+
+class FilmDashboardViewTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the FilmDashboardView page shell and the ChartDataView JSON endpoints.
+    """
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.create_dashboard_data()
+
+    def get_chart(self, chart, **headers):
+        return self.client.get(reverse('film_chart_data', kwargs={'chart': chart}), headers=headers)
+
+    def test_dashboard_shell_renders_without_queries(self):
+        """
+        Asserts that the dashboard page renders without querying the database and links to the chart data endpoints.
+        """
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('film_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('film_chart_data', kwargs={'chart': '__chart__'}))
+
+    def test_chart_endpoints_return_rollup_data(self):
+        """
+        Asserts that every chart endpoint returns its data built from the rollups.
+        """
+        bar_chart_data = self.get_chart('bar').json()
+        self.assertEqual(bar_chart_data['titles'], ['Alpha', 'Beta', 'Gamma'])
+        self.assertEqual(bar_chart_data['rental_counts'], [2, 1, 1])
+
+        pie_chart_data = self.get_chart('pie').json()
+        self.assertEqual(pie_chart_data['titles'], ['Alpha', 'Gamma', 'Beta'])
+        # Alpha earned 7.98 out of the overall revenue of 15.96
+        self.assertEqual(pie_chart_data['percentages'][0], '50.00%')
+
+        self.assertEqual(self.get_chart('line').json()['months'], ['2005-05', '2005-06', '2005-07'])
+
+        donut_chart_data = self.get_chart('donut').json()
+        self.assertEqual(donut_chart_data['categories'], ['Action', 'Comedy'])
+        self.assertEqual(donut_chart_data['percentages'], [66.67, 33.33])
+
+        clustered_bar_chart_data = self.get_chart('clustered-bar').json()
+        self.assertEqual(clustered_bar_chart_data['languages'], ['English', 'French'])
+        self.assertEqual(clustered_bar_chart_data['data'], [[2, 0], [0, 1]])
+
+        scatter_plot_data = self.get_chart('scatter').json()
+        self.assertEqual(scatter_plot_data['categories'], ['Action', 'Comedy'])
+        self.assertEqual(scatter_plot_data['avg_revenue_per_rentals'], [2.99, 5.99])
+
+    def test_unknown_chart(self):
+        """
+        Asserts that an unknown chart name results in a 404 Not Found response.
+        """
+        self.assertEqual(self.get_chart('radar').status_code, 404)
+
+    def test_conditional_get(self):
+        """
+        Asserts that chart responses carry ETag and Last-Modified headers, and that a matching If-None-Match header
+        gets a 304 Not Modified response after the version probe only.
+        """
+        response = self.get_chart('bar')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response.headers)
+        etag = response.headers['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.get_chart('bar', if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # New data changes the ETag
+        self.rent(5, self.gamma, customer_id=2, amount='1.99', when=datetime(2005, 6, 3, tzinfo=timezone.utc))
+        response = self.get_chart('bar', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+class DashboardCacheTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the versioned cache of the dashboard chart data.
+    """
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.create_dashboard_data()
+
+    def test_repeat_request_only_probes_version(self):
+        """
+        Asserts that once a chart is cached, requesting its data runs only the data version probe query.
+        """
+        url = reverse('film_chart_data', kwargs={'chart': 'bar'})
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['titles'], ['Alpha', 'Beta', 'Gamma'])
+
+    def test_new_payment_invalidates_cache(self):
+        """
+        Asserts that a new payment changes the data version, so the charts are rebuilt with the new data.
+        """
+        version = data_version()
+        self.assertEqual(get_chart_data(['bar_chart_data'], version)['bar_chart_data']['rental_counts'], [2, 1, 1])
+
+        self.rent(5, self.gamma, customer_id=2, amount='1.99', when=datetime(2005, 6, 3, tzinfo=timezone.utc))
+        self.rent(6, self.gamma, customer_id=3, amount='1.99', when=datetime(2005, 6, 4, tzinfo=timezone.utc))
+
+        self.assertNotEqual(data_version(), version)
+        bar_chart_data = get_chart_data(['bar_chart_data'])['bar_chart_data']
+        self.assertEqual(bar_chart_data['titles'], ['Gamma', 'Alpha', 'Beta'])
+        self.assertEqual(bar_chart_data['rental_counts'], [3, 2, 1])
+
+    def test_rebuild_invalidates_cache(self):
+        """
+        Asserts that a full rebuild of the rollups changes the data version.
+        """
+        version = data_version()
+        rebuild_rollups()
+        self.assertNotEqual(data_version(), version)
+
+    def test_rental_and_inventory_updates_invalidate_cache(self):
+        """
+        Asserts that moving an inventory item to another store, or a rental to another inventory item, changes the data version,
+        so the filtered charts are rebuilt.
+        """
+        store_filter = DashboardFilters(None, None, 2)
+        version = data_version()
+        titles = get_chart_data(['bar_chart_data'], version, store_filter)['bar_chart_data']['titles']
+
+        Inventory.objects.filter(inventory_id=self.gamma.film_id).update(store_id=2, last_update=datetime(2030, 1, 1, tzinfo=timezone.utc))
+        moved_version = data_version()
+        self.assertNotEqual(moved_version, version)
+        self.assertNotEqual(get_chart_data(['bar_chart_data'], moved_version, store_filter)['bar_chart_data']['titles'], titles)
+
+        Rental.objects.filter(inventory_id=self.gamma.film_id).update(inventory_id=self.alpha.film_id, last_update=datetime(2030, 1, 2, tzinfo=timezone.utc))
+        self.assertNotEqual(data_version(), moved_version)
+
+
+class DashboardFiltersTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the date range and store filters of the dashboard charts.
+    """
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.create_dashboard_data()
+        # A rental from store 2, in June 2005
+        Inventory.objects.create(inventory_id=10, film=self.beta, store_id=2)
+        rental = Rental.objects.create(rental_id=10, rental_date=datetime(2005, 6, 15, tzinfo=timezone.utc), inventory_id=10, customer_id=3, staff_id=2)
+        Payment.objects.create(payment_id=10, customer_id=3, staff_id=2, rental=rental, amount=Decimal('3.99'), payment_date=datetime(2005, 6, 15, tzinfo=timezone.utc))
+
+    def get_chart(self, chart, **params):
+        return self.client.get(reverse('film_chart_data', kwargs={'chart': chart}), params)
+
+    def test_parse_filters(self):
+        """
+        Asserts that the filter parameters are parsed, empty parameters ignored and malformed parameters rejected.
+        """
+        self.assertEqual(parse_filters({'from': '2005-06-01', 'to': '', 'store': '2'}), DashboardFilters(datetime(2005, 6, 1).date(), None, 2))
+        for params in ({'from': '2005-13-01'}, {'to': 'yesterday'}, {'store': 'main'}, {'from': '2005-06-02', 'to': '2005-06-01'}):
+            with self.assertRaises(ValueError):
+                parse_filters(params)
+
+    def test_date_range_applies_to_every_chart(self):
+        """
+        Asserts that a date range restricts every chart to the payments and rentals of that period, 'to' being inclusive.
+        """
+        params = {'from': '2005-06-01', 'to': '2005-06-02'}
+        bar_chart_data = self.get_chart('bar', **params).json()
+        self.assertEqual(bar_chart_data['titles'], ['Beta', 'Gamma'])
+        self.assertEqual(self.get_chart('line', **params).json()['months'], ['2005-06'])
+        # Gamma earned 5.99 out of the 6.98 paid in the period
+        self.assertEqual(self.get_chart('pie', **params).json()['percentages'], ['85.82%', '14.18%'])
+        self.assertEqual(self.get_chart('donut', **params).json()['customer_counts'], [1, 1])
+        self.assertEqual(self.get_chart('clustered-bar', **params).json()['data'], [[1, 0], [0, 1]])
+        self.assertEqual(self.get_chart('scatter', **params).json()['rental_counts'], [1, 1])
+
+    def test_store_filter(self):
+        """
+        Asserts that a store filter restricts the charts to the rentals of that store's inventory.
+        """
+        bar_chart_data = self.get_chart('bar', store='2').json()
+        self.assertEqual(bar_chart_data['titles'], ['Beta'])
+        self.assertEqual(bar_chart_data['total_revenues'], [3.99])
+        self.assertEqual(self.get_chart('donut', store='2').json()['categories'], ['Action'])
+
+    def test_unfiltered_charts_read_rollups(self):
+        """
+        Asserts that without filters the charts are built from the rollups, which match an unbounded filtered scan.
+        """
+        unfiltered = self.get_chart('scatter').json()
+        unbounded = self.get_chart('scatter', **{'from': '2000-01-01'}).json()
+        self.assertEqual(unfiltered, unbounded)
+
+    def test_invalid_filters(self):
+        """
+        Asserts that invalid filter parameters result in a 400 Bad Request response.
+        """
+        response = self.get_chart('bar', store='main')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+class HyperLogLogTestCase(SimpleTestCase):
+    """
+    Test case for the HyperLogLog sketch.
+    """
+
+    def test_precision_for_error(self):
+        """
+        Asserts that the precision is the smallest one meeting the error bound, within the supported range.
+        """
+        self.assertEqual(precision_for_error(0.02), 12)
+        self.assertEqual(precision_for_error(0.5), 4)
+        self.assertEqual(precision_for_error(0.0001), 16)
+
+    def test_estimates_within_error_bound(self):
+        """
+        Asserts that estimates stay within three standard errors, and that merging two sketches estimates the size of their union.
+        """
+        precision = precision_for_error(0.02)
+        first, second = HyperLogLog(precision), HyperLogLog(precision)
+        for value in range(20000):
+            first.add(value)
+        for value in range(10000, 40000):
+            second.add(value)
+        self.assertLessEqual(abs(first.count() - 20000), 20000 * 0.06)
+        first.merge(second)
+        self.assertLessEqual(abs(first.count() - 40000), 40000 * 0.06)
+
+    def test_small_cardinalities_are_exact(self):
+        """
+        Asserts that small sets are counted exactly and that duplicates do not change the sketch.
+        """
+        sketch = HyperLogLog(12)
+        for value in (1, 2, 3, 1, 2):
+            sketch.add(value)
+        self.assertEqual(sketch.count(), 3)
+        self.assertFalse(sketch.add(3))
+        with self.assertRaises(ValueError):
+            sketch.merge(HyperLogLog(10))
+
+
+@override_settings(DASHBOARD_DISTINCT_COUNTS='approximate', DASHBOARD_SKETCH_ERROR=0.02)
+class ApproximateDistinctCountTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the approximate unique customer counts of the donut chart, compared with the exact counts.
+    """
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.create_dashboard_data()
+
+    def test_sketches_updated_incrementally(self):
+        """
+        Asserts that new rentals update the monthly sketches, which then answer month-aligned filters.
+        """
+        self.assertEqual(CategoryCustomerSketch.objects.count(), 3)
+        filters = DashboardFilters(datetime(2005, 5, 1).date(), datetime(2005, 6, 30).date(), None)
+        self.assertEqual(sorted(estimate_customer_counts(filters)), [('Action', 2), ('Comedy', 1)])
+        # Not month-aligned: answered by the exact query
+        self.assertIsNone(estimate_customer_counts(DashboardFilters(datetime(2005, 5, 2).date(), None, None)))
+
+    def test_no_sketches_falls_back_to_exact_counts(self):
+        """
+        Asserts that without sketches for the filters at the current precision (not built yet, or built for another error target),
+        the donut chart is built by the exact query and not flagged as approximate.
+        """
+        filters = DashboardFilters(datetime(2005, 5, 1).date(), datetime(2005, 6, 30).date(), None)
+        with override_settings(DASHBOARD_DISTINCT_COUNTS='exact'):
+            exact = charts.donut_chart_data(filters)
+
+        with override_settings(DASHBOARD_SKETCH_ERROR=0.01):
+            self.assertIsNone(estimate_customer_counts(filters))
+            self.assertEqual(charts.donut_chart_data(filters), exact)
+
+        CategoryCustomerSketch.objects.all().delete()
+        self.assertIsNone(estimate_customer_counts(filters))
+        self.assertEqual(charts.donut_chart_data(filters), exact)
+        self.assertEqual(exact['categories'], ['Action', 'Comedy'])
+
+    def test_approximate_donut_matches_exact_on_sakila_sized_data(self):
+        """
+        Asserts that on a data set of the size of Sakila (599 customers, 16 categories, about 16,000 rentals over 2 stores)
+        the approximate donut chart stays within three standard errors of the exact query, for every category.
+        """
+        generator = random.Random(42)
+        categories = [Category.objects.create(category_id=category_id, name=f'Category{category_id:02}') for category_id in range(3, 19)]
+        films = [self.create_film(film_id, f'Film{film_id}', self.english, categories[film_id % 16]) for film_id in range(4, 200)]
+        Customer.objects.bulk_create(
+            Customer(customer_id=customer_id, first_name=f'Customer{customer_id}', last_name='Test', active=True)
+            for customer_id in range(4, 600)
+        )
+        Inventory.objects.bulk_create(Inventory(inventory_id=1000 + film.film_id, film=film, store_id=2) for film in films)
+        Rental.objects.bulk_create(
+            Rental(
+                rental_id=1000 + rental_id,
+                rental_date=datetime(2005, generator.choice((5, 6, 7, 8)), generator.randint(1, 28), tzinfo=timezone.utc),
+                inventory_id=generator.choice(films).film_id + 1000 * generator.randint(0, 1),
+                customer_id=generator.randint(1, 599),
+                staff_id=1,
+            )
+            for rental_id in range(16000)
+        )
+        rebuild_rollups()
+
+        filters = DashboardFilters(datetime(2005, 5, 1).date(), datetime(2005, 8, 31).date(), None)
+        approximate = charts.donut_chart_data(filters)
+        with override_settings(DASHBOARD_DISTINCT_COUNTS='exact'):
+            exact = charts.donut_chart_data(filters)
+
+        self.assertTrue(approximate['approximate'])
+        self.assertNotIn('approximate', exact)
+        exact_counts = dict(zip(exact['categories'], exact['customer_counts']))
+        approximate_counts = dict(zip(approximate['categories'], approximate['customer_counts']))
+        self.assertEqual(approximate_counts.keys(), exact_counts.keys())
+        for category, count in exact_counts.items():
+            self.assertLessEqual(abs(approximate_counts[category] - count), count * 0.06, category)
+
+
+class SnapshotTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the in-process columnar snapshot engine, compared with the database engine.
+    """
+
+    def setUp(self):
+        snapshot.reload()
+        self.addCleanup(snapshot.reload)
+        self.create_dashboard_data()
+        Inventory.objects.create(inventory_id=10, film=self.beta, store_id=2)
+        rental = Rental.objects.create(rental_id=10, rental_date=datetime(2005, 6, 15, tzinfo=timezone.utc), inventory_id=10, customer_id=3, staff_id=2)
+        Payment.objects.create(payment_id=10, customer_id=3, staff_id=2, rental=rental, amount=Decimal('3.99'), payment_date=datetime(2005, 6, 15, tzinfo=timezone.utc))
+
+    def test_snapshot_charts_match_database_charts(self):
+        """
+        Asserts that every chart built from the snapshot matches the chart built from the database, with and without filters.
+        """
+        all_filters = [
+            DashboardFilters(),
+            DashboardFilters(datetime(2005, 6, 1).date(), datetime(2005, 6, 2).date(), None),
+            DashboardFilters(None, None, 2),
+            DashboardFilters(datetime(2005, 5, 26).date(), None, 1),
+            DashboardFilters(datetime(2006, 1, 1).date(), None, None),
+        ]
+        for filters in all_filters:
+            for name, builder in charts.CHARTS.items():
+                with self.subTest(filters=filters, chart=name):
+                    expected = builder(filters)
+                    with override_settings(DASHBOARD_ENGINE='snapshot'):
+                        self.assertEqual(builder(filters), expected)
+
+    def test_incremental_refresh(self):
+        """
+        Asserts that the snapshot only reads the rows above its watermarks, and picks up new rentals and payments.
+        """
+        tables = snapshot.get_tables()
+        # New payments, new rentals and the dimension fingerprint
+        with self.assertNumQueries(3):
+            self.assertIs(snapshot.get_tables(), tables)
+
+        # Primary keys keep increasing, as with auto-increment ids
+        self.rent(101, self.gamma, customer_id=2, amount='1.99', when=datetime(2005, 6, 3, tzinfo=timezone.utc))
+        refreshed = snapshot.get_tables()
+        self.assertEqual((refreshed.last_payment_id, refreshed.last_rental_id), (101, 101))
+        self.assertEqual(len(refreshed.payment_ids), len(tables.payment_ids) + 1)
+        self.assertIs(refreshed.inventory_films, tables.inventory_films)
+        self.assertFalse(refreshed.payment_amounts.flags.writeable)
+        self.assertEqual(snapshot.scan().films[self.gamma.film_id][1], (2, Decimal('7.98')))
+
+        # A new category changes the dimension fingerprint
+        Category.objects.create(category_id=3, name='Drama')
+        self.assertEqual(snapshot.get_tables().category_names[3], 'Drama')
+
+    def test_refresh_outside_of_the_lock(self):
+        """
+        Asserts that the snapshot is refreshed without holding the lock, with the fingerprint read on the request's read connection,
+        and that a refresh finishing after another one (or after a reload) does not replace the snapshot.
+        """
+        refresh = snapshot._refresh
+
+        def unlocked_refresh(tables):
+            self.assertFalse(snapshot._lock.locked())
+            return refresh(tables)
+
+        with mock.patch.object(snapshot, '_refresh', unlocked_refresh), \
+                mock.patch.object(snapshot, 'read_connection', return_value=connection) as read_connection:
+            tables = snapshot.get_tables()
+        read_connection.assert_called_once_with()
+        self.assertIs(snapshot._tables, tables)
+
+        # Another request installs its refresh while this one is running: the first one done is kept
+        other = tables._replace(customer_count=-1)
+
+        def overtaken_refresh(tables):
+            snapshot._tables = other
+            return refresh(tables)
+
+        with mock.patch.object(snapshot, '_refresh', overtaken_refresh):
+            self.assertIsNot(snapshot.get_tables(), other)
+        self.assertIs(snapshot._tables, other)
+
+        # Reloaded while refreshing: the next use loads the snapshot from scratch
+        def reloaded_refresh(tables):
+            snapshot.reload()
+            return refresh(tables)
+
+        with mock.patch.object(snapshot, '_refresh', reloaded_refresh):
+            snapshot.get_tables()
+        self.assertIsNone(snapshot._tables)
+
+
+def failing_chart(filters):
+    raise RuntimeError('Query failed')
+
+
+def slow_chart(filters):
+    time.sleep(1)
+    return {"months": ["2005-05"], "total_revenues": [1.0]}
+
+
+@override_settings(DASHBOARD_QUERY_WORKERS=2, DASHBOARD_QUERY_TIMEOUT=0.3)
+class ChartExecutorTestCase(SimpleTestCase):
+    """
+    Test case for the error and timeout isolation of the chart builders.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.dict(charts.CHARTS, {
+            'bar_chart_data': lambda filters: {"titles": ["Alpha"], "rental_counts": [1], "total_revenues": [2.99]},
+            'pie_chart_data': failing_chart,
+            'line_chart_data': slow_chart,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failing_and_slow_charts_degrade_to_empty_charts(self):
+        """
+        Asserts that in concurrent mode a failing chart and a chart exceeding the timeout are returned empty and flagged unavailable,
+        while the other charts are returned normally.
+        """
+        with self.assertLogs('films.executor', 'WARNING') as logs:
+            chart_data = build_charts(['bar_chart_data', 'pie_chart_data', 'line_chart_data'])
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(chart_data['bar_chart_data']['titles'], ['Alpha'])
+        self.assertEqual(chart_data['pie_chart_data'], {**charts.EMPTY_CHARTS['pie_chart_data'], 'unavailable': True})
+        self.assertEqual(chart_data['line_chart_data'], {**charts.EMPTY_CHARTS['line_chart_data'], 'unavailable': True})
+
+    def test_timeout_counts_from_the_start_of_each_chart(self):
+        """
+        Asserts that a chart waiting for a free worker is not charged for the wait: with one worker, two charts of 0.2 seconds
+        both complete within a timeout of 0.3 seconds, although the second one ends 0.4 seconds after submission.
+        """
+        def chart(filters):
+            time.sleep(0.2)
+            return {"titles": ["Alpha"], "rental_counts": [1], "total_revenues": [2.99]}
+
+        with ThreadPoolExecutor(max_workers=1) as pool, mock.patch.object(executor, '_executor', pool), \
+                mock.patch.dict(charts.CHARTS, {'bar_chart_data': chart, 'pie_chart_data': chart}):
+            chart_data = build_charts(['bar_chart_data', 'pie_chart_data'])
+        self.assertNotIn('unavailable', chart_data['bar_chart_data'])
+        self.assertNotIn('unavailable', chart_data['pie_chart_data'])
+
+    def test_workers_keep_their_connections(self):
+        """
+        Asserts that the worker threads only close the connections that are unusable or obsolete, instead of every connection.
+        """
+        with mock.patch.object(executor.connections, 'close_all') as close_all:
+            build_charts(['bar_chart_data'])
+        close_all.assert_not_called()
+
+    @override_settings(DASHBOARD_QUERY_WORKERS=0)
+    def test_sequential_mode_sets_the_statement_timeout(self):
+        """
+        Asserts that in sequential mode each chart also runs under the MySQL statement timeout, reset to the server default afterwards
+        since the request's connection outlives the request.
+        """
+        mysql = mock.MagicMock(vendor='mysql')
+        cursor = mysql.cursor.return_value.__enter__.return_value
+        with mock.patch.object(executor, 'read_connection', return_value=mysql):
+            chart_data = build_charts(['bar_chart_data'])
+        self.assertEqual(chart_data['bar_chart_data']['titles'], ['Alpha'])
+        self.assertEqual(cursor.execute.call_args_list, [
+            mock.call('SET SESSION max_execution_time = %s', [300]),
+            mock.call('SET SESSION max_execution_time = DEFAULT'),
+        ])
+
+    @override_settings(DASHBOARD_QUERY_WORKERS=0)
+    def test_failing_chart_degrades_in_sequential_mode(self):
+        """
+        Asserts that in sequential mode a failing chart is also returned empty and flagged unavailable.
+        """
+        with self.assertLogs('films.executor', 'ERROR'):
+            chart_data = build_charts(['bar_chart_data', 'pie_chart_data'])
+        self.assertEqual(chart_data['bar_chart_data']['titles'], ['Alpha'])
+        self.assertTrue(chart_data['pie_chart_data']['unavailable'])
+
+
+@override_settings(DASHBOARD_QUERY_WORKERS=0)
+class UnavailableChartViewTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the response of ChartDataView when a chart cannot be built.
+    """
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.create_dashboard_data()
+
+    def test_unavailable_chart_is_not_cached(self):
+        """
+        Asserts that a failing chart gets a 200 response with an empty chart that is neither cached by the browser nor by the server.
+        """
+        url = reverse('film_chart_data', kwargs={'chart': 'pie'})
+        with mock.patch.dict(charts.CHARTS, {'pie_chart_data': failing_chart}), self.assertLogs('films.executor', 'ERROR'):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['unavailable'])
+        self.assertIn('no-store', response.headers['Cache-Control'])
+
+        # Once the chart can be built again, it is returned normally
+        response = self.client.get(url, headers={'if_none_match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['titles'], ['Alpha', 'Gamma', 'Beta'])
+
+
+@override_settings(DASHBOARD_QUERY_WORKERS=3)
+class ConcurrentChartsTestCase(DashboardDataMixin, TransactionTestCase):
+    """
+    Test case for building the charts concurrently, each on its own database connection.
+    Uses a TransactionTestCase so that the data is committed and visible to the connections of the worker threads.
+    """
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.create_dashboard_data()
+
+    def test_concurrent_charts_match_sequential_charts(self):
+        """
+        Asserts that every chart built concurrently equals the chart built sequentially on the request's connection.
+        """
+        concurrent = build_charts(list(charts.CHARTS))
+        with override_settings(DASHBOARD_QUERY_WORKERS=0):
+            sequential = build_charts(list(charts.CHARTS))
+        self.assertEqual(concurrent, sequential)
+        self.assertEqual(concurrent['bar_chart_data']['titles'], ['Alpha', 'Beta', 'Gamma'])
+
+
+class CompositeKeyTestCase(DashboardDataMixin, TransactionTestCase):
+    """
+    Test case for the composite primary keys of film_actor and film_category (see migration 0006).
+    Uses a TransactionTestCase because rebuilding a table alters the schema, which SQLite does not allow within the test transaction.
+    """
+
+    def setUp(self):
+        self.create_dashboard_data()
+
+    def primary_key_columns(self, table):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return [constraint['columns'] for constraint in constraints.values() if constraint['primary_key']]
+
+    def test_link_tables_have_composite_keys(self):
+        """
+        Asserts that a film may have several actors and categories, but never the same one twice.
+        """
+        self.assertEqual(self.primary_key_columns('film_actor'), [['actor_id', 'film_id']])
+        self.assertEqual(self.primary_key_columns('film_category'), [['film_id', 'category_id']])
+
+        actor = Actor.objects.create(actor_id=1, first_name='Penelope', last_name='Guiness')
+        FilmActor.objects.create(actor=actor, film=self.alpha)
+        FilmActor.objects.create(actor=actor, film=self.beta)
+        FilmCategory.objects.create(film=self.alpha, category=self.comedy)
+        self.assertEqual(sorted(actor.filmactor_set.values_list('film_id', flat=True)), [1, 2])
+        self.assertEqual(sorted(self.alpha.filmcategory_set.values_list('category_id', flat=True)), [1, 2])
+        self.assertEqual(FilmActor.objects.get(pk=(1, 2)).film, self.beta)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FilmActor.objects.create(actor=actor, film=self.alpha)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FilmCategory.objects.create(film=self.alpha, category=self.action)
+
+        # Saving and deleting an instance only address its own row
+        link = FilmActor.objects.get(pk=(1, 1))
+        link.save()
+        link.delete()
+        self.assertEqual(list(actor.filmactor_set.values_list('film_id', flat=True)), [2])
+
+    def test_surrogate_key_table_is_rebuilt(self):
+        """
+        Asserts that a film_category table created with a surrogate id (as by migration 0001) gets the composite key,
+        its rows (duplicate pairs merged) and its covering index.
+        """
+        ensure_composite_keys = importlib.import_module('films.migrations.0006_composite_keys_and_chart_indexes').ensure_composite_keys
+        quote = connection.ops.quote_name
+        with connection.schema_editor() as schema_editor:
+            schema_editor.delete_model(FilmCategory)
+            schema_editor.execute(
+                f'CREATE TABLE {quote("film_category")} (id integer NOT NULL PRIMARY KEY, film_id integer NOT NULL, '
+                f'category_id integer NOT NULL, last_update datetime NOT NULL)'
+            )
+            schema_editor.execute(
+                f'INSERT INTO {quote("film_category")} (id, film_id, category_id, last_update) VALUES '
+                f"(1, 1, 1, '2006-02-15 05:07:09'), (2, 1, 1, '2006-02-16 05:07:09'), (3, 3, 2, '2006-02-15 05:07:09')"
+            )
+            ensure_composite_keys(schema_editor, [FilmCategory])
+
+        self.assertEqual(self.primary_key_columns('film_category'), [['film_id', 'category_id']])
+        self.assertEqual(
+            list(FilmCategory.objects.order_by('film_id').values_list('film_id', 'category_id', 'last_update__day')), [(1, 1, 16), (3, 2, 15)]
+        )
+        with connection.cursor() as cursor:
+            self.assertIn('idx_film_category_category', connection.introspection.get_constraints(cursor, 'film_category'))
+
+
+class SakilaSampleTestCase(TestCase):
+    """
+    Test case for the charts of the compact Sakila slice (films/fixtures/sakila_sample.json, see the dump_sakila_fixture command).
+    The expected output (films/fixtures/sakila_sample_charts.json) holds for every database backend: the charts are aggregated
+    through the ORM and rounded in Python, so SQLite and MySQL build the same payloads from the same rows.
+    Runs on an empty test database (test_settings.py, or mysql_test_settings.py for MySQL); skipped on a test database already
+    holding Sakila data (e.g. loaded from sql_files/ for a --keepdb run), whose primary keys the fixture would collide with.
+    """
+    fixtures = ['sakila_sample']
+
+    @classmethod
+    def setUpClass(cls):
+        # Before the fixture is loaded
+        if Film.objects.exists():
+            raise SkipTest('The test database already holds Sakila data')
+        super().setUpClass()
+    filters = {
+        'all': DashboardFilters(),
+        '2005-06-01..2005-07-31, store 1': DashboardFilters(date(2005, 6, 1), date(2005, 7, 31), 1),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        # Loading a fixture bypasses the rollup signal handlers
+        rebuild_rollups()
+        with open(os.path.join(os.path.dirname(__file__), 'fixtures', 'sakila_sample_charts.json')) as expected:
+            cls.expected = json.load(expected)
+
+    def test_charts_match_expected_output(self):
+        """
+        Asserts that every chart, with and without filters, matches the expected payload once encoded as JSON.
+        """
+        for key, filters in self.filters.items():
+            for name, builder in charts.CHARTS.items():
+                with self.subTest(filters=key, chart=name):
+                    self.assertEqual(json.loads(json.dumps(builder(filters))), self.expected[key][name])
+
+    def test_rollups_match_fact_tables(self):
+        """
+        Asserts that the unfiltered charts read from the rollups equal the charts aggregated from the fact tables over the whole history.
+        The clustered bar chart is left out: unfiltered, it counts every film, and filtered, the rented ones only.
+        """
+        whole_history = DashboardFilters(date(2005, 1, 1), date(2006, 12, 31), None)
+        for name, builder in charts.CHARTS.items():
+            if name != 'clustered_bar_chart_data':
+                with self.subTest(chart=name):
+                    self.assertEqual(builder(whole_history), builder(NO_FILTERS))
+
+
+class ExportTestCase(DashboardDataMixin, TestCase):
+    """
+    Test case for the CSV and NDJSON exports of the chart datasets and of the rentals.
+    """
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.create_dashboard_data()
+
+    def export(self, dataset, **params):
+        response = self.client.get(reverse('film_export', args=[dataset]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_chart_export(self):
+        """
+        Asserts that a chart is exported as the rows of its payload, filtered like the chart data endpoint.
+        """
+        response, body = self.export('bar')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="bar.csv"')
+        self.assertEqual(list(csv.reader(body.splitlines())), [
+            ['title', 'rental_count', 'total_revenue'], ['Alpha', '2', '7.98'], ['Beta', '1', '0.99'], ['Gamma', '1', '5.99'],
+        ])
+
+        _, body = self.export('clustered-bar', format='ndjson', to='2005-05-31')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [
+            {'category': 'Action', 'language': 'English', 'film_count': 1},
+        ])
+
+    def test_rentals_export(self):
+        """
+        Asserts that the rentals are exported with their payment, film and store, without the payments not linked to a rental.
+        """
+        response, body = self.export('rentals', format='ndjson', **{'from': '2005-05-26'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['payment_id'] for row in rows], [2, 3, 4])
+        self.assertEqual(list(rows[0]), RENTAL_COLUMNS)
+        self.assertEqual(rows[0], {
+            'payment_id': 2, 'payment_date': '2005-05-26T00:00:00Z', 'amount': '4.99', 'customer_id': 2, 'staff_id': 1,
+            'rental_id': 2, 'rental_date': '2005-05-26T00:00:00Z', 'return_date': None, 'inventory_id': 1, 'film_id': 1, 'store_id': 1,
+        })
+
+        _, body = self.export('rentals')
+        lines = list(csv.reader(body.splitlines()))
+        self.assertEqual(lines[0], RENTAL_COLUMNS)
+        self.assertEqual(lines[1][:3], ['1', '2005-05-25T00:00:00+00:00', '2.99'])
+        self.assertEqual(len(lines), 5)
+
+    def test_rentals_are_streamed_in_chunks(self):
+        """
+        Asserts that the rentals are read with a single query, fetched and encoded a chunk at a time, synchronously or asynchronously.
+        """
+        with self.assertNumQueries(1):
+            chunks = list(stream_rentals('csv', NO_FILTERS, chunk_size=3))
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [1, 3, 1])
+
+        async def read(stream):
+            return [chunk async for chunk in stream]
+
+        self.assertEqual(async_to_sync(read)(stream_rentals('csv', NO_FILTERS, asynchronous=True, chunk_size=3)), chunks)
+
+    def test_rentals_export_memory_is_bounded(self):
+        """
+        Asserts that exporting 20,000 rentals allocates a small fraction of the export size at any time, on the test database backend
+        (SQLite in test_settings.py): the rows are not all held in memory at once.
+        """
+        count = 20000
+        when = datetime(2005, 8, 1, tzinfo=timezone.utc)
+        Rental.objects.bulk_create(
+            Rental(rental_id=1000 + number, rental_date=when, inventory_id=self.alpha.film_id, customer_id=1, staff_id=1) for number in range(count)
+        )
+        Payment.objects.bulk_create(
+            Payment(payment_id=1000 + number, customer_id=1, staff_id=1, rental_id=1000 + number, amount=Decimal('2.99'), payment_date=when)
+            for number in range(count)
+        )
+
+        tracemalloc.start()
+        try:
+            size = sum(len(chunk) for chunk in stream_rentals('ndjson', NO_FILTERS, chunk_size=500))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(size, count * 100)
+        # About 0.6 MB for a 4.8 MB export (reading every row into a list first peaks at about 13 MB)
+        self.assertLess(peak, size / 4)
+
+    def test_invalid_exports(self):
+        """
+        Asserts that unknown datasets get a 404 response, and invalid formats and filters a 400 response.
+        """
+        self.assertEqual(self.client.get(reverse('film_export', args=['unknown'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('film_export', args=['bar']), {'format': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('film_export', args=['rentals']), {'store': 'x'}).status_code, 400)
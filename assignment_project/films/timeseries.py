@@ -0,0 +1,167 @@
+from datetime import datetime
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import MonthlyStoreRevenue, Payment, Rental, RevenueSeriesWatermark
+
+# Month x store revenue time series (MonthlyStoreRevenue) behind the line chart and the overall revenue of the pie chart.
+# - record_payment() adds each payment saved through the ORM to the row of its month and store (see films/signals.py), with an F()
+#   increment like the rollups: concurrent payments only wait on the row of their own month and store, and a late payment is applied
+#   to its month even if the month is sealed, so the series never drifts from the film rollups.
+# - refresh_revenue_series(), run periodically by the 'refresh_revenue_series' management command, recomputes from the payment table
+#   the open months and the months of the payments inserted since the previous refresh (including the payments that bypassed the signal,
+#   e.g. bulk inserts), then seals the months that are over: a sealed month is only recomputed again if new payments are dated in it.
+#   The new payments are those above the watermark (the highest payment_id seen by the previous refresh), minus WATERMARK_LAG ids:
+#   concurrent transactions do not commit in payment_id order, so a payment committed after one with a higher id is still picked up.
+# - rebuild_revenue_series() recomputes the whole series from a payment scan (called by rebuild_rollups()).
+# - revenue_by_month() only reads the series: the chart requests never write.
+
+# Number of payment ids below the watermark scanned again by each refresh
+WATERMARK_LAG = 1000
+
+
+def month_of(value):
+    """
+    Returns the first day of the month of a datetime, in the current time zone (the same bucketing TruncMonth uses).
+    """
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date().replace(day=1)
+
+
+def _month_bounds(month):
+    """
+    Returns the start of a month and the start of the next one, as datetimes in the current time zone.
+    """
+    next_month = month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+    bounds = [datetime(day.year, day.month, 1) for day in (month, next_month)]
+    if timezone.is_naive(timezone.now()):
+        return bounds
+    return [timezone.make_aware(bound) for bound in bounds]
+
+
+def _add_revenue(month, store_id, amount):
+    """
+    Adds 'amount' to the revenue of a month and store, creating the row if needed.
+    The increment is an F() expression, so concurrent payments never overwrite each other's amounts.
+    """
+    increments = {'total_revenue': F('total_revenue') + amount, 'last_update': timezone.now()}
+    # By primary key: the rows of payments without a store (store_id NULL) are not covered by the unique constraint,
+    # so concurrent first payments may create several of them (revenue_by_month() adds them up)
+    row_id = MonthlyStoreRevenue.objects.filter(month=month, store_id=store_id).values_list('pk', flat=True).first()
+    if row_id is not None and MonthlyStoreRevenue.objects.filter(pk=row_id).update(**increments):
+        return
+    try:
+        # Savepoint so that losing a creation race does not break the surrounding transaction
+        with transaction.atomic():
+            MonthlyStoreRevenue.objects.create(month=month, store_id=store_id, total_revenue=amount)
+    except IntegrityError:
+        # Another transaction created the row first; apply the increment to it instead
+        MonthlyStoreRevenue.objects.filter(month=month, store_id=store_id).update(**increments)
+
+
+@transaction.atomic
+def record_payment(payment):
+    """
+    Adds a newly inserted payment to the revenue of its month and store, sealed or not.
+    """
+    store_id = None
+    if payment.rental_id is not None:
+        store_id = Rental.objects.filter(pk=payment.rental_id).values_list('inventory__store_id', flat=True).first()
+    _add_revenue(month_of(payment.payment_date), store_id, payment.amount)
+
+
+def _recompute_month(month):
+    """
+    Replaces the rows of a month with the revenue of its payments per store, read through the payment_date index.
+    """
+    start, end = _month_bounds(month)
+    totals = (
+        Payment.objects.filter(payment_date__gte=start, payment_date__lt=end)
+        .values_list('rental__inventory__store_id')
+        .annotate(total_revenue=Sum('amount'))
+        .order_by()
+    )
+    rows = MonthlyStoreRevenue.objects.filter(month=month)
+    sealed = rows.filter(sealed=True).exists()
+    rows.delete()
+    MonthlyStoreRevenue.objects.bulk_create([
+        MonthlyStoreRevenue(month=month, store_id=store_id, total_revenue=total_revenue, sealed=sealed)
+        for store_id, total_revenue in totals
+    ])
+
+
+@transaction.atomic
+def refresh_revenue_series(seal=True):
+    """
+    Recomputes the open months and the months of the payments inserted since the last refresh, then seals the months that are over if 'seal'.
+
+    A payment saved while its month is being recomputed may be missed by the recomputation; its id being above the new watermark
+    minus WATERMARK_LAG, the next refresh recomputes its month again.
+
+    Returns:
+        int: The number of months recomputed.
+    """
+    # The watermark row lock serializes concurrent refreshes; the payment signal does not take it
+    watermark, _ = RevenueSeriesWatermark.objects.select_for_update().get_or_create(pk=1)
+    new_payments = Payment.objects.filter(payment_id__gt=max(watermark.last_payment_id - WATERMARK_LAG, 0))
+    last_payment_id = new_payments.aggregate(last_payment_id=Max('payment_id'))['last_payment_id'] or 0
+
+    months = {
+        month.date() if isinstance(month, datetime) else month
+        for month in new_payments.annotate(month=TruncMonth('payment_date')).values_list('month', flat=True).order_by().distinct()
+    }
+    months.update(MonthlyStoreRevenue.objects.filter(sealed=False).values_list('month', flat=True))
+    for month in sorted(months):
+        _recompute_month(month)
+
+    if seal:
+        # Only the open months that are over, so that a refresh does not rewrite the sealed rows
+        MonthlyStoreRevenue.objects.filter(sealed=False, month__lt=month_of(timezone.now())).update(sealed=True, last_update=timezone.now())
+
+    if last_payment_id > watermark.last_payment_id:
+        watermark.last_payment_id = last_payment_id
+        watermark.save()
+    return len(months)
+
+
+def rebuild_revenue_series(scan):
+    """
+    Replaces the whole series with the per-month and per-store revenue of a payment scan covering every payment.
+    Must run in the same transaction as the scan, so that the watermark matches the scanned payments.
+
+    Args:
+        scan (PaymentScan): The result of films.scan.scan_payments() over every payment.
+
+    Returns:
+        int: The number of rows written.
+    """
+    current_month = month_of(timezone.now())
+    MonthlyStoreRevenue.objects.all().delete()
+    MonthlyStoreRevenue.objects.bulk_create([
+        MonthlyStoreRevenue(month=month, store_id=store_id, total_revenue=revenue, sealed=month < current_month)
+        for (month, store_id), revenue in scan.store_months.items()
+    ])
+    RevenueSeriesWatermark.objects.update_or_create(pk=1, defaults={'last_payment_id': scan.last_payment_id})
+    return len(scan.store_months)
+
+
+def revenue_by_month(store_id=None):
+    """
+    Returns the revenue of every month. Read-only.
+
+    Args:
+        store_id (int): Restricts the revenue to the rentals of one store. Defaults to every payment.
+
+    Returns:
+        list: (month, total_revenue) tuples in chronological order, 'month' being the first day of the month.
+    """
+    rows = MonthlyStoreRevenue.objects.all()
+    if store_id is not None:
+        rows = rows.filter(store_id=store_id)
+    months = {}
+    for month, total_revenue in rows.values_list('month', 'total_revenue'):
+        months[month] = months.get(month, Decimal(0)) + total_revenue
+    return sorted(months.items())
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import FilmDashboardView
+from .views import ChartDataView, ExportView, FilmDashboardView
 
 urlpatterns = [
     path('charts/', FilmDashboardView.as_view(), name='film_dashboard'),
+    path('charts/data/<slug:chart>/', ChartDataView.as_view(), name='film_chart_data'), # JSON data of a single chart
+    path('charts/export/<slug:dataset>/', ExportView.as_view(), name='film_export'), # CSV or NDJSON export of a chart's rows or of the rentals
     ]
@@ -1,20 +1,52 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from django.db import connection
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from assignment_project.routers import analytics_reads
+from .cache import data_version, get_chart_data
+from .export import EXPORT_FORMATS, stream_chart, stream_rentals
+from .filters import parse_filters
 
 # Create your views here.
 
+# Chart names used in the chart data URLs, mapped to the chart builders in films/charts.py
+CHART_ENDPOINTS = {
+    'bar': 'bar_chart_data',
+    'pie': 'pie_chart_data',
+    'line': 'line_chart_data',
+    'clustered-bar': 'clustered_bar_chart_data',
+    'donut': 'donut_chart_data',
+    'scatter': 'scatter_plot_data',
+}
+
+# Dataset of raw rows exported by ExportView, besides the charts
+RENTALS_EXPORT = 'rentals'
+
+# Export links of the dashboard page, by chart name
+EXPORT_CHART_LABELS = {
+    'bar': 'Top films by rentals',
+    'pie': 'Top films by revenue',
+    'line': 'Monthly revenue',
+    'clustered-bar': 'Films by category and language',
+    'donut': 'Customers by category',
+    'scatter': 'Category revenue',
+}
+
+@method_decorator(analytics_reads, name='get')  # Reads from the analytics replica (see assignment_project/routers.py)
 class FilmDashboardView(View):
     """
     View to display the films dashboard.
-    Fetches data for various charts to provide insights about films database.
-    
+    Renders the page shell immediately; each chart then loads its own data from ChartDataView.
+
     """
     def get(self, request):
         """
         Handles GET request to render the films dashboard.
-        
-        Queries the database to gather data for different charts, including:
+
+        The dashboard shows:
             - A bar chart showing the top 10 most rented films, ordered by rental counts, along with their rental counts and total revenue.
             - A pie chart displaying the total revenue for each of the top 10 films and their percentage contribution to the overall revenue.
             - A line chart presenting the total revenue for each month to show revenue trends over time.
@@ -22,207 +54,139 @@ class FilmDashboardView(View):
             - A donut chart showing the number of unique customers per category and their percentage share of the total unique customers.
             - A scatter plot comparing revenue and rental counts for each category, with average revenue per rental calculated for each category.
 
+        The page does not query the database: the charts fetch their data from the chart data endpoints as soon as the page is loaded,
+        so the first paint is not bound to the slowest chart.
+        The optional 'from', 'to' (YYYY-MM-DD) and 'store' query parameters filter every chart; they are passed on to the chart data endpoints.
+
         Returns:
-            HttpResponse: Renders the 'films/dashboard.html' template with chart data.
+            HttpResponse: Renders the 'films/dashboard.html' template.
         """
-        # Query for bar chart: Top 10 most rented films with rental count and total revenue)
-        bar_chart_query = """
-        SELECT film.title,
-               COUNT(rental.rental_id) AS rental_count,
-               ROUND(SUM(payment.amount), 2) AS total_revenue
-        FROM rental
-        INNER JOIN inventory ON rental.inventory_id = inventory.inventory_id
-        INNER JOIN film ON inventory.film_id = film.film_id
-        INNER JOIN payment ON rental.rental_id = payment.rental_id
-        GROUP BY film.title
-        ORDER BY rental_count DESC
-        LIMIT 10;
-        """
-        # bar_chart_query explanation:
-        # - Retrieves film titles, counts how many times each film was rented (rental count), and calculates the total revenue from rentals.
-        # - Groups the data by film title, orders by rental count in descending order, and limits the results to the top 10 films.
-        
-        with connection.cursor() as cursor:
-            cursor.execute(bar_chart_query)
-            bar_chart_results = cursor.fetchall()
-
-        # Prepare data for the bar chart
-        bar_chart_data = {
-            "titles": [row[0] for row in bar_chart_results],
-            "rental_counts": [row[1] for row in bar_chart_results],
-            "total_revenues": [float(row[2]) for row in bar_chart_results],
+        context = {
+            'date_from': request.GET.get('from', ''),
+            'date_to': request.GET.get('to', ''),
+            'store': request.GET.get('store', ''),
+            'export_charts': EXPORT_CHART_LABELS.items(),
         }
+        return render(request, 'films/dashboard.html', context)
 
-        # Query for pie chart: Top 10 films by revenue contribution
-        pie_chart_query = """
-        SELECT film.title,
-               ROUND(SUM(payment.amount), 2) AS total_revenue,
-               (SUM(payment.amount) / (SELECT SUM(payment.amount) FROM payment)) * 100 AS revenue_percentage
-        FROM payment
-        INNER JOIN rental ON payment.rental_id = rental.rental_id
-        INNER JOIN inventory ON rental.inventory_id = inventory.inventory_id
-        INNER JOIN film ON inventory.film_id = film.film_id
-        GROUP BY film.title
-        ORDER BY total_revenue DESC
-        LIMIT 10;
-        """
-        # Pie_chart_query explanation:
-        # - Retrieves film titles and their total revenue from payments.
-        # - Calculates each film's revenue as a percentage of the total revenue generated across all films.
-        # - Groups the data by film title, orders by revenue in descending order, and limits to the top 10 films.
-
-        with connection.cursor() as cursor:
-            cursor.execute(pie_chart_query)
-            pie_chart_results = cursor.fetchall()
-        
-        # Prepare data for the pie chart
-        pie_chart_data = {
-            "titles": [row[0] for row in pie_chart_results],
-            "total_revenues": [float(row[1]) for row in pie_chart_results],
-            "percentages": [f"{round(row[2], 2)}%" for row in pie_chart_results],
-        }
-        
-        # Query for line chart: Monthly Revenue Trends
-        line_chart_query = """
-        SELECT
-            DATE_FORMAT(payment.payment_date, '%Y-%m') AS month,
-            ROUND(SUM(payment.amount), 2) AS total_revenue
-        FROM
-            payment
-        GROUP BY month
-        ORDER BY month;
+
+def _request_data_version(request):
+    """
+    Returns the data version of the dashboard, probed at most once per request.
+    The ETag and Last-Modified functions of ChartDataView both need it.
+    """
+    if not hasattr(request, '_dashboard_data_version'):
+        request._dashboard_data_version = data_version()
+    return request._dashboard_data_version
+
+
+def _request_filters(request):
+    """
+    Returns the dashboard filters of the request, or None if the filter parameters are invalid.
+    """
+    if not hasattr(request, '_dashboard_filters'):
+        try:
+            request._dashboard_filters = parse_filters(request.GET)
+        except ValueError as e:
+            request._dashboard_filters = None
+            request._dashboard_filters_error = str(e)
+    return request._dashboard_filters
+
+
+def _is_valid_chart_request(request, chart):
+    return chart in CHART_ENDPOINTS and _request_filters(request) is not None
+
+
+def _chart_etag(request, chart):
+    return _request_data_version(request).key if _is_valid_chart_request(request, chart) else None
+
+
+def _chart_last_modified(request, chart):
+    return _request_data_version(request).last_modified if _is_valid_chart_request(request, chart) else None
+
+
+@method_decorator(analytics_reads, name='get')  # Outermost, so that the data version probe reads from the replica too
+@method_decorator(cache_control(no_cache=True), name='get')  # Browsers must revalidate, which costs a 304 while the data is unchanged
+@method_decorator(condition(etag_func=_chart_etag, last_modified_func=_chart_last_modified), name='get')
+class ChartDataView(View):
+    """
+    View returning the data of a single dashboard chart as JSON.
+
+    The optional 'from', 'to' (YYYY-MM-DD) and 'store' query parameters restrict the chart to a period and a store (see films/filters.py).
+    Responses carry an ETag (the data version) and a Last-Modified header.
+    Requests with a matching If-None-Match or If-Modified-Since header get a 304 Not Modified response without any chart being built.
+    A chart that fails or times out is returned empty with an 'unavailable' flag instead of a 500 error.
+    With an analytics replica configured, the data is read from it, unless the client has just written (see assignment_project/routers.py).
+
+    """
+    def get(self, request, chart):
         """
-        # line_char_query explanation:
-        # - Extracts the year and month from payment dates, then sums the revenue for each month.
-        # - Groups the data by month and orders the results chronologically to show revenue trends over time.
-
-        with connection.cursor() as cursor:
-            cursor.execute(line_chart_query)
-            line_chart_results = cursor.fetchall()
-
-        # Prepare data for the line chart
-        line_chart_data = {
-            "months": [row[0] for row in line_chart_results],
-            "total_revenues": [float(row[1]) for row in line_chart_results],
-        }
-    
-        # Query for clustered bar chart: Total Films by Language and Category
-        clustered_bar_chart_query = """
-        SELECT
-            category.name AS category_name,
-            language.name AS language_name,
-            COUNT(film.film_id) AS film_count
-        FROM
-            film
-        INNER JOIN film_category ON film.film_id = film_category.film_id
-        INNER JOIN category ON film_category.category_id = category.category_id
-        INNER JOIN language ON film.language_id = language.language_id
-        GROUP BY category.name, language.name
-        ORDER BY film_count DESC;
+        Handles GET requests for the data of one chart.
+        Args:
+            chart (str): The chart name, one of the keys of CHART_ENDPOINTS.
+        Returns:
+            JsonResponse: The chart data, in the format expected by Chart.js in dashboard.html,
+                or an error with status 400 if the filter parameters are invalid.
         """
-        # clustered_bar_chart_query explanation:
-        # - Retrieves the names of film categories and languages, and counts how many films belong to each combination of category and language.
-        # - Groups the data by category and language, and orders by the number of films in descending order.
-
-        with connection.cursor() as cursor:
-            cursor.execute(clustered_bar_chart_query)
-            clustered_bar_chart_results = cursor.fetchall()
-
-        # Prepare data for the clustered bar chart
-        categories = {}
-        languages = set()
-
-        for row in clustered_bar_chart_results:
-            category_name = row[0]
-            language_name = row[1]
-            film_count = row[2]
-
-            languages.add(language_name)
-            if category_name not in categories:
-                categories[category_name] = {}
-            categories[category_name][language_name] = film_count
-
-        # Organize data for Chart.js
-        languages = sorted(languages)
-        clustered_bar_chart_data = {
-            "categories": list(categories.keys()),
-            "languages": languages,
-            "data": [
-                [categories[category].get(language, 0) for language in languages]
-                for category in categories
-            ],
-        }
+        if chart not in CHART_ENDPOINTS:
+            raise Http404(f'Unknown chart: {chart}')
+        filters = _request_filters(request)
+        if filters is None:
+            return JsonResponse({'error': request._dashboard_filters_error}, status=400)
+
+        name = CHART_ENDPOINTS[chart]
+        chart_data = get_chart_data([name], version=_request_data_version(request), filters=filters)[name]
+        response = JsonResponse(chart_data)
+        if chart_data.get('unavailable'):
+            # The chart failed or timed out and was degraded to an empty chart (see films/executor.py).
+            # It must not be stored or validated against the current data version, or the browser would keep the empty chart.
+            response.headers['Cache-Control'] = 'no-store'
+            response.headers['ETag'] = '"unavailable"'
+        return response
+
+
+@method_decorator(analytics_reads, name='get')
+class ExportView(View):
+    """
+    View streaming a dataset of the dashboard as a CSV or NDJSON file: the rows of one chart, or the raw rentals with their payments.
 
-        # Query for donut chart: Unique Customer Preferences by Category
-        donut_chart_query = """
-        SELECT
-            category.name AS category_name,
-            COUNT(DISTINCT customer.customer_id) AS customer_count,
-            ROUND((COUNT(DISTINCT customer.customer_id) / (SELECT COUNT(DISTINCT customer.customer_id) FROM customer)) * 100, 2) AS customer_percentage
-        FROM
-            customer
-        INNER JOIN rental ON customer.customer_id = rental.customer_id
-        INNER JOIN inventory ON rental.inventory_id = inventory.inventory_id
-        INNER JOIN film ON inventory.film_id = film.film_id
-        INNER JOIN film_category ON film.film_id = film_category.film_id
-        INNER JOIN category ON film_category.category_id = category.category_id
-        GROUP BY category.name
-        ORDER BY customer_count DESC;
-        """
-        # donut_chart_query explanation:
-        # - Retrieves film categories and counts the number of unique customers who rented films from each category.
-        # - Calculates the percentage of the total unique customers that rented films from each category.
-        # - Groups the data by category, orders by customer count in descending order, and shows the top categories.
-
-        with connection.cursor() as cursor:
-            cursor.execute(donut_chart_query)
-            donut_chart_results = cursor.fetchall()
-
-        # Prepare data for the donut chart
-        donut_chart_data = {
-            "categories": [row[0] for row in donut_chart_results],
-            "customer_counts": [int(row[1]) for row in donut_chart_results],
-            "percentages": [float(row[2]) for row in donut_chart_results],
-        }
+    The optional 'from', 'to' (YYYY-MM-DD) and 'store' query parameters filter the dataset as they filter the charts (see films/filters.py),
+    and 'format' selects 'csv' (default) or 'ndjson'. The body is streamed as it is produced (see films/export.py): the rentals are read
+    from a server-side cursor a chunk at a time, so an export of millions of rows runs in constant memory.
 
-        # Query for scatter plot: Revenue vs. Rentals by Category
-        scatter_plot_query = """
-        SELECT
-            category.name AS category_name,
-            COUNT(rental.rental_id) AS rental_count,
-            ROUND(SUM(payment.amount), 2) AS total_revenue,
-            ROUND(SUM(payment.amount) / COUNT(rental.rental_id), 2) AS avg_revenue_per_rental
-        FROM category
-        INNER JOIN film_category ON category.category_id = film_category.category_id
-        INNER JOIN film ON film_category.film_id = film.film_id
-        INNER JOIN inventory ON film.film_id = inventory.film_id
-        INNER JOIN rental ON inventory.inventory_id = rental.inventory_id
-        INNER JOIN payment ON rental.rental_id = payment.rental_id
-        GROUP BY category.name
-        ORDER BY total_revenue DESC;
+    """
+    def get(self, request, dataset):
         """
-        # scatter_plot_query explanation:
-        # - Retrieves film categories and calculates the number of rentals and total revenue for each category.
-        # - Computes the average revenue per rental for each category.
-        # - Groups the data by category, orders by total revenue in descending order, and presents a comparison of revenue vs. rental counts.
-
-        with connection.cursor() as cursor:
-            cursor.execute(scatter_plot_query)
-            scatter_plot_results = cursor.fetchall()
-
-        # Prepare data for the scatter plot
-        scatter_plot_data = {
-            "categories": [row[0] for row in scatter_plot_results],
-            "rental_counts": [row[1] for row in scatter_plot_results],
-            "total_revenues": [float(row[2]) for row in scatter_plot_results],
-            "avg_revenue_per_rentals": [round(float(row[2]) / row[1], 2) if row[1] > 0 else 0 for row in scatter_plot_results], # "round(float(row[2]) / row[1], 2) if row[1] > 0 else 0" ensures no division by zero
-        }
-
-        return render(request, 'films/dashboard.html', {
-            'bar_chart_data': bar_chart_data,
-            'pie_chart_data': pie_chart_data,
-            'line_chart_data': line_chart_data,
-            'clustered_bar_chart_data': clustered_bar_chart_data,
-            'donut_chart_data': donut_chart_data,
-            'scatter_plot_data': scatter_plot_data,
-        })
\ No newline at end of file
+        Handles GET requests for an export.
+        Args:
+            dataset (str): 'rentals', or a chart name (one of the keys of CHART_ENDPOINTS).
+        Returns:
+            StreamingHttpResponse: The export, as an attachment named after the dataset,
+                or an error with status 400 if the parameters are invalid, or 503 if the chart could not be built.
+        """
+        if dataset != RENTALS_EXPORT and dataset not in CHART_ENDPOINTS:
+            raise Http404(f'Unknown dataset: {dataset}')
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'error': f'Invalid format: {export_format} (expected {" or ".join(EXPORT_FORMATS)})'}, status=400)
+        filters = _request_filters(request)
+        if filters is None:
+            return JsonResponse({'error': request._dashboard_filters_error}, status=400)
+
+        # Django buffers streams whose kind does not match the server's, so ASGI gets an asynchronous stream and WSGI a blocking one
+        asynchronous = isinstance(request, ASGIRequest)
+        if dataset == RENTALS_EXPORT:
+            stream = stream_rentals(export_format, filters, asynchronous)
+        else:
+            name = CHART_ENDPOINTS[dataset]
+            chart_data = get_chart_data([name], version=_request_data_version(request), filters=filters)[name]
+            if chart_data.get('unavailable'):
+                return JsonResponse({'error': f'The {dataset} chart is unavailable, try again later'}, status=503)
+            stream = stream_chart(export_format, name, chart_data, asynchronous)
+
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{extension}"'
+        # Disables response buffering in nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# Server push of user status changes to the open ./user pages (Server-Sent Events, see users/views.py).
+# Every committed status change is published as a small delta ({'id', 'type', 'active', 'last_update'}) to the broker,
+# which fans it out to one subscription per connected client. Clients apply the deltas to the lists they show instead of re-fetching them.
+#
+# The broker is the class named by settings.USER_EVENTS_BROKER: InProcessBroker by default, another implementation
+# (e.g. a fake in tests, or a broker relaying through an external pub/sub to reach every server process) can be swapped in.
+
+# Events buffered per client; a client falling further behind is disconnected, and resynchronizes by reloading the lists when reconnecting
+MAX_PENDING_EVENTS = 100
+
+
+class Subscription:
+    """
+    Queue of the events published to one client.
+
+    Args:
+        broker: The broker the subscription belongs to.
+        loop (asyncio.AbstractEventLoop): Event loop of an asynchronous consumer, or None for a consumer reading from a thread.
+    """
+
+    def __init__(self, broker, loop=None):
+        self.broker = broker
+        self.loop = loop
+        self.queue = asyncio.Queue(MAX_PENDING_EVENTS) if loop else queue.Queue(MAX_PENDING_EVENTS)
+        # Set when events had to be dropped; the consumer must then end the stream
+        self.overflowed = False
+
+    def put(self, event):
+        """
+        Queues an event. Can be called from any thread.
+        """
+        if self.loop is None:
+            self._put(event)
+        else:
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (asyncio.QueueFull, queue.Full):
+            self.overflowed = True
+
+    def get(self, timeout):
+        """
+        Returns the next event, or None if none is published within 'timeout' seconds (thread consumers).
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        """
+        Returns the next event, or None if none is published within 'timeout' seconds (asynchronous consumers).
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Fans out the published events to the subscriptions of the current process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self, loop=None):
+        """
+        Returns a new subscription receiving every event published from now on (see Subscription).
+        """
+        subscription = Subscription(self, loop)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.put(event)
+            except RuntimeError:
+                # The consumer's event loop is closed: the client is gone
+                self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_path = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Returns the broker of the process, an instance of settings.USER_EVENTS_BROKER created on first use.
+    """
+    global _broker, _broker_path
+    with _broker_lock:
+        if _broker is None or _broker_path != settings.USER_EVENTS_BROKER:
+            _broker = import_string(settings.USER_EVENTS_BROKER)()
+            _broker_path = settings.USER_EVENTS_BROKER
+        return _broker
+
+
+def publish_status_changes(changes):
+    """
+    Publishes status changes once the current transaction commits (immediately outside of a transaction).
+
+    Args:
+        changes (list): Dicts with the 'id', 'type', new 'active' status and new 'last_update' of each updated user.
+    """
+    if changes:
+        transaction.on_commit(lambda: get_broker().publish(changes))
+
+
+def format_event(changes):
+    """
+    Returns the Server-Sent Events message of published status changes.
+    """
+    return f'event: status\ndata: {json.dumps(changes, cls=DjangoJSONEncoder)}\n\n'
+
+
+# Seconds without events after which a comment line is sent, keeping the connection open through proxies and detecting gone clients
+KEEPALIVE_SECONDS = 15
+
+# Sent first: how long the browser waits before reconnecting (milliseconds)
+STREAM_START = 'retry: 3000\n\n'
+
+
+def event_stream(keepalive=KEEPALIVE_SECONDS, lifetime=None):
+    """
+    Yields the Server-Sent Events of the status changes, for a WSGI server (blocking in the serving thread).
+
+    A WSGI server dedicates one thread to each open stream, so the stream ends after 'lifetime' seconds (None for no limit):
+    the thread is released and the browser reconnects after the 'retry' delay, reloading the lists it may have missed changes of.
+    """
+    deadline = None if lifetime is None else time.monotonic() + lifetime
+    subscription = get_broker().subscribe()
+    try:
+        yield STREAM_START
+        while not subscription.overflowed:
+            timeout = keepalive if deadline is None else min(keepalive, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            changes = subscription.get(timeout)
+            yield ': keepalive\n\n' if changes is None else format_event(changes)
+    finally:
+        subscription.close()
+
+
+async def async_event_stream(keepalive=KEEPALIVE_SECONDS):
+    """
+    Yields the Server-Sent Events of the status changes, for an ASGI server (waiting in the event loop).
+    """
+    subscription = get_broker().subscribe(asyncio.get_running_loop())
+    try:
+        yield STREAM_START
+        while not subscription.overflowed:
+            changes = await subscription.aget(keepalive)
+            yield ': keepalive\n\n' if changes is None else format_event(changes)
+    finally:
+        subscription.close()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from users.search import rebuild_name_index
+
+
+class Command(BaseCommand):
+    """
+    Management command to recompute the name search index from the customer and staff tables.
+
+    Usage: python manage.py rebuild_name_index
+    """
+    help = 'Recomputes the user name search index from the customer and staff tables.'
+
+    def handle(self, *args, **options):
+        count = rebuild_name_index()
+        self.stdout.write(self.style.SUCCESS(f'Name search index rebuilt successfully ({count} grams)'))
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        # The models use the Sakila 'customer' and 'staff' tables, which already exist. Only the model state is updated to match them.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterModelTable(
+                    name='customer',
+                    table='customer',
+                ),
+                migrations.AlterModelTable(
+                    name='staff',
+                    table='staff',
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['active', 'last_update'], name='idx_customer_active_update'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(fields=['active', 'last_update'], name='idx_staff_active_update'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+# Frozen copy of users.search at the time of this migration, so that later changes to the search do not change it
+GRAM_SIZE = 3
+# Number of users read and of grams written per query
+BATCH_SIZE = 1000
+
+
+def name_grams(*names):
+    """
+    Returns the set of grams (substrings of 1 to GRAM_SIZE characters) of the given names, lowercased.
+    """
+    grams = set()
+    for name in names:
+        name = (name or '').lower()
+        for size in range(1, GRAM_SIZE + 1):
+            grams.update(name[start:start + size] for start in range(len(name) - size + 1))
+    return grams
+
+
+def index_existing_names(apps, schema_editor):
+    # Index the users already in the Sakila tables, a batch of grams at a time
+    UserNameGram = apps.get_model('users', 'UserNameGram')
+    for user_type, model_name, id_field in (('customer', 'Customer', 'customer_id'), ('staff', 'Staff', 'staff_id')):
+        model = apps.get_model('users', model_name)
+        rows = model.objects.values_list(id_field, 'first_name', 'last_name').iterator(chunk_size=BATCH_SIZE)
+        grams = []
+        for user_id, first_name, last_name in rows:
+            grams.extend(UserNameGram(gram=gram, user_type=user_type, user_id=user_id) for gram in name_grams(first_name, last_name))
+            if len(grams) >= BATCH_SIZE:
+                UserNameGram.objects.bulk_create(grams, batch_size=BATCH_SIZE)
+                grams = []
+        UserNameGram.objects.bulk_create(grams, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_status_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNameGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('user_type', models.CharField(max_length=8)),
+                ('user_id', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'user_name_gram',
+                'indexes': [models.Index(fields=['gram', 'user_type', 'user_id'], name='idx_user_name_gram'), models.Index(fields=['user_type', 'user_id'], name='idx_user_name_gram_user')],
+            },
+        ),
+        migrations.RunPython(index_existing_names, migrations.RunPython.noop),
+    ]
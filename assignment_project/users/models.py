@@ -13,6 +13,10 @@ class Customer(models.Model):
     
     class Meta:
         db_table = 'customer'
+        indexes = [
+            # Keyset pagination of the active and inactive user lists (see users/pagination.py)
+            models.Index(fields=['active', 'last_update'], name='idx_customer_active_update'),
+        ]
 
 class Staff(models.Model):
     staff_id = models.AutoField(primary_key=True)
@@ -25,4 +29,28 @@ class Staff(models.Model):
         return f"{self.first_name} {self.last_name}"
     
     class Meta:
-        db_table = 'staff'
\ No newline at end of file
+        db_table = 'staff'
+        indexes = [
+            models.Index(fields=['active', 'last_update'], name='idx_staff_active_update'),
+        ]
+
+class UserNameGram(models.Model):
+    """
+    Search index of the customer and staff names (see users/search.py): one row per distinct 1 to 3 character substring of a user's lowercased first or last name.
+    Kept up to date by the signal handlers in users/signals.py.
+    """
+    gram = models.CharField(max_length=3)
+    user_type = models.CharField(max_length=8)
+    user_id = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.gram} ({self.user_type} {self.user_id})"
+
+    class Meta:
+        db_table = 'user_name_gram'
+        indexes = [
+            # Name search: the users of one type having a given gram
+            models.Index(fields=['gram', 'user_type', 'user_id'], name='idx_user_name_gram'),
+            # Reindexing one user
+            models.Index(fields=['user_type', 'user_id'], name='idx_user_name_gram_user'),
+        ]
@@ -0,0 +1,138 @@
+import base64
+import json
+from django.db import connections
+from django.db.models import F, Q, Value
+from django.utils.dateparse import parse_datetime
+from .models import Customer, Staff
+from .search import name_filter
+
+# Keyset (cursor) pagination of the user lists served by UserListView.
+# The pages of every requested list are read with one UNION ALL query and streamed to the response (see user_page_rows()).
+# Each list (active or inactive users) shows customers first, then staff, each ordered by last_update then id, newest first.
+# A page continues strictly after the last user of the previous page, identified by its (type, last_update, id) position,
+# so every page is an index range scan on (active, last_update) instead of an OFFSET that reads and discards all previous rows.
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Rows fetched from the database cursor at a time
+CHUNK_SIZE = 100
+
+# User types in list order, with their model and primary key field
+USER_TYPES = {
+    'customer': (Customer, 'customer_id'),
+    'staff': (Staff, 'staff_id'),
+}
+
+
+def encode_cursor(user):
+    """
+    Returns the opaque cursor pointing after the given user (a row of a user list, with 'type', 'last_update' and 'id').
+    """
+    position = [user['type'], user['last_update'].isoformat(), user['id']]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (type, last_update, id) position encoded in a cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        user_type, last_update, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        last_update = parse_datetime(last_update)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    if user_type not in USER_TYPES or last_update is None or not isinstance(user_id, int):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return user_type, last_update, user_id
+
+
+def user_page_rows(lists, search_term='', limit=PAGE_SIZE, since=None):
+    """
+    Returns one page of each requested user list, read with a single UNION ALL query.
+
+    Each (list, user type) pair is one branch of the union: the next limit + 1 users of that type after the list's cursor,
+    read through the (active, last_update) index. The extra row tells whether the list continues.
+    Rows are fetched in chunks from the database cursor as they are consumed, so the pages are never held in memory at once.
+
+    Args:
+        lists (list): (list name, active, cursor) tuples, in the order of the response; the cursor is None for the first page.
+        search_term (str): Only returns users whose first or last name contains the term (case-insensitive, see users/search.py).
+        limit (int): Maximum number of users in a page.
+        since (datetime): Only returns users updated at or after this watermark (see users/sync.py).
+
+    Returns:
+        iterator: Dicts with unified fields ('id', 'type', 'first_name', 'last_name', 'active', 'last_update') and the 'list' name,
+            ordered by list, then customers first, then staff, newest first. A list yields up to limit + 1 users of each type.
+
+    Raises:
+        ValueError: If a cursor is malformed (raised before any query is made).
+    """
+    branches = []
+    for list_name, active, cursor in lists:
+        position = decode_cursor(cursor) if cursor else None
+        types = list(USER_TYPES)
+        if position is not None:
+            # Types before the cursor's type are already exhausted
+            types = types[types.index(position[0]):]
+        for user_type in types:
+            branches.append(_branch(list_name, active, user_type, position, search_term, since, limit + 1, len(branches)))
+    return _union_rows(branches)
+
+
+def _branch(list_name, active, user_type, position, search_term, since, size, index):
+    """
+    Returns the queryset of the next 'size' users of one type in one list, with the unified fields.
+    """
+    model, id_field = USER_TYPES[user_type]
+    rows = model.objects.filter(active=active)
+    if search_term:
+        rows = rows.filter(name_filter(user_type, id_field, search_term))
+    if since is not None:
+        rows = rows.filter(last_update__gte=since)
+    if position is not None and position[0] == user_type:
+        _, last_update, user_id = position
+        rows = rows.filter(Q(last_update__lt=last_update) | Q(last_update=last_update, **{f'{id_field}__lt': user_id}))
+    return (
+        rows.order_by('-last_update', f'-{id_field}')
+        .annotate(id=F(id_field), type=Value(user_type), list=Value(list_name), branch=Value(index))
+        .values('id', 'type', 'first_name', 'last_name', 'active', 'last_update', 'list', 'branch')[:size]
+    )
+
+
+def _union_rows(branches, chunk_size=CHUNK_SIZE):
+    """
+    Runs the UNION ALL of the branch querysets and yields their rows as dicts, in branch order.
+
+    Each sliced branch is wrapped in a derived table, since not every database accepts ORDER BY and LIMIT directly in
+    the parts of a compound query (QuerySet.union() refuses them on SQLite).
+    """
+    if not branches:
+        return
+    connection = connections[branches[0].db]
+    quote = connection.ops.quote_name
+    parts, params = [], []
+    for index, branch in enumerate(branches):
+        sql, branch_params = branch.query.sql_with_params()
+        parts.append(f'SELECT * FROM ({sql}) {quote(f"branch{index}")}')
+        params.extend(branch_params)
+    sql = ' UNION ALL '.join(parts) + f' ORDER BY {quote("branch")}, {quote("last_update")} DESC, {quote("id")} DESC'
+
+    # The branches share the same columns, so the first one's compiler converts the raw values (booleans, datetimes) of every row
+    compiler = branches[0].query.get_compiler(connection=connection)
+    compiler.as_sql()
+    converters = compiler.get_converters([expression for expression, _, _ in compiler.select])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in compiler.apply_converters(rows, converters) if converters else rows:
+                user = dict(zip(columns, row))
+                del user['branch']
+                yield user
@@ -0,0 +1,118 @@
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from .models import UserNameGram
+
+# Indexed name search of the user lists.
+# A 'contains' filter on the names (LIKE '%term%') cannot use any index and scans the whole customer and staff tables.
+# Instead, UserNameGram stores every distinct substring of 1 to GRAM_SIZE characters of each user's lowercased first and last name:
+# - A term of at most GRAM_SIZE characters is itself a gram, so the users whose name contains it are exactly the users having that gram.
+# - A longer term is split into its overlapping trigrams. Only users having all of them can match, and those few candidates
+#   are then checked against the actual names, since the trigrams may come from different places of the names.
+# Both cases are lookups on the (gram, user_type, user_id) index, whatever the number of users.
+# A single gram is an EXISTS lookup per user, without aggregation, so the user list's (active, last_update, id) index drives the scan
+# and stops at the page size, however many users share the gram (e.g. 'a'). Several grams need every candidate's gram count first.
+
+GRAM_SIZE = 3
+
+
+def name_grams(*names):
+    """
+    Returns the set of grams (substrings of 1 to GRAM_SIZE characters) of the given names, lowercased.
+    Grams do not span several names, as the search matches each name separately.
+    """
+    grams = set()
+    for name in names:
+        name = (name or '').lower()
+        for size in range(1, GRAM_SIZE + 1):
+            grams.update(name[start:start + size] for start in range(len(name) - size + 1))
+    return grams
+
+
+def term_grams(term):
+    """
+    Returns the grams a name must contain to match a search term (the term itself if short enough, else its trigrams).
+    """
+    term = term.lower()
+    if len(term) <= GRAM_SIZE:
+        return {term}
+    return {term[start:start + GRAM_SIZE] for start in range(len(term) - GRAM_SIZE + 1)}
+
+
+@transaction.atomic
+def index_user(user_type, user_id, first_name, last_name):
+    """
+    Replaces the indexed grams of one user.
+
+    Args:
+        user_type (str): 'customer' or 'staff'.
+        user_id (int): The customer_id or staff_id.
+        first_name (str), last_name (str): The user's current names.
+    """
+    UserNameGram.objects.filter(user_type=user_type, user_id=user_id).delete()
+    UserNameGram.objects.bulk_create([
+        UserNameGram(gram=gram, user_type=user_type, user_id=user_id) for gram in name_grams(first_name, last_name)
+    ])
+
+
+def unindex_user(user_type, user_id):
+    """
+    Removes the indexed grams of a deleted user.
+    """
+    UserNameGram.objects.filter(user_type=user_type, user_id=user_id).delete()
+
+
+@transaction.atomic
+def rebuild_name_index(batch_size=1000):
+    """
+    Recomputes the whole name index from the customer and staff tables.
+
+    Returns:
+        int: The number of grams written.
+    """
+    from .pagination import USER_TYPES
+
+    UserNameGram.objects.all().delete()
+    written = 0
+    for user_type, (model, id_field) in USER_TYPES.items():
+        rows = model.objects.values_list(id_field, 'first_name', 'last_name').iterator(chunk_size=batch_size)
+        grams = []
+        for user_id, first_name, last_name in rows:
+            grams.extend(UserNameGram(gram=gram, user_type=user_type, user_id=user_id) for gram in name_grams(first_name, last_name))
+            if len(grams) >= batch_size:
+                UserNameGram.objects.bulk_create(grams)
+                written += len(grams)
+                grams = []
+        UserNameGram.objects.bulk_create(grams)
+        written += len(grams)
+    return written
+
+
+def name_filter(user_type, id_field, term):
+    """
+    Returns the filter selecting the users of one type whose first or last name contains the search term (case-insensitive).
+
+    Args:
+        user_type (str): 'customer' or 'staff'.
+        id_field (str): The primary key field of the user model.
+        term (str): The search term.
+
+    Returns:
+        Q: The filter, to apply to the user model.
+    """
+    grams = term_grams(term)
+    if len(grams) == 1:
+        # The users having the gram, checked per user as the list is read in order
+        query_filter = Q(Exists(UserNameGram.objects.filter(user_type=user_type, gram=next(iter(grams)), user_id=OuterRef(id_field))))
+    else:
+        # Users having every gram of the term, resolved from the gram index as a subquery
+        candidates = (
+            UserNameGram.objects.filter(user_type=user_type, gram__in=grams)
+            .values('user_id')
+            .annotate(gram_count=Count('gram', distinct=True))
+            .filter(gram_count=len(grams))
+            .values('user_id')
+        )
+        query_filter = Q(**{f'{id_field}__in': candidates})
+    if len(term) > GRAM_SIZE:
+        query_filter &= Q(first_name__icontains=term) | Q(last_name__icontains=term)
+    return query_filter
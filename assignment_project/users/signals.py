@@ -0,0 +1,34 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Customer, Staff
+from . import search
+
+# Keep the name search index (users/search.py) up to date as users are created, renamed or deleted through the ORM.
+# Data loaded by other means (raw SQL, fixtures) is indexed by 'python manage.py rebuild_name_index'.
+
+NAME_FIELDS = {'first_name', 'last_name'}
+
+
+def _reindex(user_type, user_id, instance, update_fields):
+    # Saves restricted to other fields (e.g. the status update) leave the names, hence the index, unchanged
+    if update_fields is not None and not NAME_FIELDS & set(update_fields):
+        return
+    search.index_user(user_type, user_id, instance.first_name, instance.last_name)
+
+@receiver(post_save, sender=Customer)
+def index_customer_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        _reindex('customer', instance.customer_id, instance, update_fields)
+
+@receiver(post_save, sender=Staff)
+def index_staff_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        _reindex('staff', instance.staff_id, instance, update_fields)
+
+@receiver(post_delete, sender=Customer)
+def unindex_customer_name(sender, instance, **kwargs):
+    search.unindex_user('customer', instance.customer_id)
+
+@receiver(post_delete, sender=Staff)
+def unindex_staff_name(sender, instance, **kwargs):
+    search.unindex_user('staff', instance.staff_id)
@@ -0,0 +1,152 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .events import publish_status_changes
+from .pagination import USER_TYPES
+
+# Status updates of the ./user page, written without reading the users first.
+# - A status change is a conditional UPDATE ... SET active = ?, last_update = ? WHERE id = ?, instead of a SELECT followed by a full-row save.
+# - The client may send the 'last_update' it last saw (optimistic concurrency): the UPDATE then also requires the row to be unchanged since,
+#   and a user modified in the meantime by another operator is reported as a conflict instead of being overwritten.
+#   Timestamps are serialized to the client with millisecond precision, so the guard matches the whole millisecond.
+#   New timestamps are whole seconds, the precision of the Sakila TIMESTAMP columns, so the value returned to the client is the stored one.
+# - Applied changes are published to the open ./user pages once committed (see users/events.py).
+# - Bulk updates group the unguarded items by user type and new status, each group being applied with a single UPDATE ... WHERE id IN (...).
+
+MAX_BULK_UPDATES = 1000
+
+TIMESTAMP_PRECISION = timedelta(milliseconds=1)
+
+
+def parse_last_update(value, name='last_update'):
+    """
+    Returns the aware datetime of a client-supplied timestamp (ISO 8601) such as 'last_update', or None if it is missing.
+
+    Raises:
+        ValueError: If the value is not a valid datetime.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        last_update = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        last_update = None
+    if last_update is None:
+        raise ValueError(f'Invalid {name}: {value}')
+    if timezone.is_naive(last_update):
+        last_update = timezone.make_aware(last_update)
+    return last_update
+
+
+def _now():
+    return timezone.now().replace(microsecond=0)
+
+
+def update_status(user_type, user_id, active, expected_last_update=None, now=None):
+    """
+    Sets the active status of one user with a single conditional UPDATE.
+
+    Args:
+        user_type (str): 'customer' or 'staff'.
+        user_id (int): The customer_id or staff_id.
+        active (bool): The new status.
+        expected_last_update (datetime): If given, the update only applies if the user's last_update is still this one.
+        now (datetime): The new last_update. Defaults to the current time.
+
+    Returns:
+        tuple: (result, last_update), 'result' being 'updated', 'not_found' or 'conflict',
+            and 'last_update' the user's new last update timestamp when updated, else None.
+    """
+    model, id_field = USER_TYPES[user_type]
+    now = now or _now()
+    rows = model.objects.filter(**{id_field: user_id})
+    if expected_last_update is not None:
+        rows = rows.filter(last_update__gte=expected_last_update, last_update__lt=expected_last_update + TIMESTAMP_PRECISION)
+    # A queryset update bypasses auto_now, so last_update is set explicitly
+    if rows.update(active=active, last_update=now):
+        publish_status_changes([{'id': user_id, 'type': user_type, 'active': active, 'last_update': now}])
+        return 'updated', now
+    # Only a failed update reads the row, to tell a missing user from a concurrent modification
+    if expected_last_update is not None and model.objects.filter(**{id_field: user_id}).exists():
+        return 'conflict', None
+    return 'not_found', None
+
+
+def _validation_error(item):
+    """
+    Returns the error message of an invalid status update item, or None if it is valid.
+    """
+    if not isinstance(item, dict):
+        return 'Each update must be an object with id, type and active'
+    if item.get('type') not in USER_TYPES:
+        return 'Invalid user type'
+    if not isinstance(item.get('id'), int) or isinstance(item.get('id'), bool):
+        return 'Invalid user id'
+    if not isinstance(item.get('active'), bool):
+        return 'Invalid active status'
+    try:
+        parse_last_update(item.get('last_update'))
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+@transaction.atomic
+def apply_status_updates(items):
+    """
+    Applies a batch of status updates in one transaction.
+
+    Args:
+        items (list): Dicts with the user's 'id' (int), 'type' ('customer' or 'staff'), new 'active' status (bool)
+            and optionally the 'last_update' the client last saw. When the same user appears several times, the last item wins.
+
+    Returns:
+        list: One result per item, in the same order: a dict with the item's 'id' and 'type', a 'result' of
+            'updated' (with the new 'last_update'), 'not_found', 'conflict' or 'invalid' (with an 'error' message).
+    """
+    results = []
+    # (type, id) -> (new status, expected last update) of every valid item, the last item of a user winning
+    statuses = {}
+    for item in items:
+        error = _validation_error(item)
+        if error:
+            fields = item if isinstance(item, dict) else {}
+            results.append({'id': fields.get('id'), 'type': fields.get('type'), 'result': 'invalid', 'error': error})
+            continue
+        statuses[(item['type'], item['id'])] = (item['active'], parse_last_update(item.get('last_update')))
+        results.append({'id': item['id'], 'type': item['type'], 'result': None})
+
+    outcomes = {}
+    now = _now()
+    for user_type, (model, id_field) in USER_TYPES.items():
+        # Guarded items each need their own conditional UPDATE
+        for (item_type, user_id), (active, expected_last_update) in statuses.items():
+            if item_type == user_type and expected_last_update is not None:
+                outcomes[(user_type, user_id)] = update_status(user_type, user_id, active, expected_last_update, now)[0]
+
+        ids = [user_id for (item_type, user_id), (_, expected_last_update) in statuses.items() if item_type == user_type and expected_last_update is None]
+        if not ids:
+            continue
+        # Lock the existing users of the batch, which also tells which ids do not exist
+        existing = set(model.objects.select_for_update().filter(**{f'{id_field}__in': ids}).values_list(id_field, flat=True))
+        for user_id in ids:
+            outcomes[(user_type, user_id)] = 'updated' if user_id in existing else 'not_found'
+        for active in (True, False):
+            group = [user_id for user_id in existing if statuses[(user_type, user_id)][0] is active]
+            if group:
+                model.objects.filter(**{f'{id_field}__in': group}).update(active=active, last_update=now)
+
+    for result in results:
+        if result['result'] is None:
+            result['result'] = outcomes[(result['type'], result['id'])]
+            if result['result'] == 'updated':
+                result['last_update'] = now
+
+    # Guarded items were published by update_status(); the grouped ones are published together
+    publish_status_changes([
+        {'id': user_id, 'type': user_type, 'active': active, 'last_update': now}
+        for (user_type, user_id), (active, expected_last_update) in statuses.items()
+        if expected_last_update is None and outcomes[(user_type, user_id)] == 'updated'
+    ])
+    return results
@@ -0,0 +1,69 @@
+import hashlib
+from collections import namedtuple
+from datetime import datetime, timezone
+from django.utils.dateparse import parse_datetime
+from assignment_project.routers import read_connection
+
+# Delta synchronization of the user lists (the 'since' parameter and the ETag of /api/users/).
+# Every status change and edit sets last_update, so the users changed since a watermark are the rows with last_update >= watermark,
+# an index range of each (active, last_update) index. The watermark returned with every response is the latest last_update
+# at the time of the request, read before the users: a client passes it back as 'since' to get only what changed in between.
+# The comparison includes the watermark itself, since timestamps are whole seconds and later changes may share the same second;
+# users sent twice are simply applied again.
+
+# Version probe: MAX() lookups on the primary keys and on the (active, last_update) indexes (one per status), not scans.
+# Only user deletions, which do not happen through the app, go unnoticed.
+VERSION_QUERY = """
+SELECT
+    (SELECT MAX(customer_id) FROM customer),
+    (SELECT MAX(last_update) FROM customer WHERE active = 1),
+    (SELECT MAX(last_update) FROM customer WHERE active = 0),
+    (SELECT MAX(staff_id) FROM staff),
+    (SELECT MAX(last_update) FROM staff WHERE active = 1),
+    (SELECT MAX(last_update) FROM staff WHERE active = 0);
+"""
+
+# Result of the version probe:
+# - key: short hash of the probe row, part of the ETag of /api/users/.
+# - watermark: latest last_update of the users (aware datetime or None without users).
+UsersVersion = namedtuple('UsersVersion', ['key', 'watermark'])
+
+
+def _as_datetime(value):
+    """
+    Converts a MAX(last_update) value to an aware datetime.
+    Depending on the database backend, raw cursors return it as a naive datetime or as a string; it is stored in UTC either way.
+    """
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def users_version():
+    """
+    Runs the version probe.
+
+    Returns:
+        UsersVersion: The version key and watermark of the user lists.
+    """
+    with read_connection().cursor() as cursor:
+        cursor.execute(VERSION_QUERY)
+        row = cursor.fetchone()
+    timestamps = [timestamp for timestamp in map(_as_datetime, row) if isinstance(timestamp, datetime)]
+    return UsersVersion(
+        key=hashlib.md5(repr(row).encode()).hexdigest(),
+        watermark=max(timestamps, default=None),
+    )
+
+
+def list_etag(version, params):
+    """
+    Returns the ETag of a user list response: the data version combined with the query parameters.
+
+    Args:
+        version (UsersVersion): The current version, as returned by users_version().
+        params (QueryDict): The query parameters of the request.
+    """
+    return hashlib.md5(repr((version.key, sorted(params.lists()))).encode()).hexdigest()
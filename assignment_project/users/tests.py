@@ -1,11 +1,31 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import threading
+from datetime import datetime, timezone
+from unittest import mock
+from django.apps import apps
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Customer, Staff
+from .models import Customer, Staff, UserNameGram
+from .search import name_grams, rebuild_name_index, term_grams
+from . import events
 
 # Create your tests here.
 
+def response_json(response):
+    """
+    Returns the decoded body of a JSON response, including the streamed responses of UserListView.
+    """
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return response.json()
+
+
 class UserViewsTestCase(TestCase):
     """
     Test case for the UserListView API endpoint.
@@ -48,7 +68,7 @@ class UserViewsTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Parse the response data
-        data = response.json()
+        data = response_json(response)
 
         # Assert the response contains active and inactive users
         self.assertIn('active_users', data)
@@ -173,6 +193,109 @@ class UpdateUserStatusViewTests(TestCase):
         # Assert that the response status code is 404 (Not Found), as the user with ID 1000 does not exist
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_update_is_a_single_statement(self):
+        """
+        Test that a status update is one UPDATE statement, which returns the new last update timestamp.
+        """
+        with self.assertNumQueries(1):
+            response = self.client.patch(self.update_status_url, {'id': 3, 'type': 'staff', 'active': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.staff.refresh_from_db()
+        self.assertTrue(self.staff.active)
+        self.assertEqual(response.json()['last_update'], self.staff.last_update.isoformat().replace('+00:00', 'Z'))
+
+    def test_update_with_last_update(self):
+        """
+        Test the optimistic concurrency check of status updates.
+
+        Asserts:
+            - An update with the last update timestamp returned by the user list is applied.
+            - A second update with the same, now stale, timestamp results in a 409 Conflict response and is not applied.
+            - A malformed timestamp results in a 400 Bad Request response.
+        """
+        customer = response_json(self.client.get(reverse('api_user_list')))['active_users'][0]
+        data = {'id': 3, 'type': 'customer', 'active': False, 'last_update': customer['last_update']}
+        response = self.client.patch(self.update_status_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data['active'] = True
+        response = self.client.patch(self.update_status_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.customer.refresh_from_db()
+        self.assertFalse(self.customer.active)
+
+        data['last_update'] = 'yesterday'
+        response = self.client.patch(self.update_status_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class BulkUpdateUserStatusViewTests(TestCase):
+    """
+    Test case for the BulkUpdateUserStatusView API endpoint.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.bulk_update_url = reverse('api_bulk_update_status')
+        for customer_id in range(1, 5):
+            Customer.objects.create(customer_id=customer_id, first_name=f'Customer{customer_id}', last_name='Customer', active=customer_id % 2 == 0)
+        Staff.objects.create(staff_id=1, first_name='Yellow', last_name='Staff', active=False)
+
+    def test_bulk_update(self):
+        """
+        Test that a batch is applied with one UPDATE per user type and status, and reports a result per item.
+
+        Asserts:
+            - Existing users get their new status; the last item of a user wins.
+            - Unknown users and malformed items are reported without failing the batch.
+        """
+        updates = [
+            {'id': 1, 'type': 'customer', 'active': True},
+            {'id': 2, 'type': 'customer', 'active': True},
+            {'id': 2, 'type': 'customer', 'active': False},
+            {'id': 3, 'type': 'customer', 'active': True},
+            {'id': 1, 'type': 'staff', 'active': True},
+            {'id': 99, 'type': 'staff', 'active': True},
+            {'id': 4, 'type': 'artist', 'active': True},
+            {'id': 4, 'type': 'customer', 'active': 'yes'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.bulk_update_url, updates, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 3)
+
+        results = response.json()['results']
+        self.assertEqual([result['result'] for result in results],
+                         ['updated', 'updated', 'updated', 'updated', 'updated', 'not_found', 'invalid', 'invalid'])
+        self.assertEqual(results[6]['error'], 'Invalid user type')
+
+        self.assertEqual(dict(Customer.objects.values_list('customer_id', 'active')), {1: True, 2: False, 3: True, 4: True})
+        self.assertTrue(Staff.objects.get(staff_id=1).active)
+
+    def test_bulk_update_with_last_update(self):
+        """
+        Test that guarded items of a batch are applied only to users unchanged since their last update timestamp.
+        """
+        customer = Customer.objects.get(customer_id=1)
+        stale = datetime(2006, 2, 15, tzinfo=timezone.utc).isoformat()
+        updates = [
+            {'id': 1, 'type': 'customer', 'active': True, 'last_update': customer.last_update.isoformat()},
+            {'id': 3, 'type': 'customer', 'active': True, 'last_update': stale},
+            {'id': 99, 'type': 'customer', 'active': True, 'last_update': stale},
+        ]
+        results = self.client.patch(self.bulk_update_url, updates, format='json').json()['results']
+        self.assertEqual([result['result'] for result in results], ['updated', 'conflict', 'not_found'])
+        self.assertIn('last_update', results[0])
+        self.assertEqual(dict(Customer.objects.filter(customer_id__in=[1, 3]).values_list('customer_id', 'active')), {1: True, 3: False})
+
+    def test_invalid_body(self):
+        """
+        Test that a body which is not a list, or holds too many items, results in a 400 Bad Request response.
+        """
+        response = self.client.patch(self.bulk_update_url, {'id': 1, 'type': 'customer', 'active': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(self.bulk_update_url, [{'id': 1, 'type': 'customer', 'active': True}] * 1001, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 class SearchFeatureTestCase(TestCase):
     """
     Test case for the search feature in the UserListView API endpoint.
@@ -203,7 +326,7 @@ class SearchFeatureTestCase(TestCase):
         response = self.client.get(self.user_list_url, {'search':'Blue'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        data = response.json()
+        data = response_json(response)
         active_users = data['active_users']
         inactive_users = data['inactive_users']
         
@@ -225,7 +348,7 @@ class SearchFeatureTestCase(TestCase):
         """
         response = self.client.get(self.user_list_url, {'search':'White'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        data = response.json()
+        data = response_json(response)
         active_users = data['active_users']
         inactive_users = data['inactive_users']
 
@@ -247,7 +370,7 @@ class SearchFeatureTestCase(TestCase):
 
         response = self.client.get(self.user_list_url, {'search':'red'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        data = response.json()
+        data = response_json(response)
         active_users = data['active_users']
         inactive_users = data['inactive_users']
         self.assertEqual(len(active_users),0)
@@ -269,7 +392,7 @@ class SearchFeatureTestCase(TestCase):
 
         response = self.client.get(self.user_list_url, {'search':'ur'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        data = response.json()
+        data = response_json(response)
         active_users = data['active_users']
         inactive_users = data['inactive_users']
 
@@ -293,8 +416,349 @@ class SearchFeatureTestCase(TestCase):
         """
         response = self.client.get(self.user_list_url, {'search':'Ruby'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        data = response.json()
+        data = response_json(response)
         active_users = data['active_users']
         inactive_users = data['inactive_users']
         self.assertEqual(len(active_users), 0)
-        self.assertEqual(len(inactive_users), 0)
\ No newline at end of file
+        self.assertEqual(len(inactive_users), 0)
+
+class UserPaginationTestCase(TestCase):
+    """
+    Test case for the cursor pagination of the UserListView API endpoint.
+    """
+
+    def setUp(self):
+        """
+        Set up 5 active customers, 2 active staff and 1 inactive customer, the customers sharing the same last update timestamp.
+        """
+        self.client = APIClient()
+        self.user_list_url = reverse('api_user_list')
+        for customer_id in range(1, 6):
+            Customer.objects.create(customer_id=customer_id, first_name=f'Customer{customer_id}', last_name='Active', active=True)
+        Customer.objects.filter(active=True).update(last_update=datetime(2006, 2, 15, tzinfo=timezone.utc))
+        Customer.objects.create(customer_id=6, first_name='Customer6', last_name='Inactive', active=False)
+        Staff.objects.create(staff_id=1, first_name='Staff1', last_name='Active', active=True)
+        Staff.objects.create(staff_id=2, first_name='Staff2', last_name='Active', active=True)
+
+    def test_pages_cover_every_user_once(self):
+        """
+        Test that following the cursors of the active list returns every active user exactly once, customers first, then staff.
+
+        Asserts:
+            - Each page holds at most 'limit' users, and the last page has no next cursor.
+            - Ties on last_update are broken by id, so no user is skipped or repeated across pages.
+            - Loading a page of one list does not return the other list.
+        """
+        response = self.client.get(self.user_list_url, {'limit': 3})
+        data = response_json(response)
+        self.assertEqual(len(data['active_users']), 3)
+        self.assertEqual(len(data['inactive_users']), 1)
+        self.assertIsNone(data['inactive_next_cursor'])
+
+        names = [user['first_name'] for user in data['active_users']]
+        cursor = data['active_next_cursor']
+        while cursor:
+            data = response_json(self.client.get(self.user_list_url, {'limit': 3, 'list': 'active', 'active_cursor': cursor}))
+            self.assertNotIn('inactive_users', data)
+            names += [user['first_name'] for user in data['active_users']]
+            cursor = data['active_next_cursor']
+
+        self.assertEqual(names, ['Customer5', 'Customer4', 'Customer3', 'Customer2', 'Customer1', 'Staff2', 'Staff1'])
+
+    def test_page_ending_at_limit(self):
+        """
+        Test that a list holding exactly 'limit' users is sent whole without a next cursor, and that one more user yields a cursor.
+        """
+        data = response_json(self.client.get(self.user_list_url, {'limit': 7, 'list': 'active'}))
+        self.assertEqual(len(data['active_users']), 7)
+        self.assertIsNone(data['active_next_cursor'])
+
+        data = response_json(self.client.get(self.user_list_url, {'limit': 1}))
+        self.assertEqual([user['first_name'] for user in data['active_users']], ['Customer5'])
+        self.assertIsNotNone(data['active_next_cursor'])
+        self.assertEqual([user['first_name'] for user in data['inactive_users']], ['Customer6'])
+        self.assertIsNone(data['inactive_next_cursor'])
+
+    def test_page_ending_on_last_customer(self):
+        """
+        Test that a page ending exactly on the last customer still points to the staff.
+        """
+        data = response_json(self.client.get(self.user_list_url, {'limit': 5}))
+        self.assertIsNotNone(data['active_next_cursor'])
+        data = response_json(self.client.get(self.user_list_url, {'limit': 5, 'list': 'active', 'active_cursor': data['active_next_cursor']}))
+        self.assertEqual([user['type'] for user in data['active_users']], ['staff', 'staff'])
+        self.assertIsNone(data['active_next_cursor'])
+
+    def test_single_streamed_query(self):
+        """
+        Test that both lists, customers and staff, with a search term, are read with one query and streamed.
+
+        Asserts:
+            - The response is a streaming JSON response, built with a single database query besides the version probe of the ETag.
+            - Rows keep the unified fields, with booleans and datetimes converted.
+        """
+        with self.assertNumQueries(2):
+            response = self.client.get(self.user_list_url, {'search': 'customer'})
+            self.assertTrue(response.streaming)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            data = response_json(response)
+        self.assertEqual(len(data['active_users']), 5)
+        self.assertEqual([user['id'] for user in data['inactive_users']], [6])
+        self.assertEqual(data['active_users'][0], {
+            'id': 5, 'type': 'customer', 'first_name': 'Customer5', 'last_name': 'Active', 'active': True, 'last_update': '2006-02-15T00:00:00Z',
+        })
+
+    def test_delta_sync(self):
+        """
+        Test the 'since' watermark and the ETag of the user lists.
+
+        Asserts:
+            - A response returns the latest last update as watermark, and the users updated at that time are returned with it.
+            - A user updated afterwards is returned alone, in the list it now belongs to.
+            - Revalidating an unchanged response results in a 304 Not Modified response, and a change in a new ETag.
+        """
+        response = self.client.get(self.user_list_url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.user_list_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Customer.objects.update(last_update=datetime(2006, 2, 15, tzinfo=timezone.utc))
+        Staff.objects.update(last_update=datetime(2006, 2, 15, tzinfo=timezone.utc))
+        watermark = response_json(self.client.get(self.user_list_url))['watermark']
+        data = response_json(self.client.get(self.user_list_url, {'since': watermark}))
+        self.assertEqual(len(data['active_users']) + len(data['inactive_users']), 8)  # Every user has the watermark timestamp
+
+        Customer.objects.filter(customer_id=2).update(active=False, last_update=datetime(2006, 2, 16, tzinfo=timezone.utc))
+        response = self.client.get(self.user_list_url, {'since': '2006-02-15T00:00:01Z'})
+        data = response_json(response)
+        self.assertEqual(data['active_users'], [])
+        self.assertEqual([(user['type'], user['id']) for user in data['inactive_users']], [('customer', 2)])
+        self.assertEqual(data['watermark'], '2006-02-16T00:00:00Z')
+        self.assertEqual(self.client.get(self.user_list_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.user_list_url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_parameters(self):
+        """
+        Test that an invalid cursor, limit or list results in a 400 Bad Request response.
+        """
+        for params in ({'active_cursor': 'not-a-cursor'}, {'limit': 0}, {'limit': 'all'}, {'list': 'everyone'}):
+            response = self.client.get(self.user_list_url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+class NameSearchIndexTestCase(TestCase):
+    """
+    Test case for the name search index behind the search feature (users/search.py).
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_list_url = reverse('api_user_list')
+        self.customer = Customer.objects.create(customer_id=1, first_name='Ann', last_name='Nnab', active=True)
+        self.staff = Staff.objects.create(staff_id=1, first_name='Mike', last_name='Hillyer', active=True)
+
+    def search(self, term):
+        return [user['first_name'] for user in response_json(self.client.get(self.user_list_url, {'search': term}))['active_users']]
+
+    def indexed_grams(self, user_type, user_id):
+        return set(UserNameGram.objects.filter(user_type=user_type, user_id=user_id).values_list('gram', flat=True))
+
+    def test_grams(self):
+        """
+        Test that names are indexed by their substrings of up to 3 characters, and terms looked up by their trigrams.
+        """
+        self.assertEqual(name_grams('Ab', 'C'), {'a', 'b', 'ab', 'c'})
+        self.assertEqual(term_grams('Ur'), {'ur'})
+        self.assertEqual(term_grams('Hill'), {'hil', 'ill'})
+
+    def test_index_follows_user_changes(self):
+        """
+        Test that creating, renaming and deleting a user updates its grams, while a status update leaves them as they are.
+        """
+        self.assertEqual(self.indexed_grams('staff', 1), name_grams('Mike', 'Hillyer'))
+
+        self.staff.last_name = 'Stephens'
+        self.staff.save()
+        self.assertEqual(self.indexed_grams('staff', 1), name_grams('Mike', 'Stephens'))
+        self.assertEqual(self.search('hill'), [])
+        self.assertEqual(self.search('PHEN'), ['Mike'])
+
+        with self.assertNumQueries(1):
+            self.client.patch(reverse('api_update_status'), {'id': 1, 'type': 'staff', 'active': False}, format='json')
+        self.assertEqual(self.indexed_grams('staff', 1), name_grams('Mike', 'Stephens'))
+
+        self.staff.delete()
+        self.assertEqual(self.indexed_grams('staff', 1), set())
+
+    def test_long_terms_are_checked_against_the_names(self):
+        """
+        Test that a term whose trigrams all appear in the names, but not as one substring of a name, does not match.
+        """
+        # 'ann' comes from the first name, 'nna' and 'nab' from the last name
+        self.assertEqual(self.search('annab'), [])
+        self.assertEqual(self.search('nnab'), ['Ann'])
+        self.assertEqual(self.search('n'), ['Ann'])
+
+    def test_short_terms_are_not_aggregated(self):
+        """
+        Test that a term made of a single gram is looked up per user with EXISTS, without grouping the users having the gram,
+        while a longer term counts the grams of its candidates.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search('a'), ['Ann'])
+        sql = ' '.join(query['sql'] for query in queries.captured_queries).upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('HAVING', sql)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search('hill'), ['Mike'])
+        self.assertIn('HAVING', ' '.join(query['sql'] for query in queries.captured_queries).upper())
+
+    def test_rebuild_name_index(self):
+        """
+        Test that rebuilding the index picks up users saved without the signal handlers (e.g. with bulk_create).
+        """
+        Customer.objects.bulk_create([Customer(customer_id=2, first_name='Mary', last_name='Smith', active=True)])
+        self.assertEqual(self.search('smi'), [])
+        rebuild_name_index()
+        self.assertEqual(self.search('smi'), ['Mary'])
+        self.assertEqual(self.indexed_grams('customer', 1), name_grams('Ann', 'Nnab'))
+
+    def test_migration_backfill(self):
+        """
+        Test that the backfill of the migration creating the index writes the grams of every user, a batch at a time.
+        """
+        migration = importlib.import_module('users.migrations.0003_user_name_search_index')
+        Customer.objects.bulk_create([Customer(customer_id=2, first_name='Mary', last_name='Smith', active=True)])
+        UserNameGram.objects.all().delete()
+        with mock.patch.object(migration, 'BATCH_SIZE', 5), \
+                mock.patch.object(UserNameGram.objects, 'bulk_create', wraps=UserNameGram.objects.bulk_create) as bulk_create:
+            migration.index_existing_names(apps, None)
+        self.assertEqual(self.indexed_grams('customer', 1), name_grams('Ann', 'Nnab'))
+        self.assertEqual(self.indexed_grams('customer', 2), name_grams('Mary', 'Smith'))
+        self.assertEqual(self.indexed_grams('staff', 1), name_grams('Mike', 'Hillyer'))
+        # Every user has more than 5 grams: each one is written as soon as it is read, then the (empty) rest of each table
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [
+            len(name_grams('Ann', 'Nnab')), len(name_grams('Mary', 'Smith')), 0, len(name_grams('Mike', 'Hillyer')), 0,
+        ])
+
+
+class RecordingBroker:
+    """
+    Broker keeping the published events, swapped in by the tests through settings.USER_EVENTS_BROKER.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def publish(self, event):
+        self.events.append(event)
+
+
+@override_settings(USER_EVENTS_BROKER='users.tests.RecordingBroker')
+class StatusEventsTestCase(TestCase):
+    """
+    Test case for the publication of status changes to the open ./user pages.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        Customer.objects.create(customer_id=1, first_name='Red', last_name='Customer', active=True)
+        Staff.objects.create(staff_id=1, first_name='Yellow', last_name='Staff', active=False)
+
+    def test_status_changes_are_published_on_commit(self):
+        """
+        Test that single and bulk status updates publish deltas once committed, and failed updates publish nothing.
+        """
+        broker = events.get_broker()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('api_update_status'), {'id': 1, 'type': 'customer', 'active': False}, format='json')
+            self.assertEqual(broker.events, [])
+        self.assertEqual(broker.events, [[{'id': 1, 'type': 'customer', 'active': False, 'last_update': Customer.objects.get(customer_id=1).last_update}]])
+        self.assertIsNotNone(response.json()['last_update'])
+
+        broker.events.clear()
+        updates = [{'id': 1, 'type': 'customer', 'active': True}, {'id': 1, 'type': 'staff', 'active': True}, {'id': 2, 'type': 'staff', 'active': True}]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('api_bulk_update_status'), updates, format='json')
+        self.assertEqual(len(broker.events), 1)
+        self.assertEqual({(change['type'], change['id'], change['active']) for change in broker.events[0]}, {('customer', 1, True), ('staff', 1, True)})
+
+        broker.events.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('api_update_status'), {'id': 2, 'type': 'staff', 'active': True}, format='json')
+        self.assertEqual(broker.events, [])
+
+    def test_event_stream_view(self):
+        """
+        Test that the events endpoint answers with an uncached Server-Sent Events stream.
+        """
+        response = self.client.get(reverse('api_user_events'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        response.close()
+
+    @override_settings(USER_EVENTS_BROKER='users.events.InProcessBroker', USER_EVENTS_WSGI_STREAM_SECONDS=0.2)
+    def test_wsgi_event_stream_ends(self):
+        """
+        Test that a WSGI event stream ends after USER_EVENTS_WSGI_STREAM_SECONDS, releasing its server thread,
+        after telling the browser when to reconnect.
+        """
+        response = self.client.get(reverse('api_user_events'))
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(chunks, [events.STREAM_START, ': keepalive\n\n'])
+
+
+class InProcessBrokerTestCase(SimpleTestCase):
+    """
+    Test case for the in-process fanout of the status events and the Server-Sent Events streams.
+    """
+
+    def setUp(self):
+        self.broker = events.InProcessBroker()
+
+    def test_fanout_to_every_subscription(self):
+        """
+        Test that an event published from another thread reaches every subscription, and not the closed ones.
+        """
+        first, second, closed = self.broker.subscribe(), self.broker.subscribe(), self.broker.subscribe()
+        closed.close()
+        publisher = threading.Thread(target=self.broker.publish, args=(['change'],))
+        publisher.start()
+        publisher.join()
+        self.assertEqual(first.get(1), ['change'])
+        self.assertEqual(second.get(1), ['change'])
+        self.assertIsNone(closed.get(0.01))
+
+    async def test_async_subscription(self):
+        """
+        Test that an asynchronous subscription receives the events published from a thread (e.g. a synchronous view).
+        """
+        subscription = self.broker.subscribe(asyncio.get_running_loop())
+        await asyncio.to_thread(self.broker.publish, ['change'])
+        self.assertEqual(await subscription.aget(1), ['change'])
+        self.assertIsNone(await subscription.aget(0.01))
+
+    def test_overflow_ends_the_stream(self):
+        """
+        Test that a subscription which cannot keep up is marked as overflowed instead of buffering without bounds.
+        """
+        subscription = self.broker.subscribe()
+        for _ in range(events.MAX_PENDING_EVENTS + 1):
+            self.broker.publish(['change'])
+        self.assertTrue(subscription.overflowed)
+
+    def test_event_stream(self):
+        """
+        Test the Server-Sent Events written for the published changes, and the keepalive comments in between.
+        """
+        with override_settings(USER_EVENTS_BROKER='users.events.InProcessBroker'):
+            stream = events.event_stream(keepalive=0.01)
+            self.assertEqual(next(stream), events.STREAM_START)
+            events.get_broker().publish([{'id': 1, 'type': 'customer', 'active': True}])
+            self.assertEqual(next(stream), 'event: status\ndata: [{"id": 1, "type": "customer", "active": true}]\n\n')
+            self.assertEqual(next(stream), ': keepalive\n\n')
+            stream.close()
+            self.assertEqual(events.get_broker()._subscriptions, set())
+
@@ -1,16 +1,46 @@
 from rest_framework.views import APIView
+from django.conf import settings
 from rest_framework.response import Response
-from .models import Customer, Staff
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Q
+from .status import MAX_BULK_UPDATES, apply_status_updates, parse_last_update, update_status
+from .pagination import MAX_PAGE_SIZE, PAGE_SIZE, encode_cursor, user_page_rows
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from .events import async_event_stream, event_stream
+from assignment_project.routers import analytics_reads
+from .sync import list_etag, users_version
+from django.views.decorators.http import condition
+from itertools import groupby
+from operator import itemgetter
+import json
 
 # Create your views here.
 
+def _request_users_version(request):
+    """
+    Returns the version of the user lists, probed once per request (shared by the ETag check and the view).
+    """
+    if not hasattr(request, '_users_version'):
+        request._users_version = users_version()
+    return request._users_version
+
+
+def _user_list_etag(request):
+    return list_etag(_request_users_version(request), request.GET)
+
+
+@method_decorator(analytics_reads, name='get')  # Reads from the analytics replica (see assignment_project/routers.py)
+@method_decorator(condition(etag_func=_user_list_etag), name='get')
 class UserListView(APIView):
     """
     API view to retrieve a list of active and inactive users.
     Combines data from both 'Customer' and 'Staff' models to produce two categorized lists, active users and inactive users.
+    Both lists are paginated with cursors (see users/pagination.py), so a response never holds more than 'limit' users per list.
+    Responses carry an ETag, and a request whose lists have not changed gets a 304 Not Modified response (see users/sync.py).
+    With an analytics replica configured, the lists are read from it, unless the client has just updated a status (see assignment_project/routers.py).
 
     """
     def get(self, request):
@@ -20,46 +50,92 @@ class UserListView(APIView):
         Queries the 'Customer' and 'Staff' models for active and inactive users to fetch users categorized by their active status.
         Optionally, it filters users based on a search term that matches the first or last name.
 
-        Returns a JSON object with two keys as Response:
-            - 'active users': List of active users, including both customers and staffs, with unified fields ('id', 'type', etc.).
-            - 'inactive users': List of inactive users, formatted similarly to active users.
+        Query parameters:
+            - 'search': Filters users whose first or last name contains the term (case-insensitive).
+            - 'limit': Maximum number of users per list (default 50, at most 500).
+            - 'list': 'active' or 'inactive' to return only that list (used to load the next page of one list).
+            - 'active_cursor' / 'inactive_cursor': Cursor of the next page of each list, as returned by the previous response.
+            - 'since': Watermark returned by a previous response; only the users updated since are returned, in the list they now belong to.
+
+        Returns a JSON object with the following keys, streamed as a StreamingHttpResponse:
+            - 'active_users': List of active users, including both customers and staffs, with unified fields ('id', 'type', etc.).
+            - 'inactive_users': List of inactive users, formatted similarly to active users.
+            - 'active_next_cursor' / 'inactive_next_cursor': Cursor of the next page of each list, or None after the last page.
+            - 'watermark': Latest last update timestamp of the users, to pass as 'since' to get the next changes.
+            Invalid parameters result in a 400 Bad Request response.
 
         """
 
         # Get and clean the 'search' parameter from the GET request (defaults to empty string if not provided)
         search_term = request.GET.get('search', '').strip()
 
-        # Initialize an empty Q object to build a dynamic query filter based on the search term.
-        query_filter = Q()
-
-        # If a search term is provided, filter users by first or last name (case-insensitive)
-        if search_term:
-            query_filter = Q(first_name__icontains=search_term) | Q(last_name__icontains=search_term)
-
-        # Querying the database for active and inactive users (customer and staff) with the search filter, sorting them by the last update timestamp.
-        active_customers = Customer.objects.filter(active=True).filter(query_filter).order_by('-last_update').values('customer_id', 'first_name', 'last_name', 'active','last_update')
-        inactive_customers = Customer.objects.filter(active=False).filter(query_filter).order_by('-last_update').values('customer_id', 'first_name', 'last_name', 'active','last_update')
-        active_staff = Staff.objects.filter(active=True).filter(query_filter).order_by('-last_update').values('staff_id', 'first_name', 'last_name', 'active','last_update')
-        inactive_staff = Staff.objects.filter(active=False).filter(query_filter).order_by('-last_update').values('staff_id', 'first_name', 'last_name', 'active','last_update')
-
-        # Reformat the data for users (active/inactive customers/staff) to unify keys (id, type)
-        for user in active_customers:
-            user['id'] = user.pop('customer_id', None)
-            user['type'] = 'customer'
-        for user in inactive_customers:
-            user['id'] = user.pop('customer_id', None)
-            user['type'] = 'customer'
-        for user in active_staff:
-            user['id'] = user.pop('staff_id', None)
-            user['type'] = 'staff'
-        for user in inactive_staff:
-            user['id'] = user.pop('staff_id', None)
-            user['type'] = 'staff'
-        
-        return Response({
-            'active_users': list(active_customers) + list(active_staff),
-            'inactive_users': list(inactive_customers) + list(inactive_staff),
-        })
+        try:
+            limit = int(request.GET.get('limit', PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'Invalid limit'}, status=400)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return Response({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}, status=400)
+
+        requested_list = request.GET.get('list')
+        if requested_list not in (None, 'active', 'inactive'):
+            return Response({'error': 'Invalid list'}, status=400)
+
+        try:
+            since = parse_last_update(request.GET.get('since'), 'since')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        # The watermark is read before the users, so that changes made in between are part of the next delta
+        watermark = _request_users_version(request).watermark
+
+        # Querying the database for one page of active and/or inactive users (customers first, then staff) matching the search term
+        # through the name search index, sorted by the last update timestamp, in a single UNION ALL query.
+        lists = [
+            (list_name, active, request.GET.get(f'{list_name}_cursor'))
+            for list_name, active in (('active', True), ('inactive', False))
+            if requested_list in (None, list_name)
+        ]
+        try:
+            rows = user_page_rows(lists, search_term, limit, since)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        # The JSON is written out as the rows are read, instead of building and serializing the whole response in memory
+        return StreamingHttpResponse(
+            _stream_user_lists([list_name for list_name, _, _ in lists], rows, limit, watermark), content_type='application/json',
+        )
+
+
+def _stream_user_lists(list_names, rows, limit, watermark):
+    """
+    Yields the JSON response of UserListView chunk by chunk.
+
+    Args:
+        list_names (list): Names of the lists in the response ('active', 'inactive').
+        rows (iterator): Rows returned by user_page_rows(), grouped by list.
+        limit (int): Maximum number of users per list; a further row means the list continues.
+        watermark (datetime): Watermark of the response.
+    """
+    groups = groupby(rows, key=itemgetter('list'))
+    group = next(groups, None)
+    yield '{'
+    for index, list_name in enumerate(list_names):
+        yield f'{", " if index else ""}"{list_name}_users": ['
+        count = 0
+        next_cursor = None
+        # Last user sent in this list, from which the next cursor starts
+        last_user = None
+        if group is not None and group[0] == list_name:
+            for user in group[1]:
+                if count == limit:
+                    next_cursor = encode_cursor(last_user)
+                    break
+                del user['list']
+                yield f'{", " if count else ""}{json.dumps(user, cls=DjangoJSONEncoder)}'
+                last_user = user
+                count += 1
+            group = next(groups, None)
+        yield f'], "{list_name}_next_cursor": {json.dumps(next_cursor)}'
+    yield f', "watermark": {json.dumps(watermark, cls=DjangoJSONEncoder)}}}'
 
 # View to handle updates to user statuses
 @method_decorator(csrf_exempt, name='dispatch')  # For testing purposes
@@ -77,29 +153,92 @@ class UpdateUserStatusView(APIView):
                 - 'id' (int): The user's ID.
                 - 'type' (str): The user's type (customer or staff)
                 - 'active' (bool): The new status (True for active, False for inactive)
+                - 'last_update' (str, optional): The user's last update timestamp as last seen by the client.
+                  The update is then only applied if the user has not been modified since.
         Returns:
-            Response: A JSON response indicating success or error.
+            Response: A JSON response indicating success (with the user's new 'last_update') or error.
+                A user modified since the given 'last_update' results in a 409 Conflict response.
 
         """
         user_id = request.data.get('id')  
         user_type = request.data.get('type')  
         active = request.data.get('active')  
 
+        # Identify the user type
+        if user_type not in ('customer', 'staff'):
+            return Response({'error': 'Invalid user type'}, status=400)
         try:
-            # Identify the user type and retrieving corresponding user record
-            if user_type == 'customer':
-                user = Customer.objects.get(customer_id=user_id)
-            elif user_type == 'staff':
-                user = Staff.objects.get(staff_id=user_id)
-            else:
-                return Response({'error': 'Invalid user type'}, status=400)
-
-            # Update the user's active status field and save the changes to the database.
-            user.active = active  
-            user.save()
-            return Response({'message': f'{user_type} status updated successfully'}, status=200)
-
-        except (Customer.DoesNotExist, Staff.DoesNotExist):
-            return Response({'error': f'{user_type} not found'}, status=404)
+            expected_last_update = parse_last_update(request.data.get('last_update'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        try:
+            # Update the user's active status with a single conditional UPDATE, without reading the user first (see users/status.py).
+            result, last_update = update_status(user_type, user_id, active, expected_last_update)
         except Exception as e:
-            return Response({'error': str(e)}, status=500)
\ No newline at end of file
+            return Response({'error': str(e)}, status=500)
+
+        if result == 'not_found':
+            return Response({'error': f'{user_type} not found'}, status=404)
+        if result == 'conflict':
+            return Response({'error': f'{user_type} was modified by someone else since {request.data.get("last_update")}'}, status=409)
+        return Response({'message': f'{user_type} status updated successfully', 'last_update': last_update}, status=200)
+
+
+@method_decorator(csrf_exempt, name='dispatch')  # For testing purposes
+class BulkUpdateUserStatusView(APIView):
+    """
+    API view to update the 'active' status of many users (customers or staff) at once.
+    The frontend (user_list.html) queues the drag-and-drop moves and sends them in batches to this view.
+
+    """
+    def patch(self, request):
+        """
+        Handles PATCH requests to update the active status of a batch of users, in one transaction (see users/status.py).
+        Args:
+            request(HttpRequest) contains a JSON list of at most 1000 items, each with
+                - 'id' (int): The user's ID.
+                - 'type' (str): The user's type (customer or staff)
+                - 'active' (bool): The new status (True for active, False for inactive)
+                - 'last_update' (str, optional): The user's last update timestamp as last seen by the client.
+        Returns:
+            Response: A JSON response with a 'results' list holding, for each item in order, its 'id', 'type' and
+                'result' ('updated' with the new 'last_update', 'not_found', 'conflict' or 'invalid' with an 'error' message).
+                A body which is not a list, or holds too many items, results in a 400 Bad Request response.
+
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a list of status updates'}, status=400)
+        if len(items) > MAX_BULK_UPDATES:
+            return Response({'error': f'At most {MAX_BULK_UPDATES} status updates per request'}, status=400)
+        return Response({'results': apply_status_updates(items)}, status=200)
+
+
+@require_GET
+def user_status_events(request):
+    """
+    Streams the user status changes as Server-Sent Events, so that the ./user page stays in sync without polling the lists.
+
+    Each 'status' event holds a JSON list of changes ({'id', 'type', 'active', 'last_update'}) made through the status endpoints
+    (see users/events.py). Comment lines are sent while there are no changes to keep the connection open.
+
+    Args:
+        request (HttpRequest): The incoming request.
+
+    Returns:
+        StreamingHttpResponse: A 'text/event-stream' response that lasts until the client disconnects,
+            or at most USER_EVENTS_WSGI_STREAM_SECONDS under a WSGI server (the browser then reconnects).
+    """
+    # Django buffers streams whose kind does not match the server's, so ASGI gets an asynchronous stream and WSGI a blocking one.
+    # A WSGI stream holds a server thread, so it ends after USER_EVENTS_WSGI_STREAM_SECONDS and the browser reconnects.
+    if isinstance(request, ASGIRequest):
+        stream = async_event_stream()
+    else:
+        stream = event_stream(lifetime=settings.USER_EVENTS_WSGI_STREAM_SECONDS)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Disables response buffering in nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
+